@@ -0,0 +1,185 @@
+# backend/admission.py
+"""
+Admission control for chat turns. Each turn fans out into several Gemini calls, so a spike
+is shed at the door instead of turning into upstream 429s and retry storms:
+
+- one turn in flight per session (a second one gets 429);
+- a global token bucket on turn starts (ADMISSION_RATE/s, bursts of ADMISSION_BURST);
+- at most ADMISSION_MAX_TURNS turns in progress; further turns wait in a bounded queue
+  (ADMISSION_QUEUE_MAX) for up to ADMISSION_QUEUE_TIMEOUT_S, or get 503.
+
+Rejections carry Retry-After. Time spent waiting is recorded in its own histogram
+(admission_wait_seconds) and as a `queue` span in Server-Timing.
+"""
+import math
+import time
+import asyncio
+import logging
+from collections import Counter, deque
+from typing import Deque, Dict, Optional, Set
+
+from fastapi import HTTPException
+
+from backend.config import get_settings
+from backend.metrics import record_admission_wait
+from backend.resilience import remaining
+
+settings = get_settings()
+logger = logging.getLogger("admission")
+logger.setLevel(logging.INFO)
+
+
+class TokenBucket:
+    """Refills `rate` tokens per second up to `burst`. Tokens may be reserved ahead (negative balance)."""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def reserve(self, max_wait: float) -> Optional[float]:
+        """Take a token; returns how long to wait for it, or None (nothing taken) if over `max_wait`."""
+        if not self.rate:
+            return 0.0
+        self._refill()
+        wait = max(0.0, (1 - self._tokens) / self.rate)
+        if wait > max_wait:
+            return None
+        self._tokens -= 1
+        return wait
+
+    def retry_after(self) -> float:
+        self._refill()
+        return max(0.0, (1 - self._tokens) / self.rate) if self.rate else 0.0
+
+
+class Ticket:
+    """An admitted turn; release() (idempotent) frees its slot and its session."""
+
+    def __init__(self, controller: "AdmissionController", session_id: str):
+        self._controller = controller
+        self.session_id = session_id
+        self._released = False
+
+    def release(self) -> None:
+        if not self._released:
+            self._released = True
+            self._controller._release(self.session_id)
+
+
+class AdmissionController:
+    """
+    Lives on the API's event loop (not thread-safe). Queued turns are woken in arrival
+    order; a finished turn hands its slot straight to the next waiter, so there are
+    waiters only while all max_turns slots are taken.
+    """
+
+    def __init__(self, max_turns: int = 0, queue_max: int = 0, queue_timeout_s: float = 0,
+                 rate: Optional[float] = None, burst: int = 0):
+        self.max_turns = max_turns or settings.ADMISSION_MAX_TURNS
+        self.queue_max = queue_max or settings.ADMISSION_QUEUE_MAX
+        self.queue_timeout_s = queue_timeout_s or settings.ADMISSION_QUEUE_TIMEOUT_S
+        self.bucket = TokenBucket(settings.ADMISSION_RATE if rate is None else rate, burst or settings.ADMISSION_BURST)
+        self._active = 0
+        self._waiting = 0
+        self._sessions: Set[str] = set()
+        self._waiters: Deque[asyncio.Future] = deque()
+        # --- metrics ---
+        self.counts: Counter = Counter()  # admitted / queued / rejected_<reason>
+        self.peak_active = 0
+        self.peak_waiting = 0
+
+    def _reject(self, reason: str, status: int, detail: str, retry_after: float, start: float) -> HTTPException:
+        self.counts[f"rejected_{reason}"] += 1
+        record_admission_wait("rejected", time.perf_counter() - start)
+        logger.warning(f"[Admission] Rejected turn ({reason}): {self._active} active, {self._waiting} waiting")
+        return HTTPException(status_code=status, detail=detail,
+                             headers={"Retry-After": str(max(1, math.ceil(retry_after)))})
+
+    async def enter(self, session_id: str) -> Ticket:
+        """Admit a turn of `session_id`, waiting if needed; raises HTTPException 429/503 when shedding it."""
+        start = time.perf_counter()
+        if session_id in self._sessions:
+            raise self._reject("session_busy", 429, "A turn is already in progress for this session", 1, start)
+        if self._waiting >= self.queue_max:
+            raise self._reject("queue_full", 503, "Server busy, please retry", self.queue_timeout_s, start)
+        left = remaining()
+        budget = self.queue_timeout_s if left is None else max(0.0, min(self.queue_timeout_s, left))
+        wait = self.bucket.reserve(budget)
+        if wait is None:
+            raise self._reject("rate_limited", 429, "Too many requests, please retry", self.bucket.retry_after(), start)
+
+        # The session counts as busy while queued, so a retried upload is refused rather than queued twice
+        self._sessions.add(session_id)
+        self._waiting += 1
+        self.peak_waiting = max(self.peak_waiting, self._waiting)
+        try:
+            if wait:
+                await asyncio.sleep(wait)
+            if self._active < self.max_turns:
+                self._active += 1
+            else:
+                self.counts["queued"] += 1
+                await self._wait_for_slot(max(0.0, budget - (time.perf_counter() - start)), start)
+        except BaseException:
+            self._sessions.discard(session_id)
+            raise
+        finally:
+            self._waiting -= 1
+        self.peak_active = max(self.peak_active, self._active)
+        self.counts["admitted"] += 1
+        record_admission_wait("admitted", time.perf_counter() - start)
+        return Ticket(self, session_id)
+
+    async def _wait_for_slot(self, timeout: float, start: float) -> None:
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(waiter, timeout)
+        except BaseException as e:
+            if waiter.done() and not waiter.cancelled():
+                self._release_slot()  # handed a slot just as the request gave up
+            elif waiter in self._waiters:
+                self._waiters.remove(waiter)
+            if isinstance(e, asyncio.TimeoutError):
+                raise self._reject("queue_timeout", 503, "Server busy, please retry", self.queue_timeout_s, start)
+            raise
+
+    def _release_slot(self) -> None:
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)  # the slot passes on; _active is unchanged
+                return
+        self._active -= 1
+
+    def _release(self, session_id: str) -> None:
+        self._sessions.discard(session_id)
+        self._release_slot()
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "max_turns": self.max_turns,
+            "active": self._active,
+            "waiting": self._waiting,
+            "peak_active": self.peak_active,
+            "peak_waiting": self.peak_waiting,
+            **self.counts,
+        }
+
+
+_admission: Optional[AdmissionController] = None
+
+
+def get_admission() -> AdmissionController:
+    """Process-wide admission controller for chat turns."""
+    global _admission
+    if _admission is None:
+        _admission = AdmissionController()
+    return _admission
@@ -0,0 +1,33 @@
+# backend/arabic.py
+
+import re
+from typing import List
+
+# Harakat, superscript alef and tatweel
+_DIACRITICS = re.compile(r"[\u064B-\u0652\u0670\u0640]+")
+# Letter variants that spelling (and STT output) uses interchangeably. str.replace per
+# variant is much faster than a translate() table for non-ASCII text.
+_LETTER_FOLDS = (
+    ("أ", "ا"), ("إ", "ا"), ("آ", "ا"), ("ٱ", "ا"),
+    ("ى", "ي"), ("ئ", "ي"), ("ؤ", "و"),
+    ("ة", "ه"),
+    ("گ", "ك"), ("ڤ", "ف"), ("چ", "ج"),
+)
+_PUNCTUATION = re.compile(r"[^\w\s]|_")
+
+
+def normalize(text: str) -> str:
+    """
+    Canonical form of Arabic text for matching and caching: diacritics and tatweel removed,
+    alef/yaa/taa-marbuta variants folded, punctuation dropped, whitespace collapsed, Latin lowercased.
+    """
+    text = _DIACRITICS.sub("", text)
+    for variant, base in _LETTER_FOLDS:
+        if variant in text:
+            text = text.replace(variant, base)
+    text = _PUNCTUATION.sub(" ", text.lower())
+    return " ".join(text.split())
+
+
+def tokens(text: str) -> List[str]:
+    return normalize(text).split()
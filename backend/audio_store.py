@@ -0,0 +1,333 @@
+# backend/audio_store.py
+"""
+Sharded on-disk store for archived user audio and bot replies, plus a small in-memory
+cache of recently generated replies for serving.
+
+Files live at <DATA_DIR>/<kind>/<aa>/<bb>/<name>.<ext>, where aa/bb come from a hash of
+the name, so no directory grows past a few hundred entries. With AUDIO_CODEC=flac or
+opus (needs the optional `soundfile` package) files are encoded as they are written;
+writes block, so callers run them off the event loop.
+
+Move files from the old flat layout (and optionally compress them) with:
+
+    python -m backend.audio_store --kind all [--dry-run]
+"""
+import io
+import os
+import re
+import sys
+import hashlib
+import logging
+import argparse
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+try:
+    import soundfile
+except (ImportError, OSError):  # package or libsndfile missing
+    soundfile = None
+
+from backend.config import get_settings
+from backend.tts_cache import materialize
+
+settings = get_settings()
+logger = logging.getLogger("audio_store")
+logger.setLevel(logging.INFO)
+
+KINDS = ("user_inputs", "bot_outputs")
+# codec -> (extension, media type, soundfile format, soundfile subtype)
+CODECS = {
+    "wav": (".wav", "audio/wav", None, None),
+    "flac": (".flac", "audio/flac", "FLAC", "PCM_16"),
+    "opus": (".ogg", "audio/ogg", "OGG", "OPUS"),
+}
+MEDIA_TYPES = {ext: media for ext, media, _, _ in CODECS.values()}
+OPUS_RATES = (8000, 12000, 16000, 24000, 48000)
+
+# Names are built from a session UUID and a timestamp; anything else is refused
+_SAFE_NAME = re.compile(r"^[A-Za-z0-9_-]{1,128}$")
+
+
+def is_safe_name(name: str) -> bool:
+    return bool(_SAFE_NAME.match(name))
+
+
+def shard_of(name: str) -> Tuple[str, str]:
+    digest = hashlib.blake2b(name.encode("utf-8"), digest_size=2).hexdigest()
+    return digest[:2], digest[2:]
+
+
+def encode_wav(wav: bytes, codec: str) -> Tuple[bytes, str]:
+    """Encode a PCM WAV with `codec`. Returns (data, extension), falling back to FLAC when Opus can't take the rate."""
+    _, _, fmt, subtype = CODECS[codec]
+    data, rate = soundfile.read(io.BytesIO(wav), dtype="int16")
+    if codec == "opus" and rate not in OPUS_RATES:
+        codec, (_, _, fmt, subtype) = "flac", CODECS["flac"]
+    out = io.BytesIO()
+    soundfile.write(out, data, rate, format=fmt, subtype=subtype)
+    return out.getvalue(), CODECS[codec][0]
+
+
+def _write_atomic(path: str, data) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+class AudioStore:
+    """
+    Sharded audio archive. write()/write_file() return the path actually written: its
+    extension is the codec used, which differs from the store codec when Opus can't take
+    the sample rate (FLAC) or encoding fails (WAV). locate() finds a file whatever codec it
+    was stored with, including the legacy flat layout.
+    """
+
+    def __init__(self, root: str = "", codec: str = ""):
+        self.root = root or settings.DATA_DIR
+        codec = codec or settings.AUDIO_CODEC
+        if codec not in CODECS:
+            raise ValueError(f"Unknown audio codec {codec!r}; expected one of {sorted(CODECS)}")
+        if codec != "wav" and soundfile is None:
+            logger.warning(f"[AudioStore] AUDIO_CODEC={codec} needs the 'soundfile' package; storing WAV")
+            codec = "wav"
+        self.codec = codec
+        self._lock = threading.Lock()
+        self.stats_counters = {"written": 0, "encoded": 0, "encode_failed": 0, "bytes_in": 0, "bytes_out": 0}
+
+    def path_for(self, kind: str, name: str) -> str:
+        aa, bb = shard_of(name)
+        return os.path.join(self.root, kind, aa, bb, name + CODECS[self.codec][0])
+
+    def locate(self, kind: str, name: str) -> Optional[str]:
+        """Stored file for `name`, whichever codec and layout it was written with."""
+        aa, bb = shard_of(name)
+        base = os.path.join(self.root, kind, aa, bb, name)
+        for ext in MEDIA_TYPES:
+            if os.path.isfile(base + ext):
+                return base + ext
+        legacy = os.path.join(self.root, kind, name + ".wav")
+        return legacy if os.path.isfile(legacy) else None
+
+    def write(self, kind: str, name: str, wav) -> str:
+        """Store a WAV (bytes or memoryview) as `name`; returns the path written."""
+        base = os.path.splitext(self.path_for(kind, name))[0]
+        if self.codec == "wav":
+            _write_atomic(base + ".wav", wav)
+            self._count(len(wav), len(wav))
+            return base + ".wav"
+        try:
+            data, ext = encode_wav(bytes(wav), self.codec)
+        except Exception as e:
+            # Keep the audio even if it can't be compressed
+            logger.error(f"[AudioStore] Encoding {base} as {self.codec} failed, keeping WAV: {e}")
+            _write_atomic(base + ".wav", wav)
+            self._count(len(wav), len(wav), failed=True)
+            return base + ".wav"
+        _write_atomic(base + ext, data)
+        self._count(len(wav), len(data), encoded=True)
+        return base + ext
+
+    def write_file(self, kind: str, name: str, src_path: str) -> str:
+        """Store the WAV file at `src_path` (e.g. a TTS cache entry) as `name`; returns the path written."""
+        if self.codec == "wav":
+            path = self.path_for(kind, name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            materialize(src_path, path)
+            size = os.path.getsize(path)
+            self._count(size, size)
+            return path
+        with open(src_path, "rb") as f:
+            return self.write(kind, name, f.read())
+
+    def _count(self, bytes_in: int, bytes_out: int, encoded: bool = False, failed: bool = False) -> None:
+        with self._lock:
+            self.stats_counters["written"] += 1
+            self.stats_counters["encoded"] += int(encoded)
+            self.stats_counters["encode_failed"] += int(failed)
+            self.stats_counters["bytes_in"] += bytes_in
+            self.stats_counters["bytes_out"] += bytes_out
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            counters = dict(self.stats_counters)
+        counters["codec"] = self.codec
+        counters["compression_ratio"] = counters["bytes_out"] / counters["bytes_in"] if counters["bytes_in"] else 1.0
+        return counters
+
+    # --- Migration from the flat layout ---
+    def migrate_legacy(self, kind: str, dry_run: bool = False) -> List[Tuple[str, str]]:
+        """
+        Move <root>/<kind>/*.wav into the sharded layout, encoding with the store codec.
+        Runs synchronously. Returns (old_path, new_path) pairs.
+        """
+        moved = []
+        flat_dir = os.path.join(self.root, kind)
+        if not os.path.isdir(flat_dir):
+            return moved
+        for entry in sorted(os.scandir(flat_dir), key=lambda e: e.name):
+            if not entry.is_file() or not entry.name.endswith(".wav"):
+                continue
+            name = entry.name[:-len(".wav")]
+            new_path = self.path_for(kind, name)
+            if dry_run:
+                moved.append((entry.path, new_path))
+                continue
+            if self.codec == "wav":
+                os.makedirs(os.path.dirname(new_path), exist_ok=True)
+                os.replace(entry.path, new_path)
+            else:
+                with open(entry.path, "rb") as f:
+                    wav = f.read()
+                try:
+                    data, ext = encode_wav(wav, self.codec)
+                except Exception as e:
+                    logger.warning(f"[AudioStore] {entry.name} not encodable ({e}); moving as WAV")
+                    data, ext = wav, ".wav"
+                new_path = os.path.splitext(new_path)[0] + ext
+                _write_atomic(new_path, data)
+                self._count(len(wav), len(data), encoded=ext != ".wav")
+                os.remove(entry.path)
+            moved.append((entry.path, new_path))
+        return moved
+
+
+# --- Hot cache of recent replies ---
+class HotAudioCache:
+    """LRU of recently generated reply audio, bounded by total bytes; most replies are fetched right after the turn."""
+
+    def __init__(self, max_bytes: int = 0):
+        self.max_bytes = max_bytes or settings.AUDIO_HOT_CACHE_MB * 1024 * 1024
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, Tuple[bytes, str]]" = OrderedDict()  # name -> (data, etag)
+        self._total = 0
+        self.hits = 0
+        self.misses = 0
+
+    def put(self, name: str, data: bytes) -> None:
+        if len(data) > self.max_bytes:
+            return
+        etag = audio_etag(name)
+        with self._lock:
+            old = self._entries.pop(name, None)
+            if old is not None:
+                self._total -= len(old[0])
+            self._entries[name] = (data, etag)
+            self._total += len(data)
+            while self._total > self.max_bytes:
+                _, (evicted, _) = self._entries.popitem(last=False)
+                self._total -= len(evicted)
+
+    def get(self, name: str) -> Optional[Tuple[bytes, str]]:
+        with self._lock:
+            entry = self._entries.get(name)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(name)
+            self.hits += 1
+            return entry
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._total,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+# --- Serving helpers ---
+def audio_etag(name: str) -> str:
+    """
+    ETag of a stored reply, the same whether it is served from the hot cache (WAV) or from
+    disk (possibly compressed): a reply never changes once written. Weak, because the two
+    copies are the same audio but not the same bytes, so it never validates a byte range.
+    """
+    return 'W/"%s"' % hashlib.blake2b(name.encode("utf-8"), digest_size=12).hexdigest()
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Weak comparison, as If-None-Match calls for."""
+    if not if_none_match:
+        return False
+    tags = [t.strip().removeprefix("W/") for t in if_none_match.split(",")]
+    return "*" in tags or etag.removeprefix("W/") in tags
+
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """
+    Single byte range from a Range header as inclusive (start, end). None means serve the
+    whole body (no header, or a form we don't support); raises ValueError if unsatisfiable.
+    """
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    first, _, last = header[len("bytes="):].strip().partition("-")
+    if not (first.isdigit() or first == "") or not (last.isdigit() or last == "") or first == last == "":
+        return None
+    if first == "":
+        length = int(last)
+        if length == 0:
+            raise ValueError("empty suffix range")
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if last and int(last) < start:
+        return None
+    if start >= size:
+        raise ValueError("range not satisfiable")
+    return start, end
+
+
+_store: Optional[AudioStore] = None
+_hot: Optional[HotAudioCache] = None
+
+
+def get_audio_store() -> AudioStore:
+    """Process-wide audio store."""
+    global _store
+    if _store is None:
+        _store = AudioStore()
+    return _store
+
+
+def get_hot_audio_cache() -> HotAudioCache:
+    """Process-wide cache of recently generated reply audio."""
+    global _hot
+    if _hot is None:
+        _hot = HotAudioCache()
+    return _hot
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--kind", choices=KINDS + ("all",), default="all")
+    parser.add_argument("--codec", choices=sorted(CODECS), default=None, help="defaults to AUDIO_CODEC")
+    parser.add_argument("--dry-run", action="store_true", help="list the moves without touching files")
+    args = parser.parse_args()
+
+    from backend.db import update_audio_paths
+
+    store = AudioStore(codec=args.codec or "")
+    kinds = KINDS if args.kind == "all" else (args.kind,)
+    for kind in kinds:
+        moved = store.migrate_legacy(kind, dry_run=args.dry_run)
+        for old, new in moved:
+            print(f"{old} -> {new}")
+        if moved and not args.dry_run:
+            updated = update_audio_paths(moved)
+            print(f"{kind}: moved {len(moved)} files, updated {updated} session rows")
+        else:
+            print(f"{kind}: {len(moved)} files {'to move' if args.dry_run else 'moved'}")
+    if not args.dry_run:
+        print(f"Store stats: {store.stats()}")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, stream=sys.stderr)
+    main()
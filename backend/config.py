@@ -3,7 +3,7 @@
 from functools import lru_cache
 from pydantic_settings import BaseSettings, SettingsConfigDict
 from pydantic import Field, HttpUrl
-from typing import List
+from typing import List, Literal
 
 
 class Settings(BaseSettings):
@@ -15,6 +15,169 @@ class Settings(BaseSettings):
     DEBUG: bool = Field(False, description="Enable debug logging and verbose error reporting")
     LOG_LEVEL: str = Field("INFO", description="Python logging level")
 
+    # --- Gemini HTTP client ---
+    GEMINI_BASE_URL: str = Field(
+        "", description="Override the Gemini API host, e.g. the benchmark mock server (default: Google's)"
+    )
+    GEMINI_TIMEOUT_S: float = Field(60.0, description="Read timeout for a single Gemini REST call")
+    GEMINI_CONNECT_TIMEOUT_S: float = Field(10.0, description="Connect timeout for the Gemini REST pool")
+    GEMINI_MAX_CONNECTIONS: int = Field(20, description="Max pooled HTTP/2 connections to Gemini per worker")
+    GEMINI_KEEPALIVE_S: float = Field(120.0, description="Idle keep-alive expiry for pooled Gemini connections")
+
+    # --- Resilience (all Gemini calls: text, STT, TTS) ---
+    TURN_DEADLINE_S: float = Field(
+        30.0, description="End-to-end budget of one chat turn; Gemini calls are cut short and not retried past it "
+                          "(0: no deadline)"
+    )
+    GEMINI_RETRY_ATTEMPTS: int = Field(3, description="Attempts per call on timeouts, transport errors and 408/429/5xx")
+    GEMINI_BACKOFF_BASE_S: float = Field(
+        0.5, description="Retry delay ceiling after the first failure; doubles per attempt (full jitter)"
+    )
+    GEMINI_BACKOFF_MAX_S: float = Field(8.0, description="Upper bound on the retry delay ceiling")
+    CIRCUIT_FAILURES: int = Field(
+        5, description="Consecutive retryable failures of a model before its calls fail fast to the fallbacks"
+    )
+    CIRCUIT_RESET_S: float = Field(30.0, description="An open circuit lets a trial call through after this")
+    GEMINI_HEDGE_AFTER_S: float = Field(
+        0.0, description="Send a second copy of a classification call still unanswered after this (0: no hedging)"
+    )
+    GEMINI_HEDGE_STAGES: List[str] = Field(
+        ["emotion", "crisis", "classification"], description="Pipeline stages whose short LLM calls may be hedged"
+    )
+
+    # --- Admission control (/chat/, /chat/stream/; per API worker) ---
+    ADMISSION_MAX_TURNS: int = Field(32, description="Turns processed at once; further turns wait in the queue")
+    ADMISSION_QUEUE_MAX: int = Field(64, description="Turns allowed to wait; beyond this new turns get 503")
+    ADMISSION_QUEUE_TIMEOUT_S: float = Field(10.0, description="A turn not admitted within this gets 503")
+    ADMISSION_RATE: float = Field(10.0, description="Turns started per second (token bucket; 0: no rate limit)")
+    ADMISSION_BURST: int = Field(20, description="Turns that may start at once after an idle spell")
+    GEMINI_MAX_CONCURRENCY: int = Field(
+        16, description="In-flight calls per Gemini model; extra calls wait within the turn deadline (0: no cap)"
+    )
+    GEMINI_SDK_THREADS: int = Field(
+        48, description="Threads for blocking STT/TTS calls, including their waits for a call slot (kept apart "
+                        "from the default thread pool)"
+    )
+
+    # --- Idempotent chat turns ---
+    IDEMPOTENCY_TTL_S: float = Field(
+        300.0, description="Completed /chat/ turns are replayed to duplicates (same Idempotency-Key, or same "
+                           "session and audio) for this long"
+    )
+    IDEMPOTENCY_CACHE_MB: int = Field(
+        32, description="Memory for completed turns kept for replay (inline reply audio included)"
+    )
+
+    # --- Turn classification ---
+    CLASSIFIER_MODE: Literal["split", "combined"] = Field(
+        "split",
+        description="'split': separate emotion and crisis calls; 'combined': one JSON call returning both"
+    )
+
+    # --- Crisis pre-screen ---
+    CRISIS_LEXICON: bool = Field(
+        True, description="Match transcripts against the local crisis lexicon; a hit skips straight to the crisis reply"
+    )
+
+    # --- Classification memo cache ---
+    CLASSIFY_CACHE_SIZE: int = Field(4096, description="Memoized emotion/crisis results kept (LRU)")
+    CLASSIFY_CACHE_TTL_S: float = Field(3600.0, description="Memoized classification results expire after this")
+    CLASSIFY_CACHE_STAGES: List[str] = Field(
+        ["emotion", "crisis"],
+        description="Stages whose results may be memoized; drop 'crisis' to always ask the model about crisis"
+    )
+
+    # --- Emotion classification ---
+    EMOTION_BACKEND: Literal["llm", "local", "tiered"] = Field(
+        "llm",
+        description="'llm': Gemini labels every turn; 'local': offline-trained model only; "
+                    "'tiered': local model when confident, Gemini otherwise (in either classifier mode)"
+    )
+    EMOTION_LOCAL_MIN_CONFIDENCE: float = Field(0.9, description="Tiered mode: serve local labels at or above this")
+    EMOTION_MODEL_PATH: str = Field("", description="Trained local model (default DATA_DIR/emotion_model.json)")
+
+    # --- Audio uploads ---
+    MAX_AUDIO_MB: int = Field(5, description="Largest accepted voice upload")
+    UPLOAD_BUFFERS: int = Field(
+        16, description="Pooled upload buffers (MAX_AUDIO_MB each); caps upload memory under concurrent load"
+    )
+    UPLOAD_WAIT_S: float = Field(5.0, description="How long an upload may wait for a free buffer before a 503")
+
+    # --- Audio archive ---
+    AUDIO_CODEC: str = Field(
+        "wav", description="Archive codec for stored audio: 'wav', 'flac' (lossless) or 'opus' (needs soundfile)"
+    )
+    AUDIO_HOT_CACHE_MB: int = Field(32, description="Memory for recently generated replies served without disk reads")
+
+    # --- Speech-to-text ---
+    STT_INLINE_MAX_MB: float = Field(
+        14.0, description="Audio up to this size is sent inline to STT (base64 must stay under the 20 MB request cap)"
+    )
+
+    AUDIO_PREPROCESS: bool = Field(
+        True, description="Downmix/resample to 16 kHz mono and trim silence before STT; reject silent clips"
+    )
+
+    # --- TTS cache ---
+    TTS_CACHE_MAX_MB: int = Field(200, description="Disk budget for cached TTS audio under DATA_DIR/tts_cache")
+    TTS_CACHE_PREWARM: bool = Field(True, description="Synthesize fixed replies into the TTS cache at startup")
+
+    # --- Session history cache ---
+    HISTORY_CACHE_TURNS: int = Field(50, description="Recent turns kept in memory per session")
+    HISTORY_CACHE_TTL_S: float = Field(1800.0, description="Drop cached history of sessions idle this long")
+    HISTORY_CACHE_MAX_MB: int = Field(64, description="Global memory cap for cached session history")
+
+    # --- Write-behind conversation logger ---
+    LOG_QUEUE_MAX: int = Field(1000, description="Queued turns before /chat/ waits on the DB writer (backpressure)")
+    LOG_BATCH_SIZE: int = Field(100, description="Max turns written per executemany transaction")
+    LOG_FLUSH_INTERVAL_S: float = Field(0.25, description="Max time a queued turn waits for its batch to fill")
+
+    # --- Insight evolution ---
+    EVOLUTION_DEBOUNCE_S: float = Field(
+        30.0, description="Session ends for the same user within this window are coalesced into one evolution run"
+    )
+    EVOLUTION_MAX_TURNS: int = Field(
+        100, description="New turns sent per evolution call; a longer backlog is worked off in further calls"
+    )
+    EVOLUTION_CAS_ATTEMPTS: int = Field(
+        3, description="Re-runs of an evolution call whose insights were updated concurrently"
+    )
+
+    # --- Background jobs (python -m backend.worker) ---
+    JOB_WORKERS: int = Field(4, description="Jobs a worker process runs concurrently")
+    JOB_INPROCESS_WORKERS: int = Field(
+        0, description="Job workers run inside the API process itself (0: leave jobs to backend.worker)"
+    )
+    JOB_LEASE_S: float = Field(
+        120.0, description="A claimed job returns to the queue if its worker has not heartbeated for this long"
+    )
+    JOB_TIMEOUT_S: float = Field(300.0, description="A single job attempt is cancelled and retried after this")
+    JOB_MAX_ATTEMPTS: int = Field(5, description="Attempts before a failing job is moved to the dead-letter state")
+    JOB_BACKOFF_BASE_S: float = Field(5.0, description="Retry delay after the first failure; doubles per attempt")
+    JOB_BACKOFF_MAX_S: float = Field(600.0, description="Upper bound on the retry delay")
+    JOB_POLL_INTERVAL_S: float = Field(1.0, description="Idle workers check for new jobs this often")
+    JOB_RETAIN_DONE_S: float = Field(7 * 86400.0, description="Finished jobs are kept this long for inspection")
+
+    # --- Observability ---
+    METRICS_ENABLED: bool = Field(True, description="Record per-stage latency histograms (served on /metrics)")
+    SERVER_TIMING: bool = Field(True, description="Send each request's stage timings in a Server-Timing header")
+
+    # --- Prompt context budgets (estimated tokens of history per prompt) ---
+    CONTEXT_TOKENS_GENERATE: int = Field(1500, description="History budget for reply generation")
+    CONTEXT_TOKENS_EVALUATE: int = Field(600, description="History budget for the evaluator rewrite")
+    CONTEXT_TOKENS_CLASSIFY: int = Field(300, description="History budget for emotion/crisis classification")
+    CONTEXT_CHARS_PER_TOKEN: float = Field(3.0, description="Characters per token used to estimate prompt size")
+
+    # --- Evaluator (rewrite) pass ---
+    REFINE_POLICY: Literal["always", "never", "heuristic", "deadline"] = Field(
+        "always",
+        description="Evaluator pass policy: 'always', 'never', 'heuristic' (skip drafts that already look "
+                    "short and dialectal) or 'deadline' (use the rewrite only if it arrives in time)"
+    )
+    REFINE_DEADLINE_S: float = Field(2.0, description="Time budget for the evaluator call in 'deadline' mode")
+    REFINE_SKIP_MAX_CHARS: int = Field(280, description="Heuristic mode: longer drafts are always refined")
+    REFINE_MIN_ARABIC_RATIO: float = Field(0.9, description="Heuristic mode: refine drafts with less Arabic script")
+
     model_config = SettingsConfigDict(
         env_file=".env",
         env_file_encoding="utf-8"
@@ -0,0 +1,183 @@
+# backend/context.py
+
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+from backend.config import get_settings
+from backend.llm_client import get_llm_client
+
+settings = get_settings()
+logger = logging.getLogger("context")
+logger.setLevel(logging.INFO)
+
+Turn = Tuple[str, str]  # (transcript, bot_response)
+
+SUMMARY_MAX_TOKENS = 160
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap local token estimate (no remote countTokens call on the hot path)."""
+    return int(len(text) / settings.CONTEXT_CHARS_PER_TOKEN) + 1
+
+
+def render_turn(turn: Turn) -> str:
+    return f"مستخدم: {turn[0]}\nمعالج: {turn[1]}"
+
+
+def stage_budget(stage: str) -> int:
+    return {
+        "classify": settings.CONTEXT_TOKENS_CLASSIFY,
+        "generate": settings.CONTEXT_TOKENS_GENERATE,
+        "evaluate": settings.CONTEXT_TOKENS_EVALUATE,
+    }[stage]
+
+
+def summary_prompt(previous_summary: str, turns_txt: str) -> str:
+    return (
+        f"ملخص سابق لمحادثة بين مستخدم عماني ومعالج افتراضي:\n{previous_summary or '(لا يوجد)'}\n\n"
+        f"أجزاء إضافية أقدم من المحادثة:\n{turns_txt}\n\n"
+        f"اكتب ملخصاً محدثاً وموجزاً جداً (3 جمل كحد أقصى) يحفظ المواضيع والمشاعر والتفاصيل المهمة."
+    )
+
+
+class SessionContext(Sequence):
+    """
+    One turn's view of a session's history. Behaves like the plain (transcript, reply) list
+    it replaces, and renders a token-budgeted history block per prompt stage, once each.
+    """
+
+    def __init__(self, turns: List[Turn], rendered: List[Tuple[str, int]], summary: str = ""):
+        self._turns = turns
+        self._rendered = rendered
+        self.summary = summary
+        self._windows: Dict[int, str] = {}
+
+    def __len__(self) -> int:
+        return len(self._turns)
+
+    def __getitem__(self, index):
+        return self._turns[index]
+
+    def __iter__(self) -> Iterator[Turn]:
+        return iter(self._turns)
+
+    def fitting(self, budget: int) -> int:
+        """How many of the most recent turns fit in `budget` tokens."""
+        used, count = 0, 0
+        for _, tokens in reversed(self._rendered):
+            if used + tokens > budget:
+                break
+            used += tokens
+            count += 1
+        return count
+
+    def render(self, stage: str) -> str:
+        """
+        Most recent turns within the stage's budget. The rolling summary covers the turns older
+        than the generate window, so only windows at least that large are prefixed with it: a
+        smaller (classify, evaluate) window would skip the turns in between.
+        """
+        budget = stage_budget(stage)
+        if budget in self._windows:
+            return self._windows[budget]
+        count = self.fitting(budget)
+        if count < len(self._rendered) and self.summary and budget >= stage_budget("generate"):
+            # Older turns are represented by the rolling summary, which uses part of the budget
+            prefix = f"ملخص ما سبق: {self.summary}"
+            count = self.fitting(max(budget - estimate_tokens(prefix), 0))
+            lines = [prefix]
+        else:
+            lines = []
+        lines.extend(text for text, _ in self._rendered[len(self._rendered) - count:])
+        window = "\n".join(lines)
+        self._windows[budget] = window
+        return window
+
+
+class _SessionState:
+    __slots__ = ("rendered", "summary", "summarized", "summarizing")
+
+    def __init__(self):
+        self.rendered: "OrderedDict[Turn, Tuple[str, int]]" = OrderedDict()
+        self.summary = ""
+        self.summarized: set = set()
+        self.summarizing: Optional[asyncio.Task] = None
+
+
+class ContextBuilder:
+    """
+    Per-session cache of rendered turns. Each turn is rendered and measured once, then
+    reused by every later turn and every prompt stage. When the history no longer fits the
+    generator budget, the overflowing older turns are folded into a rolling summary by a
+    background LLM call, so the summary never sits on a turn's critical path.
+    """
+
+    def __init__(self, max_sessions: int = 1000):
+        self.max_sessions = max_sessions
+        self._sessions: "OrderedDict[str, _SessionState]" = OrderedDict()
+
+    def build(self, session_id: str, turns: List[Turn]) -> SessionContext:
+        state = self._sessions.get(session_id)
+        if state is None:
+            state = self._sessions[session_id] = _SessionState()
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+        self._sessions.move_to_end(session_id)
+
+        turns = [tuple(t) for t in turns]
+        rendered = []
+        for turn in turns:
+            cached = state.rendered.get(turn)
+            if cached is None:
+                text = render_turn(turn)
+                cached = state.rendered[turn] = (text, estimate_tokens(text))
+            rendered.append(cached)
+        # Forget turns that slid out of the history window
+        current = set(turns)
+        for turn in [t for t in state.rendered if t not in current]:
+            del state.rendered[turn]
+        state.summarized.intersection_update(current)
+
+        context = SessionContext(turns, rendered, state.summary)
+        overflow = turns[:len(turns) - context.fitting(stage_budget("generate"))]
+        pending = [t for t in overflow if t not in state.summarized]
+        if pending and (state.summarizing is None or state.summarizing.done()):
+            self._schedule_summary(session_id, state, pending)
+        return context
+
+    def _schedule_summary(self, session_id: str, state: _SessionState, turns: List[Turn]) -> None:
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return  # sync callers (scripts/tests) just get the budgeted window
+        state.summarizing = loop.create_task(self._summarize(session_id, state, turns))
+
+    async def _summarize(self, session_id: str, state: _SessionState, turns: List[Turn]) -> None:
+        prompt = summary_prompt(state.summary, "\n".join(render_turn(t) for t in turns))
+        summary = await get_llm_client().generate(prompt, max_tokens=SUMMARY_MAX_TOKENS, temperature=0.2)
+        if not summary:
+            logger.warning(f"[Context] Summary failed for session {session_id}; will retry next turn")
+            return
+        state.summary = summary
+        state.summarized.update(turns)
+        logger.info(f"[Context] Rolled {len(turns)} older turns into summary for session {session_id}")
+
+
+def history_text(history: Sequence[Turn], stage: str) -> str:
+    """History block for a prompt: budgeted when given a SessionContext, verbatim for a plain list."""
+    if isinstance(history, SessionContext):
+        return history.render(stage)
+    return "\n".join(render_turn(h) for h in history)
+
+
+_builder: Optional[ContextBuilder] = None
+
+
+def get_context_builder() -> ContextBuilder:
+    """Process-wide context builder."""
+    global _builder
+    if _builder is None:
+        _builder = ContextBuilder()
+    return _builder
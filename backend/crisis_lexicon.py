@@ -0,0 +1,162 @@
+# backend/crisis_lexicon.py
+"""
+Local crisis pre-screen: an Aho-Corasick automaton over normalized (diacritic-stripped,
+letter-folded) transcripts, compiled once from a curated phrase list. A match means the
+turn goes straight to the crisis reply; the LLM crisis check still covers everything the
+lexicon misses. Phrases are anchored at a word start (optionally after a و/ف/ال clitic),
+so 'انتحر' also matches 'وانتحرت' but not a word that merely contains it.
+
+Keep the list high-precision: every match skips the therapist reply. Regression phrases
+live in tests/test_crisis_lexicon.py; `python -m benchmarks.bench_crisis_lexicon` times it.
+"""
+import re
+import time
+import logging
+import threading
+from collections import Counter, deque
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from backend.config import get_settings
+from backend.arabic import normalize
+
+settings = get_settings()
+logger = logging.getLogger("crisis_lexicon")
+logger.setLevel(logging.INFO)
+
+CRISIS_PHRASES = (
+    # Suicide
+    "انتحر", "انتحار", "بنتحر",
+    "اقتل نفسي", "بقتل نفسي", "قتلت نفسي",
+    "انهي حياتي", "بنهي حياتي", "انهاء حياتي", "اخلص من حياتي", "اخلص على نفسي",
+    "ما ابا اعيش", "مابا اعيش", "ما ابغى اعيش", "ما ابغا اعيش", "ما ابي اعيش", "ما اريد اعيش",
+    "ما عاد ابا اعيش", "ما ودي اعيش",
+    "ابا اموت", "ابغى اموت", "ابغا اموت", "ابي اموت", "اريد اموت", "ودي اموت", "اتمنى اموت",
+    "اتمنى الموت", "الموت ارحم", "الموت احسن لي", "احسن لي اموت",
+    "اشنق نفسي", "ارمي نفسي من", "اشرب سم", "بشرب سم",
+    # Self-harm
+    "اذي نفسي", "اوذي نفسي", "بأذي نفسي", "ايذاء نفسي", "اذيت نفسي",
+    "اجرح نفسي", "بجرح نفسي", "جرحت نفسي", "اقطع عروقي", "قطعت عروقي",
+    # English / code-switched
+    "suicide", "suicidal", "kill myself", "end my life", "want to die", "self harm", "hurt myself",
+)
+CLITICS = ("", "و", "ف", "ال", "بال", "وال")
+# Words a phrase is a prefix of that are not disclosures ('انتحارية' = suicide attack)
+EXCLUDED_WORDS = frozenset(normalize(w) for w in (
+    "انتحاري", "انتحارية", "انتحاريين", "انتحاريون", "الانتحاري", "الانتحارية", "الانتحاريين",
+))
+# A match right after one of these is a denial ("ما ابا اموت"), not a disclosure. Only
+# within a clause: in "لا، ابا اموت" the "no" is an answer of its own.
+NEGATORS = frozenset(("ما", "مب", "مو", "لا", "ماني", "مابي", "not", "never"))
+_CLAUSE_BREAK = re.compile(r"[.,;:!?\n،؛؟…]+")
+CLAUSE_MARK = "|"  # left between normalized clauses; never part of a phrase or a negator
+
+lexicon_stats: Counter = Counter()  # checks / matches / llm_only / check_us_total
+
+
+class AhoCorasick:
+    """
+    Multi-pattern matcher: one pass over the text finds every occurrence of every pattern.
+    Failure links are folded into a complete transition table at build time, so scanning
+    is a single dict lookup per character.
+    """
+
+    def __init__(self, patterns: Iterable[Tuple[str, object]]):
+        # patterns: (search key, value reported on match)
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[List[object]] = [[]]
+        for key, value in patterns:
+            state = 0
+            for ch in key:
+                nxt = self._goto[state].get(ch)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[state][ch] = nxt
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append([])
+                state = nxt
+            self._out[state].append(value)
+        # Breadth-first failure links; outputs of the fallback state are inherited
+        order = []
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            order.append(state)
+            for ch, nxt in self._goto[state].items():
+                queue.append(nxt)
+                fallback = self._fail[state]
+                while fallback and ch not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[nxt] = self._goto[fallback].get(ch, 0)
+                self._out[nxt].extend(self._out[self._fail[nxt]])
+        # DFA: a state's transitions are its failure state's, overridden by its own edges
+        self._delta: List[Dict[str, int]] = [dict(self._goto[0])] + [{} for _ in self._goto[1:]]
+        for state in order:  # BFS order: the failure state is always complete already
+            self._delta[state] = {**self._delta[self._fail[state]], **self._goto[state]}
+
+    @property
+    def states(self) -> int:
+        return len(self._goto)
+
+    def find_all(self, text: str) -> List[Tuple[int, object]]:
+        """(end index, value) for every match."""
+        delta, out = self._delta, self._out
+        state, found = 0, []
+        for i, ch in enumerate(text):
+            state = delta[state].get(ch, 0)
+            if out[state]:
+                found.extend((i, value) for value in out[state])
+        return found
+
+
+class CrisisLexicon:
+    def __init__(self, phrases: Iterable[str] = CRISIS_PHRASES):
+        patterns = []
+        for phrase in phrases:
+            norm = normalize(phrase)
+            if norm:
+                patterns.extend(
+                    (key, (phrase, len(key))) for key in (f" {clitic}{norm}" for clitic in CLITICS)
+                )
+        self.phrases = tuple(phrases)
+        self._automaton = AhoCorasick(patterns)
+
+    def _first_affirmed(self, text: str) -> Optional[str]:
+        for end, (phrase, length) in self._automaton.find_all(text):
+            start = end - length + 1  # the leading space of the key
+            preceding = text[:start].rsplit(None, 1)
+            if preceding and preceding[-1] in NEGATORS:
+                continue
+            if text[start:].split(None, 1)[0] in EXCLUDED_WORDS:
+                continue
+            return phrase
+        return None
+
+    def match(self, transcript: str) -> Optional[str]:
+        """The crisis phrase found in `transcript`, or None."""
+        start = time.perf_counter()
+        clauses = filter(None, (normalize(clause) for clause in _CLAUSE_BREAK.split(transcript)))
+        hit = self._first_affirmed(f" {f' {CLAUSE_MARK} '.join(clauses)} ")
+        lexicon_stats["checks"] += 1
+        lexicon_stats["check_us_total"] += int((time.perf_counter() - start) * 1e6)
+        if hit is not None:
+            lexicon_stats["matches"] += 1
+            logger.warning(f"[CrisisLexicon] Matched crisis phrase '{hit}'")
+        return hit
+
+
+_lexicon: Optional[CrisisLexicon] = None
+_lexicon_lock = threading.Lock()
+
+
+def get_crisis_lexicon() -> CrisisLexicon:
+    """Process-wide compiled lexicon."""
+    global _lexicon
+    if _lexicon is None:
+        with _lexicon_lock:
+            if _lexicon is None:
+                _lexicon = CrisisLexicon()
+                logger.info(f"[CrisisLexicon] Compiled {len(_lexicon.phrases)} phrases "
+                            f"({_lexicon._automaton.states} states)")
+    return _lexicon
@@ -1,47 +1,32 @@
 # backend/db.py
 
 import os
-import sqlite3
 from datetime import datetime
-from typing import List, Tuple, Optional
+from typing import Dict, List, Tuple, Optional
 import logging
 
 from backend.config import get_settings
+from backend.storage import get_connection, migrate
 
 settings = get_settings()
 logger = logging.getLogger("db")
 logger.setLevel(logging.INFO)
 
 DATA_DIR = settings.DATA_DIR
-DB_PATH = os.path.join(DATA_DIR, "session_logs.db")
 os.makedirs(DATA_DIR, exist_ok=True)
 
 
 # --- DB Initialization ---
+# Schema is owned by backend.storage migrations and applied on first connection;
+# these remain for explicit startup/script use.
 def init_db():
     try:
-        with sqlite3.connect(DB_PATH) as conn:
-            cur = conn.cursor()
-            cur.execute("""
-            CREATE TABLE IF NOT EXISTS sessions (
-                session_id TEXT NOT NULL,
-                timestamp TEXT NOT NULL,
-                transcript TEXT NOT NULL,
-                emotion TEXT NOT NULL,
-                bot_response TEXT NOT NULL,
-                crisis_flag INTEGER NOT NULL,
-                audio_path TEXT NOT NULL,
-                bot_audio_path TEXT NOT NULL
-            )""")
-            conn.commit()
-        logger.info("[DB] Initialized and table ready.")
+        version = migrate()
+        logger.info(f"[DB] Initialized and table ready (schema v{version}).")
     except Exception as e:
         logger.error(f"[DB] Initialization failed: {e}")
 
 
-init_db()
-
-
 # --- Conversation Logging ---
 def log_conversation(
         session_id: str,
@@ -55,7 +40,8 @@ def log_conversation(
     """Log a conversation turn. Returns None on success; logs errors."""
     try:
         timestamp = datetime.utcnow().isoformat()
-        with sqlite3.connect(DB_PATH) as conn:
+        conn = get_connection()
+        with conn:
             cur = conn.cursor()
             cur.execute("""
                 INSERT INTO sessions (
@@ -66,12 +52,28 @@ def log_conversation(
                 session_id, timestamp, transcript, emotion,
                 bot_response, crisis_flag, audio_path, bot_audio_path
             ))
-            conn.commit()
         logger.info(f"[DB] Logged turn for session {session_id}.")
     except Exception as e:
         logger.error(f"[DB] Logging failed: {e}")
 
 
+def log_conversation_batch(rows: List[Tuple[str, str, str, str, str, int, str, str]]) -> None:
+    """
+    Insert many turns in one transaction. Each row is
+    (session_id, timestamp, transcript, emotion, bot_response, crisis_flag, audio_path, bot_audio_path).
+    Raises on failure so the caller can retry.
+    """
+    conn = get_connection()
+    with conn:
+        conn.executemany("""
+            INSERT INTO sessions (
+                session_id, timestamp, transcript, emotion,
+                bot_response, crisis_flag, audio_path, bot_audio_path
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """, rows)
+    logger.info(f"[DB] Logged batch of {len(rows)} turns.")
+
+
 # --- Retrieve History ---
 def get_history(session_id: str, limit: int = 50) -> List[Tuple[str, str]]:
     """
@@ -79,7 +81,8 @@ def get_history(session_id: str, limit: int = 50) -> List[Tuple[str, str]]:
     Returns List of (transcript, bot_response).
     """
     try:
-        with sqlite3.connect(DB_PATH) as conn:
+        conn = get_connection()
+        with conn:
             cur = conn.cursor()
             cur.execute("""
                 SELECT transcript, bot_response
@@ -96,11 +99,35 @@ def get_history(session_id: str, limit: int = 50) -> List[Tuple[str, str]]:
         return []
 
 
+def get_recent_history(session_id: str, limit: int = 50) -> List[Tuple[str, str]]:
+    """
+    Retrieve the most recent `limit` turns for the given session, oldest first.
+    Returns List of (transcript, bot_response). Raises on DB errors, so that the history
+    cache never mistakes a failed read for an empty session.
+    """
+    conn = get_connection()
+    with conn:
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT transcript, bot_response FROM (
+                SELECT transcript, bot_response, timestamp
+                FROM sessions
+                WHERE session_id = ?
+                ORDER BY timestamp DESC
+                LIMIT ?
+            ) ORDER BY timestamp ASC
+        """, (session_id, limit))
+        rows = cur.fetchall()
+    logger.info(f"[DB] Retrieved {len(rows)} recent turns for session {session_id}.")
+    return rows
+
+
 # --- Optional: Export Session (for Analytics) ---
 def export_session(session_id: str) -> Optional[List[dict]]:
     """Export full session data as a list of dicts (for future analytics/UI)."""
     try:
-        with sqlite3.connect(DB_PATH) as conn:
+        conn = get_connection()
+        with conn:
             cur = conn.cursor()
             cur.execute("""
                 SELECT * FROM sessions
@@ -117,29 +144,32 @@ def export_session(session_id: str) -> Optional[List[dict]]:
         return None
 
 
+def update_audio_paths(moves: List[Tuple[str, str]]) -> int:
+    """Repoint logged audio paths after files were moved; `moves` is (old_path, new_path) pairs. Returns rows changed."""
+    conn = get_connection()
+    with conn:
+        before = conn.total_changes
+        conn.executemany("UPDATE sessions SET audio_path = ? WHERE audio_path = ?", [(n, o) for o, n in moves])
+        conn.executemany("UPDATE sessions SET bot_audio_path = ? WHERE bot_audio_path = ?", [(n, o) for o, n in moves])
+        changed = conn.total_changes - before
+    logger.info(f"[DB] Repointed {changed} audio paths.")
+    return changed
+
+
 # --- User Insights (Long-Term Memory) ---
 def init_insights_db():
     try:
-        with sqlite3.connect(DB_PATH) as conn:
-            cur = conn.cursor()
-            cur.execute("""
-            CREATE TABLE IF NOT EXISTS user_insights (
-                user_id TEXT NOT NULL PRIMARY KEY,
-                insights TEXT NOT NULL,
-                last_updated TEXT NOT NULL
-            )""")
-            conn.commit()
+        migrate()
         logger.info("[DB] Insights table ready.")
     except Exception as e:
         logger.error(f"[DB] Insights init failed: {e}")
 
-init_insights_db()
-
 
 def get_user_insights(user_id: str) -> str:
     """Retrieve the summarized insights for a specific user."""
     try:
-        with sqlite3.connect(DB_PATH) as conn:
+        conn = get_connection()
+        with conn:
             cur = conn.cursor()
             cur.execute("SELECT insights FROM user_insights WHERE user_id = ?", (user_id,))
             row = cur.fetchone()
@@ -155,16 +185,105 @@ def save_user_insights(user_id: str, insights: str) -> None:
     """Upsert user insights."""
     try:
         timestamp = datetime.utcnow().isoformat()
-        with sqlite3.connect(DB_PATH) as conn:
+        conn = get_connection()
+        with conn:
             cur = conn.cursor()
             cur.execute("""
-                INSERT INTO user_insights (user_id, insights, last_updated)
-                VALUES (?, ?, ?)
+                INSERT INTO user_insights (user_id, insights, last_updated, version)
+                VALUES (?, ?, ?, 1)
                 ON CONFLICT(user_id) DO UPDATE SET
                     insights = excluded.insights,
-                    last_updated = excluded.last_updated
+                    last_updated = excluded.last_updated,
+                    version = user_insights.version + 1
             """, (user_id, insights, timestamp))
-            conn.commit()
         logger.info(f"[DB] Saved insights for user {user_id}.")
     except Exception as e:
         logger.error(f"[DB] save_user_insights failed: {e}")
+
+
+# --- Incremental Evolution ---
+def get_insights_state(user_id: str) -> Tuple[str, int]:
+    """(insights, version) for a user; ("", 0) if none saved yet."""
+    try:
+        conn = get_connection()
+        with conn:
+            row = conn.execute(
+                "SELECT insights, version FROM user_insights WHERE user_id = ?", (user_id,)
+            ).fetchone()
+        return (row[0], row[1]) if row else ("", 0)
+    except Exception as e:
+        logger.error(f"[DB] get_insights_state failed: {e}")
+        return "", 0
+
+
+def get_insight_watermark(user_id: str, session_id: str) -> int:
+    """turn_id of the last turn of `session_id` already analyzed for `user_id` (0 if none)."""
+    try:
+        conn = get_connection()
+        with conn:
+            row = conn.execute(
+                "SELECT last_turn_id FROM insight_watermarks WHERE user_id = ? AND session_id = ?",
+                (user_id, session_id)
+            ).fetchone()
+        return row[0] if row else 0
+    except Exception as e:
+        logger.error(f"[DB] get_insight_watermark failed: {e}")
+        return 0
+
+
+def get_turns_since(session_id: str, after_turn_id: int, limit: int = 100) -> List[Tuple[int, str, str]]:
+    """
+    Turns of a session logged after `after_turn_id`, oldest first.
+    Returns List of (turn_id, transcript, bot_response).
+    """
+    try:
+        conn = get_connection()
+        with conn:
+            rows = conn.execute("""
+                SELECT turn_id, transcript, bot_response
+                FROM sessions
+                WHERE session_id = ? AND turn_id > ?
+                ORDER BY turn_id ASC
+                LIMIT ?
+            """, (session_id, after_turn_id, limit)).fetchall()
+        return rows
+    except Exception as e:
+        logger.error(f"[DB] get_turns_since failed: {e}")
+        return []
+
+
+def save_user_insights_cas(
+        user_id: str,
+        insights: str,
+        expected_version: int,
+        watermarks: Dict[str, int]
+) -> bool:
+    """
+    Replace a user's insights only if they are still at `expected_version`, advancing the
+    per-session watermarks in the same transaction. Returns False (nothing written) if another
+    writer got there first. Raises on database errors.
+    """
+    timestamp = datetime.utcnow().isoformat()
+    conn = get_connection()
+    with conn:
+        cur = conn.execute("""
+            UPDATE user_insights SET insights = ?, last_updated = ?, version = version + 1
+            WHERE user_id = ? AND version = ?
+        """, (insights, timestamp, user_id, expected_version))
+        if cur.rowcount == 0:
+            if expected_version != 0:
+                return False
+            cur = conn.execute("""
+                INSERT OR IGNORE INTO user_insights (user_id, insights, last_updated, version)
+                VALUES (?, ?, ?, 1)
+            """, (user_id, insights, timestamp))
+            if cur.rowcount == 0:
+                return False
+        conn.executemany("""
+            INSERT INTO insight_watermarks (user_id, session_id, last_turn_id)
+            VALUES (?, ?, ?)
+            ON CONFLICT(user_id, session_id) DO UPDATE SET
+                last_turn_id = max(last_turn_id, excluded.last_turn_id)
+        """, [(user_id, session_id, turn_id) for session_id, turn_id in watermarks.items()])
+    logger.info(f"[DB] Saved insights v{expected_version + 1} for user {user_id}.")
+    return True
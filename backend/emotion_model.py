@@ -0,0 +1,202 @@
+# backend/emotion_model.py
+"""
+CPU-only emotion classifier for user transcripts: multinomial naive Bayes over word
+unigrams and in-word character trigrams of normalized Arabic. It is trained offline
+from the labelled turns in the sessions table (the labels the LLM produced), and it
+lets analyze_emotion skip the Gemini call when the model is confident.
+
+    python -m backend.emotion_model --out data/emotion_model.json
+    python -m benchmarks.eval_emotion
+"""
+import os
+import sys
+import json
+import math
+import sqlite3
+import logging
+import argparse
+import threading
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from backend.config import get_settings
+from backend.arabic import normalize, tokens
+
+settings = get_settings()
+logger = logging.getLogger("emotion_model")
+logger.setLevel(logging.INFO)
+
+MODEL_VERSION = 1
+
+MODEL_PATH = settings.EMOTION_MODEL_PATH or os.path.join(settings.DATA_DIR, "emotion_model.json")
+
+emotion_stats: Counter = Counter()  # local / escalated / no_model
+
+
+def canonical_label(label: str) -> str:
+    """Fold the LLM's label variants ('القلق', 'قلق.', 'قلق ') onto one class name."""
+    words = normalize(label).split()
+    if not words:
+        return ""
+    word = words[0]
+    if word.startswith("ال") and len(word) > 4:
+        word = word[2:]
+    return word
+
+
+def features(text: str) -> List[str]:
+    feats = []
+    for word in tokens(text):
+        feats.append(f"w:{word}")
+        padded = f"<{word}>"
+        feats.extend(f"c:{padded[i:i + 3]}" for i in range(len(padded) - 2))
+    return feats
+
+
+class EmotionModel:
+    """Multinomial naive Bayes with add-`alpha` smoothing."""
+
+    def __init__(self, label_counts: Dict[str, int], feature_counts: Dict[str, Dict[str, int]],
+                 alpha: float = 0.5, display: Optional[Dict[str, str]] = None):
+        self.alpha = alpha
+        self.label_counts = dict(label_counts)
+        # class -> the spelling the LLM used most for it, which is what callers get back
+        self.display = {l: (display or {}).get(l, l) for l in self.label_counts}
+        self.feature_counts = {f: dict(c) for f, c in feature_counts.items()}
+        self.labels = sorted(self.label_counts)
+        total = sum(self.label_counts.values())
+        vocab = len(self.feature_counts)
+        self._log_prior = {l: math.log(n / total) for l, n in self.label_counts.items()}
+        totals = Counter()
+        for counts in self.feature_counts.values():
+            totals.update(counts)
+        self._log_norm = {l: -math.log(totals[l] + alpha * vocab) for l in self.labels}
+        # log P(feature | label), precomputed once so predict() is dictionary lookups only
+        self._log_likelihood = {
+            f: {l: math.log(counts.get(l, 0) + alpha) + self._log_norm[l] for l in self.labels}
+            for f, counts in self.feature_counts.items()
+        }
+
+    @classmethod
+    def fit(cls, examples: Iterable[Tuple[str, str]], min_label_count: int = 3,
+            alpha: float = 0.5) -> "EmotionModel":
+        """Train on (transcript, label) pairs; labels with fewer than `min_label_count` examples are dropped."""
+        examples = list(examples)
+        spellings: Dict[str, Counter] = defaultdict(Counter)
+        for _, label in examples:
+            if canonical_label(label):
+                spellings[canonical_label(label)][label.strip().split()[0].strip(".،,!؟")] += 1
+        examples = [(text, canonical_label(label)) for text, label in examples]
+        label_counts = Counter(label for _, label in examples if label)
+        keep = {l for l, n in label_counts.items() if n >= min_label_count}
+        feature_counts: Dict[str, Counter] = defaultdict(Counter)
+        for text, label in examples:
+            if label in keep:
+                for feat in features(text):
+                    feature_counts[feat][label] += 1
+        if not keep:
+            raise ValueError("No label has enough examples to train on")
+        display = {l: spellings[l].most_common(1)[0][0] for l in keep}
+        return cls({l: label_counts[l] for l in keep}, feature_counts, alpha, display)
+
+    def predict(self, text: str) -> Tuple[str, float]:
+        """(label, posterior probability). Confidence is 0 when no feature of `text` was seen in training."""
+        scores = dict(self._log_prior)
+        seen = False
+        for feat in features(text):
+            likelihood = self._log_likelihood.get(feat)
+            if likelihood is None:
+                continue
+            seen = True
+            for label in self.labels:
+                scores[label] += likelihood[label]
+        best = max(scores, key=scores.get)
+        if not seen:
+            return self.display[best], 0.0
+        norm = sum(math.exp(s - scores[best]) for s in scores.values())
+        return self.display[best], 1.0 / norm
+
+    def to_dict(self) -> dict:
+        return {
+            "version": MODEL_VERSION,
+            "alpha": self.alpha,
+            "label_counts": self.label_counts,
+            "display": self.display,
+            "feature_counts": self.feature_counts,
+        }
+
+    def save(self, path: str) -> None:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp = f"{path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str) -> "EmotionModel":
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("version") != MODEL_VERSION:
+            raise ValueError(f"Unsupported emotion model version {data.get('version')}")
+        return cls(data["label_counts"], data["feature_counts"], data["alpha"], data.get("display"))
+
+
+def labelled_turns(db_path: str = "") -> List[Tuple[str, str, str]]:
+    """(session_id, transcript, emotion) for every logged turn with a usable label."""
+    from backend.storage import DB_PATH
+    conn = sqlite3.connect(db_path or DB_PATH)
+    try:
+        rows = conn.execute("SELECT session_id, transcript, emotion FROM sessions ORDER BY timestamp").fetchall()
+    finally:
+        conn.close()
+    return [(sid, text, label) for sid, text, label in rows if text and canonical_label(label)]
+
+
+_model: Optional[EmotionModel] = None
+_model_loaded = False
+_model_lock = threading.Lock()
+
+
+def get_emotion_model() -> Optional[EmotionModel]:
+    """Process-wide model from EMOTION_MODEL_PATH, loaded once; None if absent or unreadable."""
+    global _model, _model_loaded
+    if not _model_loaded:
+        with _model_lock:
+            if not _model_loaded:
+                path = MODEL_PATH
+                try:
+                    _model = EmotionModel.load(path)
+                    logger.info(f"[EmotionModel] Loaded {path} ({len(_model.labels)} labels)")
+                except FileNotFoundError:
+                    logger.warning(f"[EmotionModel] No model at {path}; emotion stays on the LLM")
+                except Exception as e:
+                    logger.error(f"[EmotionModel] Could not load {path}: {e}")
+                _model_loaded = True
+    return _model
+
+
+def local_emotion(transcript: str) -> Optional[Tuple[str, float]]:
+    """Local (label, confidence), or None when no model is available."""
+    model = get_emotion_model()
+    if model is None:
+        emotion_stats["no_model"] += 1
+        return None
+    return model.predict(transcript)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", default="", help="sessions database (default: DATA_DIR/session_logs.db)")
+    parser.add_argument("--out", default=MODEL_PATH)
+    parser.add_argument("--min-label-count", type=int, default=3)
+    args = parser.parse_args()
+
+    turns = labelled_turns(args.db)
+    model = EmotionModel.fit(((text, label) for _, text, label in turns), args.min_label_count)
+    model.save(args.out)
+    print(f"Trained on {len(turns)} turns: {model.label_counts} -> {args.out}")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, stream=sys.stderr)
+    main()
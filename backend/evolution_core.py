@@ -1,19 +1,28 @@
 # backend/evolution_core.py
 
+import time
+import asyncio
 import logging
-from typing import List, Tuple
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional, Tuple
 
 from backend.config import get_settings
+from backend.llm_client import run_sync
+from backend.job_queue import JobQueue, get_job_queue
 from backend.therapy_core import call_gemini_api
-from backend.db import get_history, save_user_insights, get_user_insights
+from backend.db import get_insights_state, get_insight_watermark, get_turns_since, save_user_insights_cas
 
 settings = get_settings()
 logger = logging.getLogger("evolution_core")
 logger.setLevel(logging.INFO)
 
+# triggers / runs / turns / no_new_turns / cas_conflicts / prompt_chars / run_ms_total
+evolution_stats: Counter = Counter()
+
+
 def insight_extraction_prompt(history_txt: str, current_insights: str) -> str:
     return (
-        f"حلل سجل المحادثة التالي بين مستخدم عماني ومعالج افتراضي:\n"
+        f"حلل المقاطع الجديدة التالية من المحادثة بين مستخدم عماني ومعالج افتراضي:\n"
         f"{history_txt}\n\n"
         f"الملاحظات السابقة عن المستخدم:\n{current_insights}\n\n"
         f"المطلوب: استخرج أو حدث ملف تعريف المستخدم النفسي (Insights) بنقاط مختصرة جداً.\n"
@@ -21,34 +30,113 @@ def insight_extraction_prompt(history_txt: str, current_insights: str) -> str:
         f"اكتب النتيجة كنقاط (bulle points) باللغة العربية، ولا تزد عن 5 نقاط جوهرية."
     )
 
-def analyze_session_for_insights(session_id: str, user_id: str = "default_user") -> None:
+
+def _new_turns(user_id: str, session_ids: Iterable[str], limit: int) -> Dict[str, List[Tuple[int, str, str]]]:
+    """Unanalyzed turns per session, at most `limit` in total."""
+    pending = {}
+    for session_id in session_ids:
+        if limit <= 0:
+            break
+        turns = get_turns_since(session_id, get_insight_watermark(user_id, session_id), limit)
+        if turns:
+            pending[session_id] = turns
+            limit -= len(turns)
+    return pending
+
+
+async def _evolve_once(user_id: str, session_ids: List[str]) -> int:
     """
-    Analyzes the session history to update user insights.
-    In a real app, user_id would come from auth. Here we might map session_id to a user or just use a default for demo.
+    Fold up to EVOLUTION_MAX_TURNS new turns into the user's insights. Returns the number
+    of turns consumed (0 if there were none). Raises if the update could not be made.
     """
-    try:
-        # 1. Get Session History
-        history_rows = get_history(session_id, limit=100) # Analyze up to last 100 turns
-        if not history_rows:
-            logger.warning(f"[Evolution] No history found for session {session_id}")
-            return
+    for attempt in range(1, settings.EVOLUTION_CAS_ATTEMPTS + 1):
+        start = time.perf_counter()
+        current_insights, version = await asyncio.to_thread(get_insights_state, user_id)
+        pending = await asyncio.to_thread(_new_turns, user_id, session_ids, settings.EVOLUTION_MAX_TURNS)
+        if not pending:
+            evolution_stats["no_new_turns"] += 1
+            logger.info(f"[Evolution] No new turns for user {user_id} in {len(session_ids)} session(s)")
+            return 0
 
-        history_txt = "\n".join([f"مستخدم: {h[0]}\nمعالج: {h[1]}" for h in history_rows])
+        turns = [turn for session_turns in pending.values() for turn in session_turns]
+        history_txt = "\n".join([f"مستخدم: {t[1]}\nمعالج: {t[2]}" for t in turns])
+        prompt = insight_extraction_prompt(history_txt, current_insights)
+        new_insights = await call_gemini_api(prompt, max_tokens=256, temperature=0.3)
+        if not new_insights:
+            raise RuntimeError("empty response from LLM for insights")
 
-        # 2. Get Current Insights
-        current_insights = get_user_insights(user_id)
+        watermarks = {session_id: session_turns[-1][0] for session_id, session_turns in pending.items()}
+        if await asyncio.to_thread(save_user_insights_cas, user_id, new_insights, version, watermarks):
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            evolution_stats["runs"] += 1
+            evolution_stats["turns"] += len(turns)
+            evolution_stats["prompt_chars"] += len(prompt)
+            evolution_stats["run_ms_total"] += int(elapsed_ms)
+            logger.info(f"[Evolution] Updated insights for user {user_id} from {len(turns)} new turns "
+                        f"({len(prompt)} prompt chars, {elapsed_ms:.0f} ms): {new_insights[:50]}...")
+            return len(turns)
+        # Someone else updated the insights (and maybe consumed these turns): redo on top of theirs
+        evolution_stats["cas_conflicts"] += 1
+        logger.info(f"[Evolution] Insights for user {user_id} changed concurrently (attempt {attempt})")
+    raise RuntimeError(f"insights kept changing concurrently ({settings.EVOLUTION_CAS_ATTEMPTS} attempts)")
 
-        # 3. Generate New Insights using LLM
-        prompt = insight_extraction_prompt(history_txt, current_insights)
-        new_insights = call_gemini_api(prompt, max_tokens=256, temperature=0.3)
 
-        if not new_insights:
-            logger.warning("[Evolution] Empty response from LLM for insights.")
-            return
+async def evolve_user(user_id: str, session_ids: Iterable[str]) -> int:
+    """
+    Incrementally update a user's insights from the sessions' unanalyzed turns. Returns turns
+    consumed; raises on failure (turns not saved stay behind the watermark for the next run).
+    """
+    session_ids = sorted(set(session_ids))
+    total = 0
+    while True:
+        consumed = await _evolve_once(user_id, session_ids)
+        total += consumed
+        if consumed < settings.EVOLUTION_MAX_TURNS:
+            return total
 
-        # 4. Save Updated Insights
-        save_user_insights(user_id, new_insights)
-        logger.info(f"[Evolution] Updated insights for user {user_id}: {new_insights[:50]}...")
 
+async def analyze_session_for_insights(session_id: str, user_id: str = "default_user") -> None:
+    """
+    Updates user insights with the session's turns that have not been analyzed yet.
+    In a real app, user_id would come from auth. Here we might map session_id to a user or just use a default for demo.
+    """
+    try:
+        await evolve_user(user_id, [session_id])
     except Exception as e:
         logger.error(f"[Evolution] Analysis failed: {e}")
+
+
+def analyze_session_for_insights_sync(session_id: str, user_id: str = "default_user") -> None:
+    """Blocking wrapper for scripts and tests."""
+    run_sync(analyze_session_for_insights(session_id, user_id))
+
+
+# --- Background jobs ---
+EVOLVE_JOB = "evolve_user"
+
+
+def enqueue_evolution(session_id: str, user_id: str = "default_user", queue: Optional[JobQueue] = None) -> int:
+    """
+    Queue an evolution job for the user (run by backend.worker). Session ends of the same user
+    within EVOLUTION_DEBOUNCE_S of the first one are coalesced into that job.
+    """
+    evolution_stats["triggers"] += 1
+    return (queue or get_job_queue()).enqueue(
+        EVOLVE_JOB,
+        {"user_id": user_id, "session_ids": [session_id]},
+        dedupe_key=f"{EVOLVE_JOB}:{user_id}",
+        delay_s=settings.EVOLUTION_DEBOUNCE_S,
+    )
+
+
+async def run_evolution_job(payload: Dict[str, Any]) -> None:
+    await evolve_user(payload["user_id"], payload["session_ids"])
+
+
+def evolution_stats_snapshot() -> Dict[str, float]:
+    runs = evolution_stats["runs"]
+    return {
+        **evolution_stats,
+        "avg_turns_per_run": evolution_stats["turns"] / runs if runs else 0.0,
+        "avg_run_ms": evolution_stats["run_ms_total"] / runs if runs else 0.0,
+    }
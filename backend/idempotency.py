@@ -0,0 +1,120 @@
+# backend/idempotency.py
+"""
+Idempotent chat turns. A turn is identified by the client's Idempotency-Key header or, when
+there is none, by a digest of its audio, always scoped to the session. A duplicate that
+arrives while the turn is running attaches to the same computation, and one arriving after
+it completed gets the stored result (for IDEMPOTENCY_TTL_S). Either way the pipeline runs,
+and the turn is logged, only once. Failed turns are not stored: a retry runs again.
+
+A keyed duplicate is recognised before admission and before its upload is read. An
+audio-derived key is only known once the upload is read, after admission: a duplicate of a
+turn still running is refused as a busy session (429), and its retry gets the stored result.
+"""
+import time
+import asyncio
+import hashlib
+import logging
+from collections import Counter, OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from backend.config import get_settings
+
+settings = get_settings()
+logger = logging.getLogger("idempotency")
+logger.setLevel(logging.INFO)
+
+ENTRY_OVERHEAD = 1024  # rough size of a stored response besides its inline audio
+
+
+def new_audio_digest():
+    """Running digest of an upload, fed chunk by chunk as the upload is copied into its buffer."""
+    return hashlib.blake2b(digest_size=16)
+
+
+def turn_key(session_id: str, idempotency_key: Optional[str], audio_digest: str = "", variant: str = "") -> str:
+    if idempotency_key:
+        return f"{session_id}:{variant}:key:{idempotency_key}"
+    return f"{session_id}:{variant}:audio:{audio_digest}"
+
+
+class TurnCoalescer:
+    """
+    In-flight turns and recently completed results by key. Runs on the API's event loop
+    (not thread-safe). A turn runs as its own task, so its result still reaches attached
+    duplicates and the replay cache if the request that started it goes away.
+    """
+
+    def __init__(self, ttl_s: float = 0, max_bytes: int = 0, sizeof: Callable[[Any], int] = lambda result: 0):
+        self.ttl_s = ttl_s or settings.IDEMPOTENCY_TTL_S
+        self.max_bytes = max_bytes or settings.IDEMPOTENCY_CACHE_MB * 1024 * 1024
+        self.sizeof = sizeof
+        self._running: Dict[str, asyncio.Task] = {}
+        # key -> (stored at, size, result), oldest first
+        self._done: "OrderedDict[str, Tuple[float, int, Any]]" = OrderedDict()
+        self._total = 0
+        self.counts: Counter = Counter()  # computed / joined / replayed / failed
+
+    async def attach(self, key: str) -> Optional[Tuple[Any, str]]:
+        """Result of the stored ('replayed') or running ('joined') turn `key`; None if there is none."""
+        entry = self._done.get(key)
+        if entry is not None:
+            if time.monotonic() - entry[0] <= self.ttl_s:
+                self.counts["replayed"] += 1
+                logger.info(f"[Idempotency] Replayed completed turn {key}")
+                return entry[2], "replayed"
+            self._drop(key)
+
+        task = self._running.get(key)
+        if task is not None:
+            self.counts["joined"] += 1
+            logger.info(f"[Idempotency] Duplicate attached to in-flight turn {key}")
+            return await asyncio.shield(task), "joined"
+        return None
+
+    async def run(self, key: str, compute: Callable[[], Awaitable[Any]]) -> Tuple[Any, str]:
+        """Result of the turn `key` and how it was obtained: 'computed', 'joined' or 'replayed'."""
+        existing = await self.attach(key)  # returns at once when there is nothing to attach to
+        if existing is not None:
+            return existing
+        task = asyncio.create_task(compute(), name=f"turn:{key}")
+        self._running[key] = task
+        task.add_done_callback(lambda t: self._finish(key, t))
+        return await asyncio.shield(task), "computed"
+
+    def _finish(self, key: str, task: asyncio.Task) -> None:
+        del self._running[key]
+        if task.cancelled() or task.exception() is not None:
+            self.counts["failed"] += 1
+            return
+        self.counts["computed"] += 1
+        result = task.result()
+        size = self.sizeof(result) + ENTRY_OVERHEAD
+        if size > self.max_bytes:
+            return
+        self._done[key] = (time.monotonic(), size, result)
+        self._total += size
+        now = time.monotonic()
+        while self._total > self.max_bytes or (self._done and now - next(iter(self._done.values()))[0] > self.ttl_s):
+            self._drop(next(iter(self._done)))
+
+    def _drop(self, key: str) -> None:
+        _, size, _ = self._done.pop(key)
+        self._total -= size
+
+    def stats(self) -> Dict[str, float]:
+        return {"running": len(self._running), "stored": len(self._done), "bytes": self._total, **self.counts}
+
+
+def _response_size(response) -> int:
+    return len(getattr(response, "bot_audio", None) or "")
+
+
+_coalescer: Optional[TurnCoalescer] = None
+
+
+def get_turn_coalescer() -> TurnCoalescer:
+    """Process-wide coalescer for /chat/ turns."""
+    global _coalescer
+    if _coalescer is None:
+        _coalescer = TurnCoalescer(sizeof=_response_size)
+    return _coalescer
@@ -0,0 +1,239 @@
+# backend/job_queue.py
+r"""
+Durable background job queue in session_logs.db.
+
+Jobs are rows in the `jobs` table (migration 4). A worker claims one by taking a lease:
+the row moves to 'running' with `lease_until` in the future, and the worker must complete,
+fail or heartbeat it before then. A lease that runs out (crashed or hung worker) puts the
+job back on the queue. Failures are retried with exponential backoff until `max_attempts`,
+after which the job is parked in the 'dead' state for inspection.
+
+    queued -> running -> done
+                 |  \-> queued (retry after backoff / lease expired)
+                 \--> dead   (out of attempts)
+
+Claims and enqueues run under BEGIN IMMEDIATE, so any number of worker processes can
+share the database. Workers live in backend.worker.
+"""
+import json
+import time
+import random
+import logging
+from typing import Any, Dict, Iterable, NamedTuple, Optional
+
+from backend.config import get_settings
+from backend import storage
+from backend.storage import get_connection
+
+settings = get_settings()
+logger = logging.getLogger("job_queue")
+logger.setLevel(logging.INFO)
+
+STATES = ("queued", "running", "done", "dead")
+
+
+class Job(NamedTuple):
+    job_id: int
+    kind: str
+    payload: Dict[str, Any]
+    attempts: int  # including the current one
+
+
+def merge_payloads(old: Dict[str, Any], new: Dict[str, Any]) -> Dict[str, Any]:
+    """Payload of a job that absorbed a duplicate: list fields are unioned, others take the newer value."""
+    merged = dict(old)
+    for key, value in new.items():
+        if isinstance(value, list) and isinstance(merged.get(key), list):
+            merged[key] = merged[key] + [v for v in value if v not in merged[key]]
+        else:
+            merged[key] = value
+    return merged
+
+
+class JobQueue:
+    def __init__(
+            self,
+            path: Optional[str] = None,
+            lease_s: float = 0,
+            max_attempts: int = 0,
+            backoff_base_s: float = 0,
+            backoff_max_s: float = 0,
+    ):
+        self.path = path or storage.DB_PATH  # looked up now, like get_connection does
+        self.lease_s = lease_s or settings.JOB_LEASE_S
+        self.max_attempts = max_attempts or settings.JOB_MAX_ATTEMPTS
+        self.backoff_base_s = backoff_base_s or settings.JOB_BACKOFF_BASE_S
+        self.backoff_max_s = backoff_max_s or settings.JOB_BACKOFF_MAX_S
+
+    def enqueue(
+            self,
+            kind: str,
+            payload: Dict[str, Any],
+            dedupe_key: Optional[str] = None,
+            delay_s: float = 0.0,
+    ) -> int:
+        """
+        Add a job, runnable after `delay_s`. If a queued job with the same `dedupe_key` is still
+        waiting, the payload is merged into it instead (its start time is kept). Returns the job id.
+        """
+        now = time.time()
+        conn = get_connection(self.path)
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            if dedupe_key is not None:
+                row = conn.execute(
+                    "SELECT job_id, payload FROM jobs WHERE dedupe_key = ? AND state = 'queued' "
+                    "ORDER BY job_id LIMIT 1", (dedupe_key,)
+                ).fetchone()
+                if row is not None:
+                    merged = merge_payloads(json.loads(row[1]), payload)
+                    conn.execute(
+                        "UPDATE jobs SET payload = ? WHERE job_id = ?", (json.dumps(merged, ensure_ascii=False), row[0])
+                    )
+                    logger.info(f"[JobQueue] Coalesced {kind} into job {row[0]}")
+                    return row[0]
+            cur = conn.execute("""
+                INSERT INTO jobs (kind, payload, dedupe_key, state, available_at, created_at)
+                VALUES (?, ?, ?, 'queued', ?, ?)
+            """, (kind, json.dumps(payload, ensure_ascii=False), dedupe_key, now + delay_s, now))
+        logger.info(f"[JobQueue] Enqueued {kind} job {cur.lastrowid} (delay {delay_s:.0f}s)")
+        return cur.lastrowid
+
+    def claim(self, worker_id: str, kinds: Optional[Iterable[str]] = None) -> Optional[Job]:
+        """Lease the next runnable job for `worker_id`, or None if nothing is ready."""
+        now = time.time()
+        kinds = tuple(kinds or ())
+        kind_filter = f"AND kind IN ({','.join('?' * len(kinds))})" if kinds else ""
+        conn = get_connection(self.path)
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            self._reap_expired(conn, now)
+            row = conn.execute(f"""
+                UPDATE jobs SET
+                    state = 'running', attempts = attempts + 1,
+                    lease_owner = ?, lease_until = ?, started_at = ?
+                WHERE job_id = (
+                    SELECT job_id FROM jobs
+                    WHERE state = 'queued' AND available_at <= ? {kind_filter}
+                    ORDER BY available_at, job_id LIMIT 1
+                )
+                RETURNING job_id, kind, payload, attempts
+            """, (worker_id, now + self.lease_s, now, now, *kinds)).fetchone()
+        if row is None:
+            return None
+        return Job(row[0], row[1], json.loads(row[2]), row[3])
+
+    def _reap_expired(self, conn, now: float) -> None:
+        # Leases that ran out: the worker died or hung. Out of attempts -> dead, else back on the queue.
+        dead = conn.execute("""
+            UPDATE jobs SET state = 'dead', finished_at = ?, lease_owner = NULL,
+                last_error = 'lease expired'
+            WHERE state = 'running' AND lease_until < ? AND attempts >= ?
+        """, (now, now, self.max_attempts)).rowcount
+        requeued = conn.execute("""
+            UPDATE jobs SET state = 'queued', available_at = ?, lease_owner = NULL,
+                last_error = 'lease expired'
+            WHERE state = 'running' AND lease_until < ?
+        """, (now, now)).rowcount
+        if dead or requeued:
+            logger.warning(f"[JobQueue] Expired leases: {requeued} requeued, {dead} dead-lettered")
+
+    def heartbeat(self, job: Job, worker_id: str) -> bool:
+        """Extend the lease; False if the worker no longer owns the job."""
+        conn = get_connection(self.path)
+        with conn:
+            cur = conn.execute(
+                "UPDATE jobs SET lease_until = ? WHERE job_id = ? AND lease_owner = ? AND state = 'running'",
+                (time.time() + self.lease_s, job.job_id, worker_id)
+            )
+        return cur.rowcount == 1
+
+    def complete(self, job: Job, worker_id: str) -> bool:
+        now = time.time()
+        conn = get_connection(self.path)
+        with conn:
+            cur = conn.execute("""
+                UPDATE jobs SET state = 'done', finished_at = ?, lease_owner = NULL,
+                    run_ms = CAST((? - started_at) * 1000 AS INTEGER)
+                WHERE job_id = ? AND lease_owner = ? AND state = 'running'
+            """, (now, now, job.job_id, worker_id))
+        return cur.rowcount == 1
+
+    def backoff_s(self, attempts: int) -> float:
+        """Delay before retry number `attempts`: exponential, capped, with jitter."""
+        delay = min(self.backoff_max_s, self.backoff_base_s * 2 ** (attempts - 1))
+        return delay * random.uniform(0.5, 1.0)
+
+    def fail(self, job: Job, worker_id: str, error: str) -> str:
+        """Record a failed attempt. Returns the job's new state ('queued' for a retry or 'dead')."""
+        now = time.time()
+        state = "dead" if job.attempts >= self.max_attempts else "queued"
+        available_at = now + self.backoff_s(job.attempts) if state == "queued" else now
+        conn = get_connection(self.path)
+        with conn:
+            cur = conn.execute("""
+                UPDATE jobs SET state = ?, available_at = ?, lease_owner = NULL, last_error = ?,
+                    finished_at = ?, run_ms = CAST((? - started_at) * 1000 AS INTEGER)
+                WHERE job_id = ? AND lease_owner = ? AND state = 'running'
+            """, (state, available_at, error[:1000], now, now, job.job_id, worker_id))
+        if cur.rowcount == 0:
+            return "lost"
+        if state == "dead":
+            logger.error(f"[JobQueue] Job {job.job_id} ({job.kind}) dead after {job.attempts} attempts: {error}")
+        else:
+            logger.warning(f"[JobQueue] Job {job.job_id} ({job.kind}) attempt {job.attempts} failed, "
+                           f"retrying in {available_at - now:.1f}s: {error}")
+        return state
+
+    def retry_dead(self, job_id: Optional[int] = None) -> int:
+        """Put dead jobs (or one of them) back on the queue with a fresh attempt budget."""
+        conn = get_connection(self.path)
+        with conn:
+            cur = conn.execute(f"""
+                UPDATE jobs SET state = 'queued', attempts = 0, available_at = ?
+                WHERE state = 'dead' {'AND job_id = ?' if job_id is not None else ''}
+            """, (time.time(), *(() if job_id is None else (job_id,))))
+        return cur.rowcount
+
+    def purge_done(self, older_than_s: float) -> int:
+        """Delete finished jobs older than `older_than_s`."""
+        conn = get_connection(self.path)
+        with conn:
+            cur = conn.execute(
+                "DELETE FROM jobs WHERE state = 'done' AND finished_at < ?", (time.time() - older_than_s,)
+            )
+        return cur.rowcount
+
+    def stats(self) -> Dict[str, float]:
+        now = time.time()
+        conn = get_connection(self.path)
+        with conn:
+            rows = conn.execute(
+                "SELECT state, count(*), avg(run_ms), max(run_ms) FROM jobs GROUP BY state"
+            ).fetchall()
+            oldest_ready = conn.execute(
+                "SELECT min(available_at) FROM jobs WHERE state = 'queued' AND available_at <= ?", (now,)
+            ).fetchone()[0]
+            queue_wait = conn.execute(
+                "SELECT avg(started_at - available_at) FROM jobs WHERE state = 'done'"
+            ).fetchone()[0]
+        result: Dict[str, float] = {state: 0 for state in STATES}
+        for state, count, avg_ms, max_ms in rows:
+            result[state] = count
+            if state == "done":
+                result["done_avg_run_ms"] = avg_ms or 0.0
+                result["done_max_run_ms"] = max_ms or 0
+        result["ready_lag_s"] = now - oldest_ready if oldest_ready is not None else 0.0
+        result["queue_wait_avg_s"] = queue_wait or 0.0
+        return result
+
+
+_queue: Optional[JobQueue] = None
+
+
+def get_job_queue() -> JobQueue:
+    """Process-wide queue on the default database."""
+    global _queue
+    if _queue is None:
+        _queue = JobQueue()
+    return _queue
@@ -0,0 +1,196 @@
+# backend/llm_client.py
+
+import json
+import asyncio
+import logging
+import weakref
+from typing import AsyncIterator, Optional
+
+import httpx
+
+from backend.config import get_settings
+from backend.resilience import (
+    UpstreamError, attempt_timeout, call_async, get_breaker, get_call_slots, is_retryable
+)
+
+settings = get_settings()
+logger = logging.getLogger("llm_client")
+logger.setLevel(logging.INFO)
+
+GEMINI_BASE_URL = "https://generativelanguage.googleapis.com/v1beta"
+# The google-genai SDK clients (STT/TTS) take the same override as a host, without the version
+GENAI_HTTP_OPTIONS = {"base_url": settings.GEMINI_BASE_URL} if settings.GEMINI_BASE_URL else None
+DEFAULT_MODEL = "gemini-2.0-flash"
+
+
+def _payload(prompt: str, max_tokens: int, temperature: float, response_schema: Optional[dict] = None) -> dict:
+    generation_config = {"temperature": temperature, "maxOutputTokens": max_tokens}
+    if response_schema is not None:
+        generation_config["responseMimeType"] = "application/json"
+        generation_config["responseSchema"] = response_schema
+    return {
+        "contents": [{"parts": [{"text": prompt}]}],
+        "generationConfig": generation_config
+    }
+
+
+class GeminiClient:
+    """
+    Async Gemini REST client sharing one pooled HTTP/2 keep-alive connection per event loop.
+    The underlying httpx client is created lazily so importing this module never opens sockets.
+    """
+
+    def __init__(self, api_key: str, base_url: str = GEMINI_BASE_URL):
+        self.api_key = api_key
+        self.base_url = base_url
+        # A pooled client is bound to the loop that created it. The API runs on one
+        # loop; scripts and thread workers using run_sync() get their own pool.
+        self._pools: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = (
+            weakref.WeakKeyDictionary()
+        )
+
+    def _get_http(self) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        http = self._pools.get(loop)
+        if http is None or http.is_closed:
+            http = httpx.AsyncClient(
+                base_url=self.base_url,
+                http2=True,
+                headers={"Content-Type": "application/json", "x-goog-api-key": self.api_key},
+                timeout=httpx.Timeout(settings.GEMINI_TIMEOUT_S, connect=settings.GEMINI_CONNECT_TIMEOUT_S),
+                limits=httpx.Limits(
+                    max_connections=settings.GEMINI_MAX_CONNECTIONS,
+                    max_keepalive_connections=settings.GEMINI_MAX_CONNECTIONS,
+                    keepalive_expiry=settings.GEMINI_KEEPALIVE_S,
+                ),
+            )
+            self._pools[loop] = http
+        return http
+
+    async def generate(
+            self,
+            prompt: str,
+            max_tokens: int = 128,
+            temperature: float = 0.4,
+            model: str = DEFAULT_MODEL,
+            response_schema: Optional[dict] = None,
+            hedge_after_s: float = 0
+    ) -> str:
+        """
+        generateContent under the shared retry policy, deadline and circuit breaker (see
+        backend/resilience.py). Returns the first candidate's text, or '' on failure.
+        With `response_schema` the model is constrained to emit JSON matching it.
+        """
+        payload = _payload(prompt, max_tokens, temperature, response_schema)
+
+        async def attempt(timeout: float) -> str:
+            resp = await self._get_http().post(
+                f"/models/{model}:generateContent", json=payload, timeout=self._timeout(timeout)
+            )
+            if resp.status_code != 200:
+                raise UpstreamError(resp.status_code, resp.text)
+            return resp.json()["candidates"][0]["content"]["parts"][0]["text"].strip()
+
+        try:
+            return await call_async(model, attempt, "llm", hedge_after_s)
+        except Exception as e:
+            logger.error(f"[Gemini API] Request failed: {type(e).__name__}: {e}")
+            return ""
+
+    async def stream(
+            self,
+            prompt: str,
+            max_tokens: int = 128,
+            temperature: float = 0.4,
+            model: str = DEFAULT_MODEL
+    ) -> AsyncIterator[str]:
+        """
+        streamGenerateContent over SSE. Yields text deltas as they arrive; stops silently
+        (after logging) on HTTP or transport errors so callers can fall back. Partial output
+        cannot be replayed, so there are no retries; the deadline, call slots and circuit breaker apply.
+        """
+        payload = _payload(prompt, max_tokens, temperature)
+        breaker = get_breaker(model)
+        slots = get_call_slots(model)
+        acquired = False
+        try:
+            timeout = attempt_timeout()
+            timeout -= await slots.acquire(timeout)
+            acquired = True
+            if not breaker.allow():
+                logger.warning(f"[Gemini API] Circuit open for {model}; not streaming")
+                return
+            async with self._get_http().stream(
+                    "POST", f"/models/{model}:streamGenerateContent", params={"alt": "sse"}, json=payload,
+                    timeout=self._timeout(timeout)
+            ) as resp:
+                if resp.status_code != 200:
+                    body = await resp.aread()
+                    raise UpstreamError(resp.status_code, body.decode(errors="replace"))
+                async for line in resp.aiter_lines():
+                    if not line.startswith("data:"):
+                        continue
+                    chunk = json.loads(line[len("data:"):])
+                    parts = chunk.get("candidates", [{}])[0].get("content", {}).get("parts", [])
+                    for part in parts:
+                        if part.get("text"):
+                            yield part["text"]
+            breaker.success()
+        except Exception as e:
+            if is_retryable(e):
+                breaker.failure()
+            logger.error(f"[Gemini API] Stream failed: {type(e).__name__}: {e}")
+        finally:
+            if acquired:
+                slots.release()
+
+    @staticmethod
+    def _timeout(seconds: float) -> httpx.Timeout:
+        return httpx.Timeout(seconds, connect=min(settings.GEMINI_CONNECT_TIMEOUT_S, seconds))
+
+    async def aclose(self) -> None:
+        """Close the connection pool owned by the running event loop."""
+        http = self._pools.pop(asyncio.get_running_loop(), None)
+        if http is not None and not http.is_closed:
+            await http.aclose()
+
+
+_client: Optional[GeminiClient] = None
+
+
+def get_llm_client() -> GeminiClient:
+    """Process-wide Gemini client (one connection pool shared by all requests)."""
+    global _client
+    if _client is None:
+        base_url = f"{settings.GEMINI_BASE_URL.rstrip('/')}/v1beta" if settings.GEMINI_BASE_URL else GEMINI_BASE_URL
+        _client = GeminiClient(settings.GEMINI_API_KEY, base_url)
+    return _client
+
+
+async def close_llm_client() -> None:
+    """Close the current loop's connection pool; called from the app lifespan on shutdown."""
+    if _client is not None:
+        await _client.aclose()
+
+
+def run_sync(coro):
+    """
+    Run a coroutine to completion from synchronous code (tests, scripts, thread workers).
+    Must not be called from inside a running event loop.
+    """
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        pass
+    else:
+        coro.close()
+        raise RuntimeError("run_sync() called from a running event loop; await the coroutine instead")
+
+    async def _runner():
+        try:
+            return await coro
+        finally:
+            # The throwaway loop dies with asyncio.run(); release its pool with it.
+            await close_llm_client()
+
+    return asyncio.run(_runner())
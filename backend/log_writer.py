@@ -0,0 +1,214 @@
+# backend/log_writer.py
+
+import time
+import asyncio
+import logging
+import threading
+from collections import defaultdict, deque
+from datetime import datetime
+from typing import Deque, Dict, List, Optional, Tuple
+
+from backend.config import get_settings
+from backend.db import log_conversation_batch
+
+settings = get_settings()
+logger = logging.getLogger("log_writer")
+logger.setLevel(logging.INFO)
+
+WRITE_ATTEMPTS = 3
+
+
+class ConversationWriter:
+    """
+    Write-behind logger for conversation turns.
+
+    log() stamps the turn and puts it on a bounded queue; a background task drains the
+    queue and inserts turns with one executemany transaction per batch, flushing when
+    `batch_size` turns are waiting or `flush_interval_s` has passed since the first one.
+    A full queue makes log() wait (backpressure) instead of dropping turns, and stop()
+    drains everything queued before returning.
+
+    Turns not yet written are also kept per session (pending_turns()), so a history
+    reload from SQLite can add them back; `write_version` is odd while a batch is being
+    committed and changes with every batch, so a reader can tell whether a commit
+    happened during its own read.
+    """
+
+    def __init__(self, max_queue: int = 0, batch_size: int = 0, flush_interval_s: float = 0):
+        self.max_queue = max_queue or settings.LOG_QUEUE_MAX
+        self.batch_size = batch_size or settings.LOG_BATCH_SIZE
+        self.flush_interval_s = flush_interval_s or settings.LOG_FLUSH_INTERVAL_S
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._flush_waiters: List[Tuple[int, asyncio.Future]] = []
+        self._done = 0  # turns written or given up on; the queue is FIFO, so turns 1.._done are settled
+        self._pending_lock = threading.Lock()
+        self._pending: Dict[str, Deque[Tuple[str, str]]] = defaultdict(deque)
+        self.write_version = 0
+        # --- metrics ---
+        self.enqueued = 0
+        self.written = 0
+        self.failed = 0
+        self.batches = 0
+        self.max_depth = 0
+        self.enqueue_wait_total_s = 0.0
+        self.enqueue_wait_max_s = 0.0
+        self.flush_total_s = 0.0
+        self.flush_max_s = 0.0
+        self.last_flush_s = 0.0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def start(self) -> None:
+        if self.running:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_queue)
+        self._task = asyncio.create_task(self._run(), name="conversation-writer")
+        logger.info(f"[LogWriter] Started (batch={self.batch_size}, interval={self.flush_interval_s}s)")
+
+    async def log(
+            self,
+            session_id: str,
+            transcript: str,
+            emotion: str,
+            bot_response: str,
+            crisis_flag: int,
+            audio_path: str,
+            bot_audio_path: str
+    ) -> None:
+        """Queue a turn (same arguments as db.log_conversation). Waits while the queue is full."""
+        if not self.running:
+            raise RuntimeError("ConversationWriter is not running")
+        row = (
+            session_id, datetime.utcnow().isoformat(), transcript, emotion,
+            bot_response, crisis_flag, audio_path, bot_audio_path
+        )
+        start = time.perf_counter()
+        await self._queue.put(row)
+        with self._pending_lock:
+            self._pending[session_id].append((transcript, bot_response))
+        waited = time.perf_counter() - start
+        self.enqueued += 1
+        self.enqueue_wait_total_s += waited
+        self.enqueue_wait_max_s = max(self.enqueue_wait_max_s, waited)
+        self.max_depth = max(self.max_depth, self._queue.qsize())
+
+    def pending_turns(self, session_id: str) -> Tuple[int, List[Tuple[str, str]]]:
+        """(write_version, the session's queued turns not yet in SQLite, oldest first). Thread-safe."""
+        with self._pending_lock:
+            turns = self._pending.get(session_id)
+            return self.write_version, list(turns) if turns else []
+
+    async def flush(self) -> None:
+        """Wait until every turn queued so far has been written (or given up on); later turns don't delay it."""
+        if not self.running:
+            return
+        target = self.enqueued
+        if self._done >= target:
+            return
+        waiter = asyncio.get_running_loop().create_future()
+        self._flush_waiters.append((target, waiter))
+        await waiter
+
+    async def stop(self) -> None:
+        """Drain the queue, then stop the background task."""
+        if not self.running:
+            return
+        await self._queue.join()
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        logger.info(f"[LogWriter] Stopped after writing {self.written} turns: {self.stats()}")
+
+    async def _run(self) -> None:
+        while True:
+            batch = [await self._queue.get()]
+            deadline = time.monotonic() + self.flush_interval_s
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+            self._begin_batch()
+            try:
+                await self._write(batch)
+            finally:
+                self._end_batch(batch)
+                self._settle(len(batch))
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _settle(self, count: int) -> None:
+        self._done += count
+        waiting = []
+        for target, waiter in self._flush_waiters:
+            if target <= self._done:
+                if not waiter.done():
+                    waiter.set_result(None)
+            else:
+                waiting.append((target, waiter))
+        self._flush_waiters = waiting
+
+    def _begin_batch(self) -> None:
+        with self._pending_lock:
+            self.write_version += 1
+
+    def _end_batch(self, batch) -> None:
+        # Written (or given up on): SQLite is now the source for these turns
+        with self._pending_lock:
+            for row in batch:
+                turns = self._pending[row[0]]
+                turns.popleft()
+                if not turns:
+                    del self._pending[row[0]]
+            self.write_version += 1
+
+    async def _write(self, batch) -> None:
+        start = time.perf_counter()
+        for attempt in range(1, WRITE_ATTEMPTS + 1):
+            try:
+                await asyncio.to_thread(log_conversation_batch, batch)
+                break
+            except Exception as e:
+                logger.error(f"[LogWriter] Batch of {len(batch)} failed (attempt {attempt}): {e}")
+                if attempt == WRITE_ATTEMPTS:
+                    self.failed += len(batch)
+                    return
+                await asyncio.sleep(0.1 * attempt)
+        elapsed = time.perf_counter() - start
+        self.written += len(batch)
+        self.batches += 1
+        self.last_flush_s = elapsed
+        self.flush_total_s += elapsed
+        self.flush_max_s = max(self.flush_max_s, elapsed)
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "queue_max_depth": self.max_depth,
+            "enqueued": self.enqueued,
+            "written": self.written,
+            "failed": self.failed,
+            "batches": self.batches,
+            "avg_batch_size": self.written / self.batches if self.batches else 0.0,
+            "flush_last_s": self.last_flush_s,
+            "flush_avg_s": self.flush_total_s / self.batches if self.batches else 0.0,
+            "flush_max_s": self.flush_max_s,
+            "enqueue_wait_avg_s": self.enqueue_wait_total_s / self.enqueued if self.enqueued else 0.0,
+            "enqueue_wait_max_s": self.enqueue_wait_max_s,
+        }
+
+
+_writer: Optional[ConversationWriter] = None
+
+
+def get_conversation_writer() -> ConversationWriter:
+    """Process-wide write-behind logger; started and drained by the app lifespan."""
+    global _writer
+    if _writer is None:
+        _writer = ConversationWriter()
+    return _writer
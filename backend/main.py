@@ -1,22 +1,54 @@
 # backend/main.py
 
 import os
+import json
+import time
+import asyncio
 import uuid
-import shutil
+import wave
+import base64
 import logging
+from contextlib import asynccontextmanager
 from datetime import datetime
-from typing import Annotated
+from typing import Annotated, Awaitable, Callable, Optional, Tuple
 
-from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Depends, status
-from fastapi.responses import FileResponse
+from fastapi import FastAPI, UploadFile, File, Form, Header, HTTPException, Depends, Request, status
+from fastapi.responses import FileResponse, PlainTextResponse, Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 
 from backend.config import get_settings
 from backend.models import StartSessionResponse, ChatResponse
-from backend.db import log_conversation, get_history, get_user_insights
-from backend.speech_utils import transcribe_audio, synthesize_speech
-from backend.therapy_core import analyze_emotion, is_crisis, generate_response, get_consent_text
-from backend.evolution_core import analyze_session_for_insights
+from backend.db import get_user_insights
+from backend.log_writer import get_conversation_writer
+from backend.session_cache import get_history_store
+from backend.storage import migrate
+from backend.speech_utils import transcribe_audio_bytes, preprocess_wav, preprocess_stats, wav_bytes
+from backend.tts_cache import get_tts_cache
+from backend.audio_store import (
+    get_audio_store, get_hot_audio_cache, is_safe_name, audio_etag, etag_matches, parse_range, MEDIA_TYPES
+)
+from backend.therapy_core import (
+    analyze_emotion, is_crisis, classify_turn, generate_response, stream_response, get_consent_text,
+    TurnClassification, CRISIS_REPLY, FIXED_REPLIES, classification_cache
+)
+from backend.evolution_core import enqueue_evolution, evolution_stats_snapshot
+from backend.job_queue import get_job_queue
+from backend.worker import WorkerPool
+from backend.llm_client import close_llm_client
+from backend.pipeline import StageScheduler
+from backend.metrics import ServerTimingMiddleware, latency_summary, record, render_metrics, span
+from backend.resilience import DeadlineMiddleware, run_blocking, stats as resilience_stats
+from backend.admission import Ticket, get_admission
+from backend.idempotency import get_turn_coalescer, new_audio_digest, turn_key
+from backend.context import SessionContext, get_context_builder
+from backend.refinement import refinement_stats
+from backend.emotion_model import emotion_stats, local_emotion
+from backend.crisis_lexicon import get_crisis_lexicon, lexicon_stats
+from backend.streaming import ReplyStreamer, text_stream
+from backend.uploads import (
+    BodyLimitMiddleware, PooledUpload, read_wav_upload, get_upload_pool, max_upload_bytes,
+    MULTIPART_OVERHEAD, upload_stats
+)
 
 # --- Logging Setup ---
 logging.basicConfig(level=logging.INFO)
@@ -24,10 +56,36 @@ logger = logging.getLogger("omani-therapist")
 
 settings = get_settings()
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Apply pending schema migrations before serving traffic
+    await asyncio.to_thread(migrate)
+    await get_conversation_writer().start()
+    if settings.TTS_CACHE_PREWARM:
+        # Fixed replies (crisis, fallbacks) must be instant; render them once, off the startup path
+        app.state.tts_prewarm = asyncio.create_task(run_blocking(get_tts_cache().prewarm, FIXED_REPLIES))
+    if settings.JOB_INPROCESS_WORKERS:
+        # Single-box deployments without a separate `python -m backend.worker`
+        app.state.job_workers = WorkerPool(concurrency=settings.JOB_INPROCESS_WORKERS)
+        await app.state.job_workers.start()
+    yield
+    if settings.JOB_INPROCESS_WORKERS:
+        await app.state.job_workers.stop()
+    # Drain queued turns before the process exits
+    await get_conversation_writer().stop()
+    logger.info("TTS cache stats: %s", get_tts_cache().stats())
+    logger.info("History cache stats: %s", get_history_store().stats())
+    logger.info("Audio store stats: %s", get_audio_store().stats())
+    # Release the pooled Gemini connections held by this worker
+    await close_llm_client()
+
+
 app = FastAPI(
     title="Omani Voice Therapist API",
     description="Privacy-first voice-only therapist for Omani Arabic speakers",
     version="1.0.0",
+    lifespan=lifespan,
 )
 
 # --- CORS Middleware ---
@@ -38,14 +96,20 @@ app.add_middleware(
     allow_methods=["POST", "GET", "OPTIONS"],
     allow_headers=["*"],
 )
+# Oversized uploads are refused while streaming in, before the multipart parser spools them
+app.add_middleware(
+    BodyLimitMiddleware,
+    max_bytes=max_upload_bytes() + MULTIPART_OVERHEAD,
+    paths=("/chat/", "/chat/stream/"),
+)
+# Each turn's Gemini calls (STT, classification, reply, TTS) share one end-to-end budget
+app.add_middleware(DeadlineMiddleware, seconds=settings.TURN_DEADLINE_S, paths=("/chat/", "/chat/stream/"))
+# Outermost: times the whole request and returns its stage breakdown in Server-Timing
+app.add_middleware(ServerTimingMiddleware)
 
-# --- Ensure Data Dirs Exist ---
-USER_DIR = os.path.join(settings.DATA_DIR, "user_inputs")
-BOT_DIR = os.path.join(settings.DATA_DIR, "bot_outputs")
-os.makedirs(USER_DIR, exist_ok=True)
-os.makedirs(BOT_DIR, exist_ok=True)
-
-MAX_AUDIO_MB = 5
+MAX_AUDIO_MB = settings.MAX_AUDIO_MB
+# Reply audio never changes once written
+AUDIO_CACHE_CONTROL = "private, max-age=3600"
 
 @app.post("/start_session/", response_model=StartSessionResponse, status_code=status.HTTP_201_CREATED)
 def start_session():
@@ -57,75 +121,236 @@ def start_session():
         consent_text=get_consent_text()
     )
 
-@app.post("/chat/", response_model=ChatResponse)
-async def chat(
-        session_id: Annotated[str, Form(...)],
-        audio: Annotated[UploadFile, File(...)]
-):
-    """Process a single voice chat turn."""
-    # --- Validate Audio Format and Size ---
-    if audio.content_type not in ("audio/wav", "audio/x-wav"):
-        logger.warning("Received unsupported audio format: %s", audio.content_type)
-        raise HTTPException(status_code=415, detail="Unsupported audio format")
-
-    # Limit file size (security & cost control)
-    audio_bytes = await audio.read()
-    if len(audio_bytes) > MAX_AUDIO_MB * 1024 * 1024:
-        logger.warning("Audio file too large: %.2f MB", len(audio_bytes)/1e6)
-        raise HTTPException(status_code=413, detail="Audio file too large (max 5MB)")
+async def _emotion_of(classification: TurnClassification) -> str:
+    return classification.emotion
+
+
+async def _crisis_of(classification: TurnClassification) -> bool:
+    return classification.crisis
+
+
+async def _lexicon_crisis() -> bool:
+    return True
+
+
+async def _offline_emotion(transcript: str) -> str:
+    # Lexicon-flagged turns make no model calls; label them locally when a model is trained
+    local = local_emotion(transcript)
+    return local[0] if local is not None else "محايد"
+
+
+async def _read_upload(session_id: str, audio: UploadFile, digest=None) -> Tuple[str, PooledUpload]:
+    """Validate the uploaded WAV while reading it, feeding `digest` if given. Returns (timestamp, upload)."""
+    # Header and size (security & cost control) are checked chunk by chunk; see backend/uploads.py
+    with span("read_upload"):
+        upload = await read_wav_upload(audio, get_upload_pool(), digest)
 
     timestamp = datetime.utcnow().strftime("%Y%m%d_%H%M%S")
-    user_filename = f"{session_id}_{timestamp}.wav"
-    user_path = os.path.join(USER_DIR, user_filename)
-    with open(user_path, "wb") as f:
-        f.write(audio_bytes)
+    return timestamp, upload
 
-    history = get_history(session_id)
 
-    # --- Transcribe ---
-    transcript = transcribe_audio(user_path)
+def _archive_audio(user_name: str, upload: PooledUpload) -> str:
+    """
+    Runs detached from the turn; the caller took a reference to `upload` for it, released here.
+    Returns the path written (its extension is the codec actually used), or '' on failure.
+    """
+    try:
+        with span("archive"):
+            return get_audio_store().write("user_inputs", user_name, upload.view)
+    except OSError as e:
+        logger.error("Failed to archive user audio %s: %s", user_name, e)
+        return ""
+    finally:
+        upload.release()
+
+
+def _prepare_for_stt(upload: PooledUpload) -> Optional[bytes]:
+    """16 kHz mono speech-trimmed clip for STT; the original if it can't be parsed; None if silent."""
+    if not upload.retain():
+        raise RuntimeError("Upload buffer released before preprocessing")
+    try:
+        if not settings.AUDIO_PREPROCESS:
+            return bytes(upload.view)
+        try:
+            result = preprocess_wav(upload.view)
+        except (wave.Error, EOFError, ValueError) as e:
+            logger.warning("Audio preprocessing skipped (unparseable WAV): %s", e)
+            return bytes(upload.view)
+        return result.wav if result.has_speech else None
+    finally:
+        upload.release()
+
+
+async def _transcribe(audio_bytes: bytes) -> str:
+    # STT blocks its thread, slot wait included: on the SDK pool, not the stages' default one
+    return await run_blocking(transcribe_audio_bytes, audio_bytes)
+
+
+async def _transcribe_and_classify(
+        stages: StageScheduler, session_id: str, upload: PooledUpload, user_name: str
+) -> Tuple[str, SessionContext, bool, "asyncio.Future[str]"]:
+    """
+    Schedule the shared front half of a turn. Returns (transcript, history, flagged, archived)
+    once STT is done; 'emotion', 'crisis' and 'user_insights' are left running on `stages`.
+    `flagged` means the local crisis lexicon matched: crisis is already known and no LLM call
+    was made. `archived` resolves to the path the upload was archived at, to log with the turn.
+    Takes over the caller's reference to `upload`.
+    """
+    try:
+        # STT reads the in-memory upload; archiving to disk runs alongside, off the turn's path
+        # (in the executor, so it neither waits for nor is cancelled with the turn's stages)
+        upload.retain()  # the archive's own reference; the request still holds one
+        archived = asyncio.get_running_loop().run_in_executor(None, _archive_audio, user_name, upload)
+        # --- Transcribe (history & insights are fetched meanwhile) ---
+        stages.add("history", get_history_store().get, session_id=session_id)
+        # Fetch user insights (using default_user for now as we don't have auth yet)
+        stages.add("user_insights", get_user_insights, user_id="default_user")
+        stt_audio = await stages.add("preprocess", _prepare_for_stt, upload=upload)
+    finally:
+        # The pooled buffer is recycled once the archive write is done with it too
+        upload.release()
+    if stt_audio is None:
+        logger.warning("No speech detected for session %s", session_id)
+        raise HTTPException(status_code=422, detail="No speech detected in audio")
+    transcript = await stages.add("transcript", _transcribe, audio_bytes=stt_audio)
     if not transcript:
         logger.error("Transcription failed for session %s", session_id)
         raise HTTPException(status_code=500, detail="Transcription failed")
 
-    # --- Emotion & Crisis Analysis ---
-    emotion = analyze_emotion(transcript, history)
-    crisis = is_crisis(transcript, emotion, history)
+    # History is rendered once here; each prompt stage takes its own token-budgeted window of it
+    history = get_context_builder().build(session_id, await stages.result("history"))
+
+    # --- Local crisis pre-screen (microseconds; a hit goes straight to the crisis reply) ---
+    if settings.CRISIS_LEXICON and get_crisis_lexicon().match(transcript):
+        stages.add("crisis", _lexicon_crisis)
+        stages.add("emotion", _offline_emotion, transcript=transcript)
+        return transcript, history, True, archived
 
-    # --- Response Generation ---
-    if crisis:
-        bot_text = "🚨 نلاحظ حالة نفسية حرجة، يُرجى التواصل مع مختص فورًا."
+    # --- Emotion & Crisis Analysis (concurrent, or one combined call) ---
+    if settings.CLASSIFIER_MODE == "combined":
+        stages.add("classification", classify_turn, transcript=transcript, history=history)
+        stages.add("emotion", _emotion_of, after=("classification",))
+        stages.add("crisis", _crisis_of, after=("classification",))
     else:
-        # Fetch user insights (using default_user for now as we don't have auth yet)
-        user_insights = get_user_insights("default_user")
-        bot_text = generate_response(
-            transcript, emotion, history,
-            user_insights=user_insights,
-            lang_hint="Omani Arabic",
-            code_switching=True
+        stages.add("emotion", analyze_emotion, transcript=transcript, history=history)
+        stages.add("crisis", is_crisis, transcript=transcript, history=history)
+    return transcript, history, False, archived
+
+
+@app.post("/chat/", response_model=ChatResponse, response_model_exclude_none=True)
+async def chat(
+        session_id: Annotated[str, Form(...)],
+        audio: Annotated[UploadFile, File(...)],
+        response: Response,
+        inline_audio: Annotated[bool, Form()] = False,
+        idempotency_key: Annotated[Optional[str], Header()] = None
+):
+    """
+    Process a single voice chat turn. With inline_audio=true the reply WAV is returned
+    base64-encoded in the response, saving the client the follow-up GET of bot_audio_url.
+    Under overload the turn waits for admission or is refused with 429/503 and Retry-After.
+    A resent turn (same Idempotency-Key header, or same session and audio) is not run again:
+    it shares the running turn's result, or gets the stored one, marked Idempotent-Replayed.
+    A keyed resend is answered before admission and without reading its upload.
+    """
+    variant = "inline" if inline_audio else "url"
+    coalescer = get_turn_coalescer()
+    if idempotency_key:
+        existing = await coalescer.attach(turn_key(session_id, idempotency_key, variant=variant))
+        if existing is not None:
+            return _replayed(response, existing[0])
+
+    ticket = await get_admission().enter(session_id)
+    started = False
+    upload = None
+    try:
+        # Read now: the turn runs detached and may outlive this request, and with it the form file
+        digest = None if idempotency_key else new_audio_digest()
+        timestamp, upload = await _read_upload(session_id, audio, digest)
+        key = turn_key(session_id, idempotency_key, digest.hexdigest() if digest else "", variant)
+
+        def start_turn():
+            nonlocal started
+            started = True
+            upload.retain()  # the turn's own reference; it takes over the ticket too
+            return _admitted_turn(session_id, timestamp, upload, ticket, inline_audio)
+
+        result, outcome = await coalescer.run(key, start_turn)
+    finally:
+        if upload is not None:
+            upload.release()
+        if not started:
+            ticket.release()
+    return result if outcome == "computed" else _replayed(response, result)
+
+
+def _replayed(response: Response, result: ChatResponse) -> ChatResponse:
+    response.headers["Idempotent-Replayed"] = "true"
+    return result
+
+
+async def _admitted_turn(
+        session_id: str, timestamp: str, upload: PooledUpload, ticket: Ticket, inline_audio: bool
+) -> ChatResponse:
+    """Runs detached from the request; takes over its admission ticket and a reference to `upload`."""
+    try:
+        return await _chat_turn(session_id, timestamp, upload, inline_audio)
+    finally:
+        ticket.release()
+
+
+async def _chat_turn(session_id: str, timestamp: str, upload: PooledUpload, inline_audio: bool) -> ChatResponse:
+    async with StageScheduler(f"chat:{session_id}") as stages:
+        transcript, history, flagged, archived = await _transcribe_and_classify(
+            stages, session_id, upload, f"{session_id}_{timestamp}"
         )
 
-    # --- Synthesize Bot Speech ---
-    tts_tmp = synthesize_speech(bot_text)
-    if not tts_tmp or not os.path.isfile(tts_tmp):
+        # --- Response Generation (speculative: starts before the crisis verdict) ---
+        if not flagged:
+            stages.add(
+                "reply", generate_response,
+                after=("emotion", "user_insights"),
+                transcript=transcript, history=history,
+                lang_hint="Omani Arabic",
+                code_switching=True
+            )
+
+        crisis = await stages.result("crisis")
+        emotion = await stages.result("emotion")
+        if crisis:
+            if not flagged:
+                # The lexicon missed this one; counted to help curate the phrase list
+                lexicon_stats["llm_only"] += 1
+                stages.cancel("reply")
+            bot_text = CRISIS_REPLY
+        else:
+            bot_text = await stages.result("reply")
+
+    # --- Synthesize Bot Speech (served from the TTS cache when already rendered) ---
+    with span("tts"):
+        tts_path = await run_blocking(get_tts_cache().get_or_synthesize, bot_text)
+    if not tts_path or not os.path.isfile(tts_path):
         logger.error("Speech synthesis failed for session %s", session_id)
         raise HTTPException(status_code=500, detail="Speech synthesis failed")
 
-    bot_filename = f"{session_id}_{timestamp}_reply.wav"
-    bot_path = os.path.join(BOT_DIR, bot_filename)
+    bot_name = f"{session_id}_{timestamp}_reply"
     try:
-        shutil.move(tts_tmp, bot_path)
+        with span("store_reply"):
+            reply_wav, bot_path = await asyncio.to_thread(_store_reply, bot_name, tts_path, not inline_audio)
     except Exception as e:
-        logger.exception("Failed to move TTS file from %s to %s", tts_tmp, bot_path)
+        logger.exception("Failed to store TTS file from %s as %s", tts_path, bot_name)
         raise HTTPException(status_code=500, detail="Internal file error")
 
     # --- Log Conversation Turn ---
     try:
-        log_conversation(
-            session_id, transcript, emotion,
-            bot_text, int(crisis),
-            user_path, bot_path
-        )
+        with span("log"):
+            user_path = await archived  # long done: it started with the turn
+            await get_conversation_writer().log(
+                session_id, transcript, emotion,
+                bot_text, int(crisis),
+                user_path, bot_path
+            )
+            get_history_store().record_turn(session_id, transcript, bot_text)
     except Exception as e:
         logger.warning("Logging failed for session %s: %s", session_id, e)
 
@@ -134,28 +359,212 @@ async def chat(
         transcript=transcript,
         emotion=emotion,
         crisis_flag=bool(crisis),
-        bot_audio_url=f"{settings.FRONTEND_URL}/api/audio/{session_id}/{timestamp}/"
+        bot_audio_url=f"{settings.FRONTEND_URL}/api/audio/{session_id}/{timestamp}/",
+        bot_audio=base64.b64encode(reply_wav).decode("ascii") if inline_audio else None,
+        bot_audio_mime="audio/wav" if inline_audio else None
     )
 
+def _store_reply(name: str, tts_path: str, hot: bool = True) -> Tuple[bytes, str]:
+    """Returns (reply WAV, path it was archived at)."""
+    # The client fetches the reply right away: serve it from memory, archive it alongside
+    with open(tts_path, "rb") as f:
+        wav = f.read()
+    if hot:
+        get_hot_audio_cache().put(name, wav)
+    return wav, get_audio_store().write_file("bot_outputs", name, tts_path)
+
+
+def _store_reply_bytes(name: str, wav: bytes) -> str:
+    get_hot_audio_cache().put(name, wav)
+    return get_audio_store().write("bot_outputs", name, wav)
+
+
+class _TurnStreamingResponse(StreamingResponse):
+    """Runs `on_close` however the response ends, even if the client left before the body started."""
+
+    def __init__(self, content, on_close: Callable[[], Awaitable[None]], **kwargs):
+        super().__init__(content, **kwargs)
+        self.on_close = on_close
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            await self.on_close()
+
+
+def _event(kind: str, **fields) -> bytes:
+    return (json.dumps({"type": kind, **fields}, ensure_ascii=False) + "\n").encode("utf-8")
+
+
+@app.post("/chat/stream/")
+async def chat_stream(
+        session_id: Annotated[str, Form(...)],
+        audio: Annotated[UploadFile, File(...)]
+):
+    """
+    Streaming variant of /chat/ (NDJSON over chunked HTTP). The reply is synthesized
+    sentence by sentence while Gemini is still generating, and each sentence's audio is
+    sent as soon as it is ready, in order. Events:
+      meta  {transcript, emotion, crisis_flag}
+      audio {seq, text, audio: base64 WAV}
+      done  {bot_audio_url}   or   error {detail}
+    The full reply is still stored in bot_outputs and logged like a /chat/ turn.
+    Admission works as for /chat/; the turn holds its slot until the stream ends.
+    """
+    ticket = await get_admission().enter(session_id)
+    stages = StageScheduler(f"chat-stream:{session_id}")
+    try:
+        timestamp, upload = await _read_upload(session_id, audio)
+        transcript, history, flagged, archived = await _transcribe_and_classify(
+            stages, session_id, upload, f"{session_id}_{timestamp}"
+        )
+    except BaseException:
+        await stages.cancel_pending()
+        ticket.release()
+        raise
+
+    tts_cache = get_tts_cache()
+
+    async def events():
+        streamer = None
+        started = time.perf_counter()
+        try:
+            emotion = await stages.result("emotion")
+            user_insights = await stages.result("user_insights")
+            # Speculative: LLM + TTS start before the crisis verdict; nothing is sent until it is known.
+            if not flagged:
+                streamer = ReplyStreamer(
+                    stream_response(transcript, emotion, history, user_insights), tts_cache.get_or_synthesize_pcm
+                ).start()
+            crisis = await stages.result("crisis")
+            yield _event("meta", transcript=transcript, emotion=emotion, crisis_flag=bool(crisis))
+            if crisis:
+                if streamer is not None:
+                    await streamer.cancel()
+                    lexicon_stats["llm_only"] += 1
+                streamer = ReplyStreamer(text_stream(CRISIS_REPLY), tts_cache.get_or_synthesize_pcm).start()
+
+            sentences, pcm_parts = [], []
+            async for sentence, pcm in streamer:
+                if not sentences:
+                    record("first_audio", time.perf_counter() - started)
+                yield _event(
+                    "audio", seq=len(sentences), text=sentence,
+                    audio=base64.b64encode(wav_bytes(pcm)).decode("ascii")
+                )
+                sentences.append(sentence)
+                pcm_parts.append(pcm)
+            if not pcm_parts:
+                logger.error("Speech synthesis failed for session %s", session_id)
+                yield _event("error", detail="Speech synthesis failed")
+                return
+
+            # --- Store full reply & Log Conversation Turn ---
+            bot_text = " ".join(sentences)
+            bot_name = f"{session_id}_{timestamp}_reply"
+            bot_path = await asyncio.to_thread(_store_reply_bytes, bot_name, wav_bytes(b"".join(pcm_parts)))
+            user_path = await archived
+            try:
+                await get_conversation_writer().log(
+                    session_id, transcript, emotion,
+                    bot_text, int(crisis),
+                    user_path, bot_path
+                )
+                get_history_store().record_turn(session_id, transcript, bot_text)
+            except Exception as e:
+                logger.warning("Logging failed for session %s: %s", session_id, e)
+
+            yield _event("done", bot_audio_url=f"{settings.FRONTEND_URL}/api/audio/{session_id}/{timestamp}/")
+        finally:
+            if streamer is not None:
+                await streamer.cancel()
+            await stages.cancel_pending()
+
+    async def close_turn():
+        await stages.cancel_pending()
+        ticket.release()
+
+    return _TurnStreamingResponse(events(), close_turn, media_type="application/x-ndjson")
+
+
 @app.get("/audio/{session_id}/{timestamp}/")
-def serve_audio(session_id: str, timestamp: str):
-    """Serve bot audio for playback."""
-    bot_filename = f"{session_id}_{timestamp}_reply.wav"
-    path = os.path.join(BOT_DIR, bot_filename)
-    if not os.path.isfile(path):
-        logger.warning("Audio not found: %s", path)
+def serve_audio(session_id: str, timestamp: str, request: Request):
+    """Serve bot audio for playback (ETag revalidation and byte ranges supported)."""
+    name = f"{session_id}_{timestamp}_reply"
+    if not is_safe_name(name):
         raise HTTPException(status_code=404, detail="Audio not found")
-    return FileResponse(path, media_type="audio/wav")
+    headers = {"cache-control": AUDIO_CACHE_CONTROL}
 
+    cached = get_hot_audio_cache().get(name)
+    if cached is not None:
+        data, etag = cached
+        headers.update({"etag": etag, "accept-ranges": "bytes"})
+        if etag_matches(request.headers.get("if-none-match"), etag):
+            return Response(status_code=304, headers=headers)
+        try:
+            byte_range = parse_range(request.headers.get("range"), len(data))
+        except ValueError:
+            return Response(status_code=416, headers={"content-range": f"bytes */{len(data)}"})
+        if byte_range is None:
+            return Response(data, media_type="audio/wav", headers=headers)
+        start, end = byte_range
+        headers["content-range"] = f"bytes {start}-{end}/{len(data)}"
+        return Response(data[start:end + 1], status_code=206, media_type="audio/wav", headers=headers)
+
+    path = get_audio_store().locate("bot_outputs", name)
+    if path is None:
+        logger.warning("Audio not found: %s", name)
+        raise HTTPException(status_code=404, detail="Audio not found")
+    st = os.stat(path)
+    headers["etag"] = audio_etag(name)
+    if etag_matches(request.headers.get("if-none-match"), headers["etag"]):
+        return Response(status_code=304, headers=headers)
+    # FileResponse answers Range requests itself
+    media_type = MEDIA_TYPES[os.path.splitext(path)[1]]
+    return FileResponse(path, media_type=media_type, headers=headers, stat_result=st)
 
-from fastapi import BackgroundTasks
 
 @app.post("/end_session/")
-def end_session(session_id: str = Form(...), background_tasks: BackgroundTasks = BackgroundTasks()):
+async def end_session(session_id: str = Form(...)):
     """
-    End the session and trigger self-evolution analysis in the background.
+    End the session and queue self-evolution analysis for the background worker.
     """
     logger.info(f"Ending session {session_id} and triggering evolution.")
-    background_tasks.add_task(analyze_session_for_insights, session_id, "default_user")
+    # No flush here: the job runs EVOLUTION_DEBOUNCE_S later, long after the write-behind
+    # queue has written the session's last turns (and a later run picks up any stragglers).
+    # Durable: survives restarts and is retried by backend.worker. Session ends of the
+    # same user close together are coalesced into one run.
+    await asyncio.to_thread(enqueue_evolution, session_id, "default_user")
     return {"status": "ok", "message": "Session ended, evolution triggered."}
 
+
+@app.get("/stats/")
+def stats():
+    """Runtime counters for tuning the caches and the write-behind logger."""
+    return {
+        "log_writer": get_conversation_writer().stats(),
+        "history_cache": get_history_store().stats(),
+        "tts_cache": get_tts_cache().stats(),
+        "refinement": refinement_stats.stats(),
+        "emotion_backend": {"backend": settings.EMOTION_BACKEND, **emotion_stats},
+        "crisis_lexicon": dict(lexicon_stats),
+        "evolution": evolution_stats_snapshot(),
+        "jobs": get_job_queue().stats(),
+        "classification_cache": classification_cache.stats(),
+        "audio_preprocess": dict(preprocess_stats),
+        "uploads": {**upload_stats, **get_upload_pool().stats()},
+        "audio_store": get_audio_store().stats(),
+        "hot_audio_cache": get_hot_audio_cache().stats(),
+        "latency": latency_summary(),
+        "resilience": resilience_stats(),
+        "admission": get_admission().stats(),
+        "idempotency": get_turn_coalescer().stats(),
+    }
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    """Stage latency histograms and error/retry counters in Prometheus text format."""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
@@ -0,0 +1,253 @@
+# backend/metrics.py
+"""
+Lightweight in-process metrics and per-request tracing.
+
+Stage timings go into fixed-bucket histograms (count, sum, cumulative buckets) and
+error/retry counters labelled by stage, rendered in Prometheus text format on /metrics.
+A request's own spans are collected on a contextvar-bound Trace (inherited by tasks and
+to_thread workers) and sent back in the Server-Timing header by ServerTimingMiddleware.
+Recording is a bisect plus a few integer adds under a lock: cheap enough to leave on.
+"""
+import time
+import bisect
+import asyncio
+import logging
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+from backend.config import get_settings
+
+settings = get_settings()
+logger = logging.getLogger("metrics")
+logger.setLevel(logging.INFO)
+
+PREFIX = "omani"
+# Seconds; spans 1 ms (cache hits, DB reads) to 30 s (slow STT/LLM calls)
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class Histogram:
+    """Fixed-bucket histogram family with one label."""
+
+    def __init__(self, name: str, help: str, label: str, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = f"{PREFIX}_{name}"
+        self.help = help
+        self.label = label
+        self.buckets = tuple(buckets)
+        self._series: Dict[str, List] = {}  # label value -> [bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value: str, seconds: float) -> None:
+        i = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            series = self._series.get(value)
+            if series is None:
+                series = self._series[value] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[i] += 1
+            series[-1] += seconds
+
+    def quantile(self, value: str, q: float) -> float:
+        """Estimated quantile (linear within the bucket, like PromQL's histogram_quantile)."""
+        with self._lock:
+            series = list(self._series.get(value, ()))
+        if not series:
+            return 0.0
+        counts = series[:-1]
+        rank = q * sum(counts)
+        seen = 0
+        for i, count in enumerate(counts):
+            if count and seen + count >= rank:
+                if i == len(self.buckets):
+                    return self.buckets[-1]
+                lower = self.buckets[i - 1] if i else 0.0
+                return lower + (self.buckets[i] - lower) * (rank - seen) / count
+            seen += count
+        return self.buckets[-1]
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            snapshot = {value: list(series) for value, series in self._series.items()}
+        return {
+            value: {
+                "count": sum(series[:-1]),
+                "avg_ms": series[-1] / sum(series[:-1]) * 1000,
+                **{f"p{int(q * 100)}_ms": self.quantile(value, q) * 1000 for q in (0.5, 0.95, 0.99)},
+            }
+            for value, series in snapshot.items()
+        }
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            snapshot = sorted((value, list(series)) for value, series in self._series.items())
+        for value, series in snapshot:
+            label = f'{self.label}="{_escape(value)}"'
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), series[:-1]):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f'{self.name}_bucket{{{label},le="{le}"}} {cumulative}')
+            lines.append(f"{self.name}_sum{{{label}}} {series[-1]}")
+            lines.append(f"{self.name}_count{{{label}}} {cumulative}")
+        return lines
+
+
+class LabelledCounter:
+    """Monotonic counter family with one label."""
+
+    def __init__(self, name: str, help: str, label: str):
+        self.name = f"{PREFIX}_{name}"
+        self.help = help
+        self.label = label
+        self._values: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, value: str, amount: int = 1) -> None:
+        with self._lock:
+            self._values[value] = self._values.get(value, 0) + amount
+
+    def values(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._values)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for value, count in sorted(self.values().items()):
+            lines.append(f'{self.name}{{{self.label}="{_escape(value)}"}} {count}')
+        return lines
+
+
+stage_seconds = Histogram("stage_duration_seconds", "Chat pipeline stage latency.", "stage")
+stage_errors = LabelledCounter("stage_errors_total", "Chat pipeline stages that raised or failed.", "stage")
+stage_retries = LabelledCounter("stage_retries_total", "Retried attempts within a stage (STT, TTS).", "stage")
+llm_seconds = Histogram("llm_call_duration_seconds", "Gemini generateContent latency by calling stage.", "stage")
+llm_errors = LabelledCounter("llm_call_errors_total", "Gemini calls that returned no text, by calling stage.", "stage")
+request_seconds = Histogram("http_request_duration_seconds", "HTTP request latency by route.", "route")
+admission_seconds = Histogram(
+    "admission_wait_seconds", "Time chat turns waited for admission, by outcome (admitted, rejected).", "outcome"
+)
+
+REGISTRY = (stage_seconds, stage_errors, stage_retries, llm_seconds, llm_errors, request_seconds, admission_seconds)
+
+
+# --- Tracing ---
+class Trace:
+    """Spans of one request, in completion order: (stage, seconds)."""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.spans: List[Tuple[str, float]] = []
+
+    def server_timing(self) -> str:
+        parts = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in self.spans]
+        parts.append(f"total;dur={(time.perf_counter() - self.start) * 1000:.1f}")
+        return ", ".join(parts)
+
+
+current_trace: ContextVar[Optional[Trace]] = ContextVar("current_trace", default=None)
+current_stage: ContextVar[str] = ContextVar("current_stage", default="other")
+
+
+def record(stage: str, seconds: float, error: bool = False) -> None:
+    """Record a finished stage in the histograms and the current request's trace."""
+    if not settings.METRICS_ENABLED:
+        return
+    stage_seconds.observe(stage, seconds)
+    if error:
+        stage_errors.inc(stage)
+    trace = current_trace.get()
+    if trace is not None:
+        trace.spans.append((stage, seconds))
+
+
+def record_retry(stage: str) -> None:
+    if settings.METRICS_ENABLED:
+        stage_retries.inc(stage)
+
+
+def record_admission_wait(outcome: str, seconds: float) -> None:
+    """Admission queue wait: its own histogram, and a `queue` span in the request's trace."""
+    if not settings.METRICS_ENABLED:
+        return
+    admission_seconds.observe(outcome, seconds)
+    trace = current_trace.get()
+    if trace is not None:
+        trace.spans.append(("queue", seconds))
+
+
+@contextmanager
+def span(stage: str) -> Iterator[None]:
+    """
+    Time a block as `stage`; an exception counts as a stage error, cancellation is not recorded.
+    LLM calls made inside are labelled with `stage`. Usable in sync and async code.
+    """
+    token = current_stage.set(stage)
+    start = time.perf_counter()
+    outcome = "ok"
+    try:
+        yield
+    except (asyncio.CancelledError, GeneratorExit):
+        outcome = "cancelled"
+        raise
+    except BaseException:
+        outcome = "error"
+        raise
+    finally:
+        current_stage.reset(token)
+        if outcome != "cancelled":
+            record(stage, time.perf_counter() - start, outcome == "error")
+
+
+def render_metrics() -> str:
+    lines: List[str] = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+def latency_summary() -> Dict[str, Dict[str, Dict[str, float]]]:
+    """p50/p95/p99 per stage, for /stats/."""
+    return {
+        "stages": stage_seconds.summary(),
+        "llm_calls": llm_seconds.summary(),
+        "errors": stage_errors.values(),
+        "retries": stage_retries.values(),
+        "admission_wait": admission_seconds.summary(),
+    }
+
+
+class ServerTimingMiddleware:
+    """
+    Pure ASGI middleware: binds a Trace to each HTTP request, adds its spans as a
+    Server-Timing header when the response starts, and records request latency by route.
+    Streaming responses report the stages finished before the first byte.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not settings.METRICS_ENABLED:
+            return await self.app(scope, receive, send)
+        trace = Trace()
+        token = current_trace.set(trace)
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start" and settings.SERVER_TIMING:
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", trace.server_timing().encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            current_trace.reset(token)
+            route = scope.get("route")
+            request_seconds.observe(getattr(route, "path", "unmatched"), time.perf_counter() - trace.start)
@@ -15,6 +15,8 @@ class ChatResponse(BaseModel):
     emotion: str = Field(..., description="Detected emotion label (e.g. 'حزن')")
     crisis_flag: bool = Field(..., description="True if a crisis is detected")
     bot_audio_url: HttpUrl = Field(..., description="URL for the bot reply audio")
+    bot_audio: Optional[str] = Field(None, description="Base64 reply audio, when requested with inline_audio")
+    bot_audio_mime: Optional[str] = Field(None, description="Media type of bot_audio (e.g. 'audio/wav')")
 
 class ErrorResponse(BaseModel):
     detail: str = Field(..., description="Error details for client display")
@@ -0,0 +1,69 @@
+# backend/pipeline.py
+
+import asyncio
+import inspect
+import logging
+from typing import Any, Callable, Dict, Iterable
+
+from backend.metrics import span
+
+logger = logging.getLogger("pipeline")
+logger.setLevel(logging.INFO)
+
+
+class StageScheduler:
+    """
+    Minimal DAG scheduler for one chat turn.
+
+    Each stage starts as soon as the stages it depends on have finished; their results
+    are passed to it as keyword arguments named after those stages. Coroutine functions
+    are awaited on the event loop, plain functions run in the default thread pool. Used
+    as an async context manager so that any stage still pending when the turn ends
+    (error, early return, discarded speculation) is cancelled instead of leaking.
+    Each stage's own run time (not its wait for dependencies) is recorded under its name.
+    """
+
+    def __init__(self, name: str = "turn"):
+        self.name = name
+        self._tasks: Dict[str, asyncio.Task] = {}
+
+    async def __aenter__(self) -> "StageScheduler":
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        await self.cancel_pending()
+
+    def add(self, name: str, fn: Callable[..., Any], after: Iterable[str] = (), **kwargs) -> asyncio.Task:
+        """Schedule `fn(**{dep: result_of(dep) for dep in after}, **kwargs)` under `name`."""
+        if name in self._tasks:
+            raise ValueError(f"Stage '{name}' already scheduled")
+        deps = {d: self._tasks[d] for d in after}
+
+        async def _run():
+            for d, task in deps.items():
+                kwargs[d] = await task
+            with span(name):
+                if inspect.iscoroutinefunction(fn):
+                    return await fn(**kwargs)
+                return await asyncio.to_thread(fn, **kwargs)
+
+        task = asyncio.create_task(_run(), name=f"{self.name}:{name}")
+        self._tasks[name] = task
+        return task
+
+    async def result(self, name: str) -> Any:
+        return await self._tasks[name]
+
+    def cancel(self, name: str) -> None:
+        """Abandon a (speculative) stage; its result, if any, is discarded."""
+        task = self._tasks.get(name)
+        if task is not None and not task.done():
+            task.cancel()
+            logger.info(f"[Pipeline] {self.name}: cancelled stage '{name}'")
+
+    async def cancel_pending(self) -> None:
+        pending = [t for t in self._tasks.values() if not t.done()]
+        for t in pending:
+            t.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
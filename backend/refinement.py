@@ -0,0 +1,93 @@
+# backend/refinement.py
+
+import re
+import logging
+import threading
+from collections import Counter
+from typing import Dict, Tuple
+
+from backend.config import get_settings
+
+settings = get_settings()
+logger = logging.getLogger("refinement")
+logger.setLevel(logging.INFO)
+
+_ARABIC_LETTER = re.compile(r"[ء-يٱ-ۓ]")
+_LATIN_LETTER = re.compile(r"[A-Za-z]")
+_DIACRITICS = re.compile(r"[ً-ْـ]")  # harakat + tatweel
+
+# Gulf/Omani colloquial markers: at least one suggests the draft is already in dialect
+DIALECT_MARKERS = (
+    "وايد", "واجد", "زين", "شي", "ايش", "إيش", "ليش", "عشان", "علشان", "الحين", "ذحين", "هني",
+    "تبا", "تبغى", "تبي", "ابغى", "أبغى", "عاد", "كذا", "جذي", "مب", "مو", "خلاص", "يعني", "بس",
+)
+# Constructions typical of MSA and rare in spoken Omani: any of them means a rewrite is worthwhile
+MSA_MARKERS = (
+    "سوف", "لن", "لم", "ليس", "لست", "إن", "الذي", "التي", "الذين", "لذلك", "حيث", "ينبغي",
+    "يجب عليك", "بالإضافة إلى", "علاوة على", "ماذا", "لماذا", "هكذا", "كذلك",
+)
+
+
+def _words(text: str):
+    return set(_DIACRITICS.sub("", text).replace("،", " ").replace(".", " ").split())
+
+
+def needs_refinement(draft: str) -> Tuple[bool, str]:
+    """
+    Cheap local check of whether the evaluator rewrite is likely to help.
+    Returns (needs_rewrite, reason).
+    """
+    text = draft.strip()
+    if len(text) > settings.REFINE_SKIP_MAX_CHARS:
+        return True, "long"
+    arabic = len(_ARABIC_LETTER.findall(text))
+    latin = len(_LATIN_LETTER.findall(text))
+    if arabic == 0 or arabic / (arabic + latin) < settings.REFINE_MIN_ARABIC_RATIO:
+        return True, "script"
+    words = _words(text)
+    if any(marker in words if " " not in marker else marker in text for marker in MSA_MARKERS):
+        return True, "msa"
+    if not any(marker in words for marker in DIALECT_MARKERS):
+        return True, "no_dialect"
+    return False, "dialect_ok"
+
+
+class RefinementStats:
+    """Per-process record of evaluator decisions, to weigh latency saved against rewrite rate."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.decisions: Counter = Counter()   # refined / skipped / deadline_expired / failed
+        self.reasons: Counter = Counter()     # heuristic reasons and policy names
+        self.rewritten = 0
+        self.evaluator_s = 0.0                # time spent in completed evaluator calls
+        self.abandoned_s = 0.0                # time spent before giving up (deadline/failure)
+
+    def record(self, decision: str, reason: str, elapsed_s: float = 0.0, changed: bool = False) -> None:
+        with self._lock:
+            self.decisions[decision] += 1
+            self.reasons[reason] += 1
+            if decision == "refined":
+                self.evaluator_s += elapsed_s
+                self.rewritten += int(changed)
+            else:
+                self.abandoned_s += elapsed_s
+        logger.info(f"[Refine] {decision} ({reason}) in {elapsed_s:.2f}s{' rewritten' if changed else ''}")
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            refined = self.decisions["refined"]
+            avg = self.evaluator_s / refined if refined else 0.0
+            saved = self.decisions["skipped"] * avg
+            return {
+                "policy": settings.REFINE_POLICY,
+                **{f"decision_{k}": v for k, v in self.decisions.items()},
+                **{f"reason_{k}": v for k, v in self.reasons.items()},
+                "rewrite_rate": self.rewritten / refined if refined else 0.0,
+                "evaluator_avg_s": avg,
+                "estimated_saved_s": saved,
+                "abandoned_s": self.abandoned_s,
+            }
+
+
+refinement_stats = RefinementStats()
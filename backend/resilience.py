@@ -0,0 +1,469 @@
+# backend/resilience.py
+"""
+Shared failure handling for every Gemini call (text, STT, TTS).
+
+- Deadline: an end-to-end budget bound to a contextvar, so pipeline stage tasks and
+  to_thread workers inherit it. Each attempt is cut to the time left, and a retry whose
+  backoff would overrun the budget is not started.
+- Retries: exponential backoff with full jitter, and only for errors that may clear up
+  (timeouts, transport errors, 408/429/5xx). Other errors, such as 400 or 403, fail at once.
+- Circuit breaker per model: after CIRCUIT_FAILURES consecutive retryable failures, calls
+  fail fast for CIRCUIT_RESET_S. One trial call then decides whether the circuit closes.
+- Concurrency: at most GEMINI_MAX_CONCURRENCY calls in flight per model; further calls
+  wait for a slot within their deadline (or fail with UpstreamBusy, not counted as an outage).
+- Hedging (optional): a second copy of a short call starts if the first has not answered
+  within `hedge_after_s`. The first success wins and the other copy is cancelled.
+- Blocking SDK calls (STT, TTS) run on their own thread pool (run_blocking): a thread waiting
+  for a call slot never holds up the default executor's DB and preprocessing work.
+
+Callers keep their own fallbacks: a failure ends as the usual '' / b'' / fallback reply.
+"""
+import time
+import random
+import asyncio
+import logging
+import threading
+import contextvars
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
+from collections import Counter, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Awaitable, Callable, Deque, Dict, Iterator, Optional, Tuple, TypeVar
+
+import httpx
+
+from backend.config import get_settings
+from backend.metrics import record_retry
+
+settings = get_settings()
+logger = logging.getLogger("resilience")
+logger.setLevel(logging.INFO)
+
+T = TypeVar("T")
+
+RETRYABLE_STATUS = frozenset({408, 429, 500, 502, 503, 504})
+
+# retries / gave_up / not_retryable / deadline_exceeded / short_circuited / busy / hedges / hedge_wins
+resilience_stats: Counter = Counter()
+
+
+class UpstreamError(Exception):
+    """Non-200 answer from Gemini; `code` is the HTTP status (like google.genai.errors.APIError)."""
+
+    def __init__(self, code: int, detail: str = ""):
+        super().__init__(f"{code}: {detail[:200]}")
+        self.code = code
+
+
+class DeadlineExceeded(Exception):
+    """The request's time budget ran out before the call could be (re)tried."""
+
+
+class CircuitOpenError(Exception):
+    """The model's circuit is open: failing fast instead of calling it."""
+
+
+class UpstreamBusy(Exception):
+    """No call slot for the model freed up within the time available."""
+
+
+def is_retryable(exc: BaseException) -> bool:
+    if isinstance(exc, (DeadlineExceeded, CircuitOpenError, UpstreamBusy)):
+        return False
+    if isinstance(exc, httpx.HTTPStatusError):
+        return exc.response.status_code in RETRYABLE_STATUS
+    code = getattr(exc, "code", None)
+    if isinstance(code, int):
+        return code in RETRYABLE_STATUS
+    return isinstance(exc, (httpx.TransportError, asyncio.TimeoutError, TimeoutError, ConnectionError))
+
+
+# --- Deadline ---
+_deadline: ContextVar[Optional[float]] = ContextVar("deadline", default=None)
+
+
+def deadline_after(seconds: float) -> Optional[float]:
+    """Absolute (monotonic) deadline `seconds` from now, never later than the current one. 0: none."""
+    current = _deadline.get()
+    if not seconds:
+        return current
+    at = time.monotonic() + seconds
+    return at if current is None else min(at, current)
+
+
+@contextmanager
+def bind_deadline(at: Optional[float]) -> Iterator[None]:
+    """Apply deadline `at` to the enclosed code and everything it starts."""
+    token = _deadline.set(at)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining() -> Optional[float]:
+    """Seconds left in the current budget, or None when unbounded."""
+    at = _deadline.get()
+    return None if at is None else at - time.monotonic()
+
+
+def attempt_timeout() -> float:
+    """Time allowed for the next attempt: GEMINI_TIMEOUT_S, capped by the budget."""
+    left = remaining()
+    if left is None:
+        return settings.GEMINI_TIMEOUT_S
+    if left <= 0:
+        resilience_stats["deadline_exceeded"] += 1
+        raise DeadlineExceeded("request deadline exceeded")
+    return min(settings.GEMINI_TIMEOUT_S, left)
+
+
+class DeadlineMiddleware:
+    """
+    Pure ASGI middleware binding a fresh `seconds` budget to each request on `paths`, so every
+    Gemini call a chat turn makes, streamed reply included, draws on the same deadline.
+    """
+
+    def __init__(self, app, seconds: float, paths: Tuple[str, ...]):
+        self.app = app
+        self.seconds = seconds
+        self.paths = paths
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] not in self.paths or not self.seconds:
+            return await self.app(scope, receive, send)
+        with bind_deadline(deadline_after(self.seconds)):
+            await self.app(scope, receive, send)
+
+
+# --- Circuit breaker ---
+class CircuitBreaker:
+    """Closed -> open after `failures` consecutive failures -> half-open after `reset_s` (one trial call)."""
+
+    def __init__(self, name: str, failures: int = 0, reset_s: float = 0):
+        self.name = name
+        self.failures = failures or settings.CIRCUIT_FAILURES
+        self.reset_s = reset_s or settings.CIRCUIT_RESET_S
+        self.state = "closed"
+        self.opened = 0
+        self._consecutive = 0
+        self._changed_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        now = time.monotonic()
+        with self._lock:
+            if self.state == "closed":
+                return True
+            # Open: wait out reset_s. Half-open: one trial at a time (a lost trial is replaced after reset_s).
+            if now - self._changed_at < self.reset_s:
+                return False
+            self.state = "half_open"
+            self._changed_at = now
+            return True
+
+    def success(self) -> None:
+        with self._lock:
+            if self.state != "closed":
+                logger.info(f"[Circuit] {self.name} closed")
+            self.state = "closed"
+            self._consecutive = 0
+
+    def failure(self) -> None:
+        with self._lock:
+            self._consecutive += 1
+            if self.state == "half_open" or (self.state == "closed" and self._consecutive >= self.failures):
+                self.state = "open"
+                self._changed_at = time.monotonic()
+                self.opened += 1
+                logger.warning(f"[Circuit] {self.name} opened after {self._consecutive} failures; "
+                               f"failing fast for {self.reset_s:.0f}s")
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            return {"state": self.state, "consecutive_failures": self._consecutive, "opened": self.opened}
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(model: str) -> CircuitBreaker:
+    """Process-wide circuit breaker of a model."""
+    with _breakers_lock:
+        breaker = _breakers.get(model)
+        if breaker is None:
+            breaker = _breakers[model] = CircuitBreaker(model)
+        return breaker
+
+
+# --- Per-model concurrency ---
+class CallSlots:
+    """
+    Semaphore shared by event-loop callers (text calls) and worker threads (STT/TTS SDK calls).
+    Waiters are served in arrival order; a released slot is handed straight to the next one.
+    """
+
+    def __init__(self, name: str, limit: int):
+        self.name = name
+        self.limit = limit
+        self._lock = threading.Lock()
+        self._in_use = 0
+        # (loop, future) for async waiters, (None, threading.Event) for threads
+        self._waiters: Deque[Tuple[Optional[asyncio.AbstractEventLoop], object]] = deque()
+        # --- metrics ---
+        self.peak_in_use = 0
+        self.waited = 0
+        self.timeouts = 0
+
+    def _take(self) -> bool:
+        if self.limit and self._in_use >= self.limit:
+            return False
+        self._in_use += 1
+        self.peak_in_use = max(self.peak_in_use, self._in_use)
+        return True
+
+    def _busy(self, timeout: float) -> UpstreamBusy:
+        with self._lock:
+            self.timeouts += 1
+        resilience_stats["busy"] += 1
+        return UpstreamBusy(f"no free {self.name} call slot within {timeout:.2f}s")
+
+    async def acquire(self, timeout: float) -> float:
+        """Take a slot, waiting at most `timeout`. Returns the seconds waited."""
+        with self._lock:
+            if self._take():
+                return 0.0
+            loop = asyncio.get_running_loop()
+            waiter = loop.create_future()
+            entry = (loop, waiter)
+            self._waiters.append(entry)
+            self.waited += 1
+        start = time.monotonic()
+        try:
+            await asyncio.wait_for(waiter, timeout)
+        except asyncio.TimeoutError:
+            raise self._busy(timeout)
+        except BaseException:
+            if waiter.done() and not waiter.cancelled():
+                self.release()
+            raise
+        return time.monotonic() - start
+
+    def acquire_sync(self, timeout: float) -> float:
+        """Blocking acquire for worker threads. Returns the seconds waited."""
+        with self._lock:
+            if self._take():
+                return 0.0
+            entry = (None, threading.Event())
+            self._waiters.append(entry)
+            self.waited += 1
+        start = time.monotonic()
+        if not entry[1].wait(timeout):
+            with self._lock:
+                handed_over = entry[1].is_set()  # a slot may have arrived just now
+                if not handed_over:
+                    self._waiters.remove(entry)
+            if not handed_over:
+                raise self._busy(timeout)
+        return time.monotonic() - start
+
+    def release(self) -> None:
+        with self._lock:
+            while self._waiters:
+                loop, waiter = self._waiters.popleft()
+                if loop is None:
+                    waiter.set()
+                    return
+                if waiter.done():
+                    continue
+                try:
+                    loop.call_soon_threadsafe(self._hand_over, waiter)
+                    return
+                except RuntimeError:
+                    continue  # the waiter's loop is closed
+            self._in_use -= 1
+
+    def _hand_over(self, waiter: asyncio.Future) -> None:
+        # Runs on the waiter's loop; the slot counts as in use while in transit
+        if waiter.done():  # timed out or cancelled meanwhile: pass it on
+            self.release()
+            return
+        waiter.set_result(None)
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            return {
+                "limit": self.limit,
+                "in_use": self._in_use,
+                "peak_in_use": self.peak_in_use,
+                "waiting": len(self._waiters),
+                "waited": self.waited,
+                "wait_timeouts": self.timeouts,
+            }
+
+
+_slots: Dict[str, CallSlots] = {}
+
+
+def get_call_slots(model: str) -> CallSlots:
+    """Process-wide call slots of a model (GEMINI_MAX_CONCURRENCY each)."""
+    with _breakers_lock:
+        slots = _slots.get(model)
+        if slots is None:
+            slots = _slots[model] = CallSlots(model, settings.GEMINI_MAX_CONCURRENCY)
+        return slots
+
+
+# --- Blocking SDK calls ---
+_sdk_executor: Optional[ThreadPoolExecutor] = None
+
+
+def get_sdk_executor() -> ThreadPoolExecutor:
+    """Process-wide pool for blocking SDK calls (GEMINI_SDK_THREADS threads)."""
+    global _sdk_executor
+    with _breakers_lock:
+        if _sdk_executor is None:
+            _sdk_executor = ThreadPoolExecutor(settings.GEMINI_SDK_THREADS, thread_name_prefix="gemini-sdk")
+        return _sdk_executor
+
+
+async def run_blocking(fn: Callable[..., T], *args, **kwargs) -> T:
+    """
+    asyncio.to_thread for functions making call_sync calls: same context (deadline, trace),
+    but on the SDK pool, so their waits for a call slot block none of the default pool's threads.
+    """
+    loop = asyncio.get_running_loop()
+    call = partial(contextvars.copy_context().run, fn, *args, **kwargs)
+    return await loop.run_in_executor(get_sdk_executor(), call)
+
+
+# --- Retry loop ---
+def backoff(attempt: int) -> float:
+    """Full-jitter exponential delay after failed attempt number `attempt`."""
+    return random.uniform(0, min(settings.GEMINI_BACKOFF_MAX_S, settings.GEMINI_BACKOFF_BASE_S * 2 ** (attempt - 1)))
+
+
+def _begin_attempt(breaker: CircuitBreaker, slots: CallSlots, timeout: float) -> None:
+    """Checks made once a slot is held; the slot is given back if the attempt may not start."""
+    if timeout <= 0:
+        slots.release()
+        resilience_stats["deadline_exceeded"] += 1
+        raise DeadlineExceeded("request deadline exceeded while waiting for a call slot")
+    if not breaker.allow():
+        slots.release()
+        resilience_stats["short_circuited"] += 1
+        raise CircuitOpenError(f"circuit open for {breaker.name}")
+
+
+def _retry_delay(breaker: CircuitBreaker, exc: Exception, attempt: int, label: str) -> float:
+    """Record a failed attempt; returns the delay before the next one, or re-raises `exc` to give up."""
+    if not is_retryable(exc):
+        breaker.success()  # Gemini answered; the request itself is at fault
+        resilience_stats["not_retryable"] += 1
+        raise exc
+    breaker.failure()
+    if attempt >= settings.GEMINI_RETRY_ATTEMPTS:
+        resilience_stats["gave_up"] += 1
+        raise exc
+    delay = backoff(attempt)
+    left = remaining()
+    if left is not None and delay >= left:
+        resilience_stats["deadline_exceeded"] += 1
+        raise exc
+    resilience_stats["retries"] += 1
+    record_retry(label)
+    logger.warning(f"[Resilience] {label} attempt {attempt} failed ({type(exc).__name__}: {exc}); "
+                   f"retrying in {delay:.2f}s")
+    return delay
+
+
+async def call_async(
+        model: str,
+        fn: Callable[[float], Awaitable[T]],
+        label: str,
+        hedge_after_s: float = 0
+) -> T:
+    """
+    Run `fn(timeout_s)` under the retry policy, the deadline, `model`'s call slots and its
+    circuit breaker. Each attempt is also cancelled once its timeout passes. Raises the last
+    error on failure. A hedged attempt runs both copies in one slot.
+    """
+    breaker = get_breaker(model)
+    slots = get_call_slots(model)
+    attempt = 0
+    while True:
+        attempt += 1
+        timeout = attempt_timeout()
+        timeout -= await slots.acquire(timeout)
+        _begin_attempt(breaker, slots, timeout)
+        try:
+            if hedge_after_s and hedge_after_s < timeout:
+                result = await asyncio.wait_for(_hedged(fn, timeout, hedge_after_s), timeout)
+            else:
+                result = await asyncio.wait_for(fn(timeout), timeout)
+        except Exception as e:
+            error = e
+        else:
+            breaker.success()
+            return result
+        finally:
+            slots.release()
+        await asyncio.sleep(_retry_delay(breaker, error, attempt, label))
+
+
+def call_sync(model: str, fn: Callable[[float], T], label: str) -> T:
+    """
+    Blocking variant of call_async for the google-genai SDK calls (STT, TTS), run in worker
+    threads (run_blocking). `fn` must apply the timeout it is given itself.
+    """
+    breaker = get_breaker(model)
+    slots = get_call_slots(model)
+    attempt = 0
+    while True:
+        attempt += 1
+        timeout = attempt_timeout()
+        timeout -= slots.acquire_sync(timeout)
+        _begin_attempt(breaker, slots, timeout)
+        try:
+            result = fn(timeout)
+        except Exception as e:
+            error = e
+        else:
+            breaker.success()
+            return result
+        finally:
+            slots.release()
+        time.sleep(_retry_delay(breaker, error, attempt, label))
+
+
+async def _hedged(fn: Callable[[float], Awaitable[T]], timeout: float, after: float) -> T:
+    first = asyncio.create_task(fn(timeout))
+    pending = {first}
+    try:
+        done, _ = await asyncio.wait(pending, timeout=after)
+        if done:
+            return first.result()
+        resilience_stats["hedges"] += 1
+        second = asyncio.create_task(fn(timeout - after))
+        pending.add(second)
+        error: Optional[BaseException] = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    resilience_stats["hedge_wins"] += int(task is second)
+                    return task.result()
+                error = task.exception()
+        raise error
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+def stats() -> Dict[str, object]:
+    with _breakers_lock:
+        breakers = {name: breaker.stats() for name, breaker in _breakers.items()}
+        slots = {name: model_slots.stats() for name, model_slots in _slots.items()}
+    return {**resilience_stats, "circuits": breakers, "call_slots": slots}
@@ -0,0 +1,167 @@
+# backend/session_cache.py
+
+import time
+import logging
+import threading
+from collections import OrderedDict, deque
+from typing import Deque, Dict, List, Optional, Tuple
+
+from backend.config import get_settings
+from backend.db import get_recent_history
+from backend.log_writer import get_conversation_writer
+
+settings = get_settings()
+logger = logging.getLogger("session_cache")
+logger.setLevel(logging.INFO)
+
+Turn = Tuple[str, str]  # (transcript, bot_response)
+
+LOAD_ATTEMPTS = 3
+
+
+def _turn_bytes(turn: Turn) -> int:
+    return len(turn[0].encode("utf-8")) + len(turn[1].encode("utf-8"))
+
+
+class _SessionEntry:
+    __slots__ = ("turns", "size", "last_access")
+
+    def __init__(self, turns: Deque[Turn]):
+        self.turns = turns
+        self.size = sum(_turn_bytes(t) for t in turns)
+        self.last_access = time.monotonic()
+
+
+class SessionHistoryStore:
+    """
+    Bounded in-process cache of recent turns per session, in front of SQLite.
+
+    - get(): served from memory; on a miss the last `max_turns` turns are loaded once,
+      from SQLite plus the turns still queued in the write-behind writer.
+    - record_turn(): write-through companion to ConversationWriter.log; only extends
+      sessions already cached, so a cache entry is never a partial view of the session.
+    - Sessions idle for `ttl_s` are dropped; the total text held is capped at `max_bytes`
+      by evicting least recently used sessions.
+
+    The cache is per process: run one worker per session (the default single uvicorn
+    worker, or sticky routing) so another worker never appends turns it cannot see.
+    """
+
+    def __init__(self, max_turns: int = 0, ttl_s: float = 0, max_bytes: int = 0):
+        self.max_turns = max_turns or settings.HISTORY_CACHE_TURNS
+        self.ttl_s = ttl_s or settings.HISTORY_CACHE_TTL_S
+        self.max_bytes = max_bytes or settings.HISTORY_CACHE_MAX_MB * 1024 * 1024
+        self.hits = 0
+        self.misses = 0
+        self.load_errors = 0
+        self._lock = threading.Lock()
+        self._sessions: "OrderedDict[str, _SessionEntry]" = OrderedDict()  # LRU order
+        self._total = 0
+
+    def get(self, session_id: str) -> List[Turn]:
+        """Recent turns for the session, oldest first (same shape as db.get_history)."""
+        with self._lock:
+            self._expire()
+            entry = self._sessions.get(session_id)
+            if entry is not None:
+                self.hits += 1
+                self._touch(session_id, entry)
+                return list(entry.turns)
+            self.misses += 1
+
+        try:
+            rows = self._load(session_id)
+        except Exception as e:
+            # Not cached: an empty history must not stand in for the session until the TTL runs out
+            with self._lock:
+                self.load_errors += 1
+            logger.error(f"[HistoryCache] Loading {session_id} failed; serving no history this turn: {e}")
+            return []
+        with self._lock:
+            # Another turn may have filled it meanwhile; keep whichever is current.
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                entry = _SessionEntry(deque(rows, maxlen=self.max_turns))
+                self._sessions[session_id] = entry
+                self._total += entry.size
+                self._enforce_budget()
+            return list(entry.turns)
+
+    def record_turn(self, session_id: str, transcript: str, bot_response: str) -> None:
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                return  # already queued in the writer: the next get() loads it with the rest
+            turn = (transcript, bot_response)
+            if len(entry.turns) == entry.turns.maxlen:
+                dropped = _turn_bytes(entry.turns[0])
+                entry.size -= dropped
+                self._total -= dropped
+            entry.turns.append(turn)
+            entry.size += _turn_bytes(turn)
+            self._total += _turn_bytes(turn)
+            self._touch(session_id, entry)
+            self._enforce_budget()
+
+    def _load(self, session_id: str) -> List[Turn]:
+        """SQLite rows plus the writer's pending turns, read without a batch commit in between."""
+        writer = get_conversation_writer()
+        for attempt in range(1, LOAD_ATTEMPTS + 1):
+            version, pending = writer.pending_turns(session_id)
+            rows = get_recent_history(session_id, limit=self.max_turns)
+            # An even, unchanged version: no batch moved turns from the queue to SQLite meanwhile
+            if version % 2 == 0 and writer.pending_turns(session_id)[0] == version:
+                break
+            if attempt < LOAD_ATTEMPTS:
+                time.sleep(0.005 * attempt)
+        else:
+            logger.warning(f"[HistoryCache] Writer kept committing while loading {session_id}; history may repeat a turn")
+        return (rows + pending)[-self.max_turns:]
+
+    def _touch(self, session_id: str, entry: _SessionEntry) -> None:
+        entry.last_access = time.monotonic()
+        self._sessions.move_to_end(session_id)
+
+    def _remove(self, session_id: str) -> Optional[_SessionEntry]:
+        entry = self._sessions.pop(session_id, None)
+        if entry is not None:
+            self._total -= entry.size
+        return entry
+
+    def _expire(self) -> None:
+        cutoff = time.monotonic() - self.ttl_s
+        while self._sessions:
+            session_id, entry = next(iter(self._sessions.items()))
+            if entry.last_access >= cutoff:
+                break
+            self._remove(session_id)
+
+    def _enforce_budget(self) -> None:
+        # Never evict the most recently used session, even if it alone exceeds the budget
+        while self._total > self.max_bytes and len(self._sessions) > 1:
+            session_id = next(iter(self._sessions))
+            self._remove(session_id)
+            logger.info(f"[HistoryCache] Evicted session {session_id} (memory budget)")
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "load_errors": self.load_errors,
+                "sessions": len(self._sessions),
+                "bytes": self._total,
+            }
+
+
+_store: Optional[SessionHistoryStore] = None
+
+
+def get_history_store() -> SessionHistoryStore:
+    """Process-wide session history cache."""
+    global _store
+    if _store is None:
+        _store = SessionHistoryStore()
+    return _store
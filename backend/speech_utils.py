@@ -1,14 +1,21 @@
 # backend/speech_utils.py
 
+import io
 import os
 import wave
 import time
 import logging
+import threading
 from tempfile import NamedTemporaryFile
+from typing import NamedTuple
+
+import numpy as np
 from google import genai
 from google.genai import types
 
 from backend.config import get_settings
+from backend.llm_client import GENAI_HTTP_OPTIONS
+from backend.resilience import call_sync
 
 settings = get_settings()
 
@@ -17,14 +24,21 @@ logger = logging.getLogger("speech_utils")
 logger.setLevel(logging.INFO)
 
 # --- Gemini Client ---
-client = genai.Client(api_key=settings.GEMINI_API_KEY)
+client = genai.Client(api_key=settings.GEMINI_API_KEY, http_options=GENAI_HTTP_OPTIONS)
 
 # --- Constants ---
 TTS_VOICE = "Kore"  # Or "Sulafat" for Omani dialect if supported
 TTS_MODEL = "gemini-2.5-flash-preview-tts"
 STT_MODEL = "gemini-2.5-flash"
-MAX_RETRIES = 3
-RETRY_DELAY = 2  # seconds
+
+# --- Preprocessing (before STT) ---
+STT_SAMPLE_RATE = 16000
+VAD_FRAME_MS = 30
+VAD_ABS_FLOOR_DB = -50.0   # frames quieter than this (dBFS) are never speech
+VAD_MARGIN_DB = 12.0       # ... nor frames within this margin of the clip's noise floor
+VAD_SPEECH_DB = -35.0      # ... but frames louder than this always are (clips with little or no silence)
+VAD_PAD_MS = 200           # kept around detected speech so word edges aren't clipped
+VAD_MIN_SPEECH_MS = 250    # less detected speech than this means the clip is rejected
 
 
 # --- Helper: Save raw PCM to .wav ---
@@ -36,7 +50,120 @@ def _save_wave(data: bytes, output_path: str, channels=1, rate=24000, width=2):
         wf.writeframes(data)
 
 
+# --- Audio Preprocessing ---
+class PreprocessedAudio(NamedTuple):
+    wav: bytes              # 16 kHz mono 16-bit WAV, trimmed to speech
+    has_speech: bool
+    original_bytes: int
+    original_duration_s: float
+    duration_s: float
+
+    @property
+    def bytes_saved(self) -> int:
+        return self.original_bytes - len(self.wav)
+
+
+_preprocess_lock = threading.Lock()
+preprocess_stats = {"clips": 0, "rejected_silent": 0, "bytes_in": 0, "bytes_out": 0}
+
+
+def _pcm_to_float(frames: bytes, width: int, channels: int) -> np.ndarray:
+    """Decode interleaved PCM to a float32 mono signal in [-1, 1]."""
+    if width == 1:
+        samples = (np.frombuffer(frames, dtype=np.uint8).astype(np.float32) - 128.0) / 128.0
+    elif width == 2:
+        samples = np.frombuffer(frames, dtype="<i2").astype(np.float32) / 32768.0
+    elif width == 3:
+        raw = np.frombuffer(frames, dtype=np.uint8).reshape(-1, 3).astype(np.int32)
+        ints = raw[:, 0] | (raw[:, 1] << 8) | (raw[:, 2] << 16)
+        ints = np.where(ints & 0x800000, ints - (1 << 24), ints)
+        samples = ints.astype(np.float32) / float(1 << 23)
+    elif width == 4:
+        samples = np.frombuffer(frames, dtype="<i4").astype(np.float32) / float(1 << 31)
+    else:
+        raise ValueError(f"Unsupported sample width: {width}")
+    return samples.reshape(-1, channels).mean(axis=1)
+
+
+def _resample(signal: np.ndarray, rate: int, target: int) -> np.ndarray:
+    if rate == target or signal.size == 0:
+        return signal
+    if rate > target:
+        # Box low-pass over one output period to limit aliasing before decimation
+        width = int(np.ceil(rate / target))
+        signal = np.convolve(signal, np.full(width, 1.0 / width, dtype=np.float32), mode="same")
+    n_out = int(round(signal.size * target / rate))
+    positions = np.arange(n_out, dtype=np.float64) * (rate / target)
+    return np.interp(positions, np.arange(signal.size), signal).astype(np.float32)
+
+
+def _speech_bounds(signal: np.ndarray, rate: int):
+    """Energy VAD: (start, end) sample indices of speech, or None if the clip is silent."""
+    frame = int(rate * VAD_FRAME_MS / 1000)
+    n_frames = signal.size // frame
+    if n_frames == 0:
+        return None
+    frames = signal[:n_frames * frame].reshape(n_frames, frame)
+    rms_db = 20 * np.log10(np.sqrt(np.mean(frames ** 2, axis=1)) + 1e-10)
+    # The 10th percentile is the noise floor only if the clip has pauses; capping the
+    # relative threshold keeps a clip that is speech throughout from being rejected
+    noise_floor = float(np.percentile(rms_db, 10))
+    threshold = max(VAD_ABS_FLOOR_DB, min(noise_floor + VAD_MARGIN_DB, VAD_SPEECH_DB))
+    voiced = np.flatnonzero(rms_db > threshold)
+    if voiced.size * VAD_FRAME_MS < VAD_MIN_SPEECH_MS:
+        return None
+    pad = int(rate * VAD_PAD_MS / 1000)
+    return max(voiced[0] * frame - pad, 0), min((voiced[-1] + 1) * frame + pad, signal.size)
+
+
+def preprocess_wav(data: bytes) -> PreprocessedAudio:
+    """
+    Downmix to mono, resample to 16 kHz and trim leading/trailing silence before STT.
+    Raises wave.Error/ValueError/EOFError if `data` is not a PCM WAV.
+    """
+    with wave.open(io.BytesIO(data), "rb") as wf:
+        channels, width, rate = wf.getnchannels(), wf.getsampwidth(), wf.getframerate()
+        frames = wf.readframes(wf.getnframes())
+    signal = _pcm_to_float(frames, width, channels)
+    original_duration = signal.size / rate if rate else 0.0
+    signal = _resample(signal, rate, STT_SAMPLE_RATE)
+
+    bounds = _speech_bounds(signal, STT_SAMPLE_RATE)
+    if bounds is not None:
+        signal = signal[bounds[0]:bounds[1]]
+    else:
+        signal = signal[:0]
+    pcm = (np.clip(signal, -1.0, 1.0) * 32767).astype("<i2").tobytes()
+    buf = io.BytesIO()
+    _save_wave(pcm, buf, rate=STT_SAMPLE_RATE)
+    result = PreprocessedAudio(
+        wav=buf.getvalue(),
+        has_speech=bounds is not None,
+        original_bytes=len(data),
+        original_duration_s=original_duration,
+        duration_s=signal.size / STT_SAMPLE_RATE,
+    )
+
+    with _preprocess_lock:
+        preprocess_stats["clips"] += 1
+        preprocess_stats["rejected_silent"] += int(not result.has_speech)
+        preprocess_stats["bytes_in"] += result.original_bytes
+        preprocess_stats["bytes_out"] += len(result.wav)
+    logger.info(
+        f"[Preprocess] {channels}ch {rate} Hz {result.original_duration_s:.1f}s -> "
+        f"mono {STT_SAMPLE_RATE} Hz {result.duration_s:.1f}s; "
+        f"{result.original_bytes / 1e6:.2f} MB -> {len(result.wav) / 1e6:.2f} MB "
+        f"(saved {result.bytes_saved / 1e6:.2f} MB)"
+    )
+    return result
+
+
 # --- Robust STT ---
+def _http_options(timeout_s: float) -> types.HttpOptions:
+    """Per-attempt timeout for an SDK call (the SDK takes milliseconds)."""
+    return types.HttpOptions(timeout=max(int(timeout_s * 1000), 1))
+
+
 def transcribe_audio(audio_path: str, prompt: str = "يرجى تحويل هذا الملف الصوتي إلى نص باللهجة العمانية فقط.") -> str:
     """
     Convert speech audio to Omani Arabic text using Gemini API with retries and logging.
@@ -45,54 +172,114 @@ def transcribe_audio(audio_path: str, prompt: str = "يرجى تحويل هذا
     if not os.path.exists(audio_path):
         logger.error(f"[STT] Audio file missing: {audio_path}")
         return ""
-    for attempt in range(1, MAX_RETRIES + 1):
-        try:
-            start = time.time()
-            myfile = client.files.upload(file=audio_path)
-            response = client.models.generate_content(
-                model=STT_MODEL,
-                contents=[prompt, myfile]
-            )
-            logger.info(f"[STT] Success (attempt {attempt}) in {time.time() - start:.2f}s")
-            return response.text.strip()
-        except Exception as e:
-            logger.error(f"[STT] Error (attempt {attempt}): {e}")
-            if attempt < MAX_RETRIES:
-                time.sleep(RETRY_DELAY)
-    return ""
+
+    def attempt(timeout_s: float) -> str:
+        myfile = client.files.upload(
+            file=audio_path, config=types.UploadFileConfig(http_options=_http_options(timeout_s))
+        )
+        response = client.models.generate_content(
+            model=STT_MODEL,
+            contents=[prompt, myfile],
+            config=types.GenerateContentConfig(http_options=_http_options(timeout_s))
+        )
+        return response.text.strip()
+
+    start = time.time()
+    try:
+        text = call_sync(STT_MODEL, attempt, "stt")
+    except Exception as e:
+        logger.error(f"[STT] Failed after {time.time() - start:.2f}s: {type(e).__name__}: {e}")
+        return ""
+    logger.info(f"[STT] Success in {time.time() - start:.2f}s")
+    return text
+
+
+def transcribe_audio_bytes(
+        audio_bytes: bytes,
+        mime_type: str = "audio/wav",
+        prompt: str = "يرجى تحويل هذا الملف الصوتي إلى نص باللهجة العمانية فقط."
+) -> str:
+    """
+    Transcribe in-memory audio. Clips up to STT_INLINE_MAX_MB are sent inline with the
+    generate_content request (one round-trip, no disk I/O); larger ones fall back to the
+    files.upload path via a temporary file. Returns '' on persistent failure.
+    """
+    if len(audio_bytes) > settings.STT_INLINE_MAX_MB * 1024 * 1024:
+        with NamedTemporaryFile(suffix=".wav") as tmp:
+            tmp.write(audio_bytes)
+            tmp.flush()
+            return transcribe_audio(tmp.name, prompt)
+
+    audio_part = types.Part.from_bytes(data=audio_bytes, mime_type=mime_type)
+
+    def attempt(timeout_s: float) -> str:
+        response = client.models.generate_content(
+            model=STT_MODEL,
+            contents=[prompt, audio_part],
+            config=types.GenerateContentConfig(http_options=_http_options(timeout_s))
+        )
+        return response.text.strip()
+
+    start = time.time()
+    try:
+        text = call_sync(STT_MODEL, attempt, "stt")
+    except Exception as e:
+        logger.error(f"[STT] Inline failed after {time.time() - start:.2f}s: {type(e).__name__}: {e}")
+        return ""
+    logger.info(f"[STT] Inline success ({len(audio_bytes) / 1e6:.2f} MB) in {time.time() - start:.2f}s")
+    return text
 
 
 # --- Robust TTS ---
-def synthesize_speech(text: str, voice: str = TTS_VOICE) -> str:
+def synthesize_pcm(text: str, voice: str = TTS_VOICE) -> bytes:
     """
     Convert text to Omani Arabic speech using Gemini TTS with retries and logging.
-    Returns path to WAV file or '' on persistent failure.
+    Returns raw 24 kHz 16-bit mono PCM, or b'' on persistent failure.
     """
-    for attempt in range(1, MAX_RETRIES + 1):
-        try:
-            start = time.time()
-            response = client.models.generate_content(
-                model=TTS_MODEL,
-                contents=text,
-                config=types.GenerateContentConfig(
-                    response_modalities=["AUDIO"],
-                    speech_config=types.SpeechConfig(
-                        voice_config=types.VoiceConfig(
-                            prebuilt_voice_config=types.PrebuiltVoiceConfig(
-                                voice_name=voice
-                            )
+    def attempt(timeout_s: float) -> bytes:
+        response = client.models.generate_content(
+            model=TTS_MODEL,
+            contents=text,
+            config=types.GenerateContentConfig(
+                response_modalities=["AUDIO"],
+                speech_config=types.SpeechConfig(
+                    voice_config=types.VoiceConfig(
+                        prebuilt_voice_config=types.PrebuiltVoiceConfig(
+                            voice_name=voice
                         )
                     )
-                )
+                ),
+                http_options=_http_options(timeout_s)
             )
-            # Get PCM bytes
-            pcm = response.candidates[0].content.parts[0].inline_data.data
-            tmp = NamedTemporaryFile(delete=False, suffix=".wav")
-            _save_wave(pcm, tmp.name)
-            logger.info(f"[TTS] Success (attempt {attempt}) in {time.time() - start:.2f}s")
-            return tmp.name
-        except Exception as e:
-            logger.error(f"[TTS] Error (attempt {attempt}): {e}")
-            if attempt < MAX_RETRIES:
-                time.sleep(RETRY_DELAY)
-    return ""
+        )
+        # Get PCM bytes
+        return response.candidates[0].content.parts[0].inline_data.data
+
+    start = time.time()
+    try:
+        pcm = call_sync(TTS_MODEL, attempt, "tts")
+    except Exception as e:
+        logger.error(f"[TTS] Failed after {time.time() - start:.2f}s: {type(e).__name__}: {e}")
+        return b""
+    logger.info(f"[TTS] Success in {time.time() - start:.2f}s")
+    return pcm
+
+
+def synthesize_speech(text: str, voice: str = TTS_VOICE) -> str:
+    """
+    Convert text to speech and write it to a temporary WAV file.
+    Returns path to WAV file or '' on persistent failure.
+    """
+    pcm = synthesize_pcm(text, voice)
+    if not pcm:
+        return ""
+    tmp = NamedTemporaryFile(delete=False, suffix=".wav")
+    _save_wave(pcm, tmp.name)
+    return tmp.name
+
+
+def wav_bytes(pcm: bytes) -> bytes:
+    """Wrap raw TTS PCM in an in-memory WAV container (for streaming chunks)."""
+    buf = io.BytesIO()
+    _save_wave(pcm, buf)
+    return buf.getvalue()
@@ -0,0 +1,194 @@
+# backend/storage.py
+
+import os
+import sqlite3
+import logging
+import threading
+from typing import Callable, List, Optional, Tuple
+
+from backend.config import get_settings
+
+settings = get_settings()
+logger = logging.getLogger("storage")
+logger.setLevel(logging.INFO)
+
+DATA_DIR = settings.DATA_DIR
+DB_PATH = os.path.join(DATA_DIR, "session_logs.db")
+
+# Applied to every new connection. WAL lets readers run alongside the writer;
+# synchronous=NORMAL is durable across app crashes (only an OS crash can lose the last commits).
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA busy_timeout=5000",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-16000",     # ~16 MB page cache per connection
+    "PRAGMA mmap_size=134217728",   # 128 MB memory-mapped reads
+    "PRAGMA foreign_keys=ON",
+)
+
+
+# --- Schema Migrations ---
+# Each migration runs once, in order, inside a transaction; PRAGMA user_version records progress.
+def _m001_base_tables(cur: sqlite3.Cursor) -> None:
+    # Original schema, created on fresh databases and a no-op on existing ones.
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS sessions (
+        session_id TEXT NOT NULL,
+        timestamp TEXT NOT NULL,
+        transcript TEXT NOT NULL,
+        emotion TEXT NOT NULL,
+        bot_response TEXT NOT NULL,
+        crisis_flag INTEGER NOT NULL,
+        audio_path TEXT NOT NULL,
+        bot_audio_path TEXT NOT NULL
+    )""")
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS user_insights (
+        user_id TEXT NOT NULL PRIMARY KEY,
+        insights TEXT NOT NULL,
+        last_updated TEXT NOT NULL
+    )""")
+
+
+def _m002_turn_id_and_index(cur: sqlite3.Cursor) -> None:
+    # Rebuild sessions with an explicit rowid alias so turns have a stable id,
+    # then index the (session_id, timestamp) access path used by every history query.
+    cur.execute("""
+    CREATE TABLE sessions_v2 (
+        turn_id INTEGER PRIMARY KEY,
+        session_id TEXT NOT NULL,
+        timestamp TEXT NOT NULL,
+        transcript TEXT NOT NULL,
+        emotion TEXT NOT NULL,
+        bot_response TEXT NOT NULL,
+        crisis_flag INTEGER NOT NULL,
+        audio_path TEXT NOT NULL,
+        bot_audio_path TEXT NOT NULL
+    )""")
+    cur.execute("""
+    INSERT INTO sessions_v2 (
+        turn_id, session_id, timestamp, transcript, emotion,
+        bot_response, crisis_flag, audio_path, bot_audio_path
+    )
+    SELECT rowid, session_id, timestamp, transcript, emotion,
+           bot_response, crisis_flag, audio_path, bot_audio_path
+    FROM sessions ORDER BY rowid
+    """)
+    cur.execute("DROP TABLE sessions")
+    cur.execute("ALTER TABLE sessions_v2 RENAME TO sessions")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_sessions_session_ts ON sessions (session_id, timestamp)")
+
+
+def _m003_insight_versions_and_watermarks(cur: sqlite3.Cursor) -> None:
+    # Insights get a version for compare-and-set updates; watermarks record the last turn
+    # of each session that evolution has already folded into a user's insights.
+    cur.execute("ALTER TABLE user_insights ADD COLUMN version INTEGER NOT NULL DEFAULT 0")
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS insight_watermarks (
+        user_id TEXT NOT NULL,
+        session_id TEXT NOT NULL,
+        last_turn_id INTEGER NOT NULL,
+        PRIMARY KEY (user_id, session_id)
+    )""")
+
+
+def _m004_jobs(cur: sqlite3.Cursor) -> None:
+    # Durable background job queue (backend.job_queue); times are unix epoch seconds.
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS jobs (
+        job_id INTEGER PRIMARY KEY,
+        kind TEXT NOT NULL,
+        payload TEXT NOT NULL,
+        dedupe_key TEXT,
+        state TEXT NOT NULL,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        available_at REAL NOT NULL,
+        lease_owner TEXT,
+        lease_until REAL,
+        created_at REAL NOT NULL,
+        started_at REAL,
+        finished_at REAL,
+        run_ms INTEGER,
+        last_error TEXT
+    )""")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_jobs_state_available ON jobs (state, available_at)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_jobs_dedupe ON jobs (dedupe_key) WHERE dedupe_key IS NOT NULL")
+
+
+MIGRATIONS: List[Tuple[int, str, Callable[[sqlite3.Cursor], None]]] = [
+    (1, "base tables", _m001_base_tables),
+    (2, "turn_id primary key + (session_id, timestamp) index", _m002_turn_id_and_index),
+    (3, "user_insights version + insight_watermarks", _m003_insight_versions_and_watermarks),
+    (4, "jobs queue", _m004_jobs),
+]
+
+
+def schema_version(conn: sqlite3.Connection) -> int:
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(path: Optional[str] = None) -> int:
+    """Bring the database at `path` (default DB_PATH) to the latest schema. Returns the resulting version."""
+    conn = _open(path or DB_PATH, autocommit=True)
+    try:
+        current = schema_version(conn)
+        for version, name, apply in MIGRATIONS:
+            if version <= current:
+                continue
+            # Explicit transaction so DDL and the version bump commit (or roll back) together
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                if schema_version(conn) < version:  # another process may have just applied it
+                    apply(conn.cursor())
+                    conn.execute(f"PRAGMA user_version={version}")
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            logger.info(f"[Storage] Applied migration {version}: {name}")
+            current = version
+        return current
+    finally:
+        conn.close()
+
+
+# --- Connections ---
+def _open(path: str, autocommit: bool = False) -> sqlite3.Connection:
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    conn = sqlite3.connect(path, isolation_level=None if autocommit else "DEFERRED")
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+
+_local = threading.local()
+_migrated = set()
+_migrate_lock = threading.Lock()
+
+
+def get_connection(path: Optional[str] = None) -> sqlite3.Connection:
+    """
+    Thread-local pooled connection (one per thread per database file, default DB_PATH),
+    migrated on first use. Use `with conn:` for a transaction; never close it.
+    """
+    path = path or DB_PATH  # read at call time, so tests can point it at a scratch file
+    if path not in _migrated:
+        with _migrate_lock:
+            if path not in _migrated:
+                migrate(path)
+                _migrated.add(path)
+    conns = getattr(_local, "conns", None)
+    if conns is None:
+        conns = _local.conns = {}
+    conn = conns.get(path)
+    if conn is None:
+        conn = conns[path] = _open(path)
+    return conn
+
+
+def close_thread_connections() -> None:
+    """Close this thread's connections (worker shutdown, tests)."""
+    for conn in getattr(_local, "conns", {}).values():
+        conn.close()
+    _local.conns = {}
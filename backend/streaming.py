@@ -0,0 +1,116 @@
+# backend/streaming.py
+
+import re
+import asyncio
+import logging
+from typing import AsyncIterator, Callable, List, Optional, Tuple
+
+from backend.resilience import run_blocking
+
+logger = logging.getLogger("streaming")
+logger.setLevel(logging.INFO)
+
+# Arabic and Latin sentence terminators (؟ question mark, ؛ semicolon, … ellipsis) and line breaks
+SENTENCE_END = re.compile(r"[.!?؟؛…\n]+")
+MIN_SENTENCE_CHARS = 12  # shorter fragments are merged with the next sentence
+
+
+class SentenceChunker:
+    """Accumulates streamed text and releases complete sentences, in order."""
+
+    def __init__(self, min_chars: int = MIN_SENTENCE_CHARS):
+        self.min_chars = min_chars
+        self._buffer = ""
+
+    def feed(self, delta: str) -> List[str]:
+        self._buffer += delta
+        sentences = []
+        start = 0
+        for match in SENTENCE_END.finditer(self._buffer):
+            # A terminator at the very end may still be followed by more punctuation.
+            if match.end() == len(self._buffer):
+                break
+            candidate = self._buffer[start:match.end()].strip()
+            if len(candidate) >= self.min_chars:
+                sentences.append(candidate)
+                start = match.end()
+        self._buffer = self._buffer[start:]
+        return sentences
+
+    def flush(self) -> Optional[str]:
+        rest = self._buffer.strip()
+        self._buffer = ""
+        return rest or None
+
+
+async def text_stream(*texts: str) -> AsyncIterator[str]:
+    """Adapt fixed text (e.g. the crisis reply) to the delta-stream interface."""
+    for text in texts:
+        yield text
+
+
+class ReplyStreamer:
+    """
+    Turns a text-delta stream into (sentence, pcm) pairs delivered in order.
+
+    Sentences are handed to `synthesize` (a blocking TTS call, run on the SDK pool) as soon
+    as they are complete, so synthesis of sentence N+1 overlaps delivery of sentence N.
+    At most `max_pending` sentences are synthesized ahead of the consumer.
+    """
+
+    def __init__(
+            self,
+            deltas: AsyncIterator[str],
+            synthesize: Callable[[str], bytes],
+            max_pending: int = 3
+    ):
+        self._deltas = deltas
+        self._synthesize = synthesize
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_pending)
+        self._producer: Optional[asyncio.Task] = None
+        self._pending: List[asyncio.Task] = []
+
+    def start(self) -> "ReplyStreamer":
+        if self._producer is None:
+            self._producer = asyncio.create_task(self._produce())
+        return self
+
+    async def _produce(self) -> None:
+        chunker = SentenceChunker()
+        try:
+            async for delta in self._deltas:
+                for sentence in chunker.feed(delta):
+                    await self._enqueue(sentence)
+            tail = chunker.flush()
+            if tail:
+                await self._enqueue(tail)
+        except Exception as e:
+            logger.error(f"[Stream] Reply stream failed: {e}")
+        # End-of-reply marker (not sent when cancelled: nobody is consuming then)
+        await self._queue.put(None)
+
+    async def _enqueue(self, sentence: str) -> None:
+        task = asyncio.create_task(run_blocking(self._synthesize, sentence))
+        self._pending.append(task)
+        await self._queue.put((sentence, task))
+
+    async def __aiter__(self) -> AsyncIterator[Tuple[str, bytes]]:
+        self.start()
+        while True:
+            item = await self._queue.get()
+            if item is None:
+                break
+            sentence, task = item
+            pcm = await task
+            if not pcm:
+                logger.error(f"[Stream] TTS failed for sentence: {sentence[:30]}...")
+                continue
+            yield sentence, pcm
+
+    async def cancel(self) -> None:
+        """Abandon the reply (e.g. crisis detected); in-flight TTS results are discarded."""
+        tasks = [t for t in [self._producer, *self._pending] if t is not None and not t.done()]
+        for t in tasks:
+            t.cancel()
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
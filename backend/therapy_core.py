@@ -1,18 +1,31 @@
 # backend/therapy_core.py
 
+import re
+import json
+import time
+import asyncio
+import hashlib
 import logging
-from typing import List, Tuple
+import threading
+from collections import Counter, OrderedDict
+from typing import Any, AsyncIterator, Dict, List, NamedTuple, Optional, Tuple
 
 from google import genai
 from google.genai import types
 
 from backend.config import get_settings
+from backend.context import history_text
+from backend.refinement import needs_refinement, refinement_stats
+from backend.llm_client import DEFAULT_MODEL, GENAI_HTTP_OPTIONS, get_llm_client, run_sync
+from backend.emotion_model import local_emotion, emotion_stats
+from backend.arabic import normalize
+from backend.metrics import current_stage, llm_errors, llm_seconds, span
 
 settings = get_settings()
 logger = logging.getLogger("therapy_core")
 logger.setLevel(logging.INFO)
 
-client = genai.Client(api_key=settings.GEMINI_API_KEY)
+client = genai.Client(api_key=settings.GEMINI_API_KEY, http_options=GENAI_HTTP_OPTIONS)
 
 
 # --- Consent Text ---
@@ -24,9 +37,85 @@ def get_consent_text() -> str:
     )
 
 
+# --- Fixed Replies ---
+CRISIS_REPLY = "🚨 نلاحظ حالة نفسية حرجة، يُرجى التواصل مع مختص فورًا."
+FALLBACK_REPLY = "أشكرك على تواصلك. أنصحك بمراجعة مختص إذا كنت تمر بأزمة."
+ERROR_REPLY = "عذراً، حصل خلل فني. حاول مرة ثانية أو تواصل مع مختص."
+FIXED_REPLIES = (CRISIS_REPLY, FALLBACK_REPLY, ERROR_REPLY)
+
+
+# --- Classification Memo Cache ---
+class ClassificationCache:
+    """
+    LRU/TTL memo of temperature-0 classification results. The key is the stage, the
+    normalized transcript and a digest of the history window actually put in the prompt,
+    so a hit is exactly the call that would have been made. Only real model answers are
+    stored, never the fallback returned on an error.
+    """
+
+    MISS = object()
+
+    def __init__(self, max_entries: int = 0, ttl_s: float = 0):
+        self.max_entries = max_entries or settings.CLASSIFY_CACHE_SIZE
+        self.ttl_s = ttl_s or settings.CLASSIFY_CACHE_TTL_S
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Tuple[str, str, str], Tuple[float, Any]]" = OrderedDict()
+        self.counts: Counter = Counter()  # <stage>_hits / <stage>_misses / <stage>_bypass
+
+    @staticmethod
+    def enabled(stage: str) -> bool:
+        stages = settings.CLASSIFY_CACHE_STAGES
+        if stage == "classification":  # carries a crisis verdict too
+            return "emotion" in stages and "crisis" in stages
+        return stage in stages
+
+    @staticmethod
+    def key(stage: str, transcript: str, history) -> Tuple[str, str, str]:
+        window = history_text(history, "classify")
+        digest = hashlib.blake2b(window.encode("utf-8"), digest_size=16).hexdigest()
+        return stage, normalize(transcript), digest
+
+    def get(self, key: Tuple[str, str, str]) -> Any:
+        stage = key[0]
+        if not self.enabled(stage):
+            self.counts[f"{stage}_bypass"] += 1
+            return self.MISS
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now - entry[0] <= self.ttl_s:
+                self._entries.move_to_end(key)
+                self.counts[f"{stage}_hits"] += 1
+                return entry[1]
+            if entry is not None:
+                del self._entries[key]
+            self.counts[f"{stage}_misses"] += 1
+            return self.MISS
+
+    def put(self, key: Tuple[str, str, str], value: Any) -> None:
+        if not self.enabled(key[0]):
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            result: Dict[str, float] = {"entries": len(self._entries), **self.counts}
+        for stage in ("emotion", "crisis", "classification"):
+            lookups = self.counts[f"{stage}_hits"] + self.counts[f"{stage}_misses"]
+            result[f"{stage}_hit_rate"] = self.counts[f"{stage}_hits"] / lookups if lookups else 0.0
+        return result
+
+
+classification_cache = ClassificationCache()
+
+
 # --- Emotion Analysis ---
 def emotion_prompt(history: List[Tuple[str, str]], transcript: str) -> str:
-    history_txt = "\n".join([f"مستخدم: {h[0]}\nمعالج: {h[1]}" for h in history])
+    history_txt = history_text(history, "classify")
     return (
         f"هذه محادثة بين مستخدم عماني ومعالج افتراضي باللهجة العمانية:\n"
         f"{history_txt}\n"
@@ -35,14 +124,41 @@ def emotion_prompt(history: List[Tuple[str, str]], transcript: str) -> str:
     )
 
 
-def analyze_emotion(transcript: str, history: List[Tuple[str, str]] = []) -> str:
+def _local_emotion_label(transcript: str) -> Optional[str]:
+    """The local model's label when EMOTION_BACKEND lets it answer, else None (ask the LLM)."""
+    if settings.EMOTION_BACKEND in ("local", "tiered"):
+        local = local_emotion(transcript)
+        if local is not None:
+            label, confidence = local
+            if settings.EMOTION_BACKEND == "local" or confidence >= settings.EMOTION_LOCAL_MIN_CONFIDENCE:
+                emotion_stats["local"] += 1
+                return label
+            emotion_stats["escalated"] += 1
+            logger.info(f"[Emotion] Local '{label}' at {confidence:.2f}; escalating to LLM")
+    return None
+
+
+async def analyze_emotion(transcript: str, history: List[Tuple[str, str]] = []) -> str:
+    label = _local_emotion_label(transcript)
+    if label is not None:
+        return label
+    return await _llm_emotion(transcript, history)
+
+
+async def _llm_emotion(transcript: str, history: List[Tuple[str, str]]) -> str:
+    key = classification_cache.key("emotion", transcript, history)
+    cached = classification_cache.get(key)
+    if cached is not ClassificationCache.MISS:
+        return cached
     prompt = emotion_prompt(history, transcript)
     try:
-        response = call_gemini_api(prompt, max_tokens=8, temperature=0)
+        response = await call_gemini_api(prompt, max_tokens=8, temperature=0)
         if not response:
             logger.warning("[Emotion] Empty LLM response; returning 'محايد'")
             return "محايد"
-        return response.strip().split()[0]
+        emotion = response.strip().split()[0]
+        classification_cache.put(key, emotion)
+        return emotion
     except Exception as e:
         logger.error(f"[Emotion] Error: {e}")
         return "محايد"
@@ -50,7 +166,7 @@ def analyze_emotion(transcript: str, history: List[Tuple[str, str]] = []) -> str
 
 # --- Crisis Analysis ---
 def crisis_prompt(history: List[Tuple[str, str]], transcript: str) -> str:
-    history_txt = "\n".join([f"مستخدم: {h[0]}\nمعالج: {h[1]}" for h in history])
+    history_txt = history_text(history, "classify")
     return (
         f"محادثة بين مستخدم عماني ومعالج نفسي:\n{history_txt}\n"
         f"رسالة المستخدم الأخيرة:\n{transcript.strip()}\n"
@@ -58,22 +174,136 @@ def crisis_prompt(history: List[Tuple[str, str]], transcript: str) -> str:
     )
 
 
-def is_crisis(transcript: str, emotion: str = None, history: List[Tuple[str, str]] = []) -> bool:
+async def is_crisis(transcript: str, emotion: str = None, history: List[Tuple[str, str]] = []) -> bool:
+    key = classification_cache.key("crisis", transcript, history)
+    cached = classification_cache.get(key)
+    if cached is not ClassificationCache.MISS:
+        return cached
     prompt = crisis_prompt(history, transcript)
     try:
-        response = call_gemini_api(prompt, max_tokens=2, temperature=0)
+        response = await call_gemini_api(prompt, max_tokens=2, temperature=0)
         if not response:
             logger.warning("[Crisis] Empty LLM response; returning False")
             return False
-        return "نعم" in response.strip()
+        crisis = "نعم" in response.strip()
+        classification_cache.put(key, crisis)
+        return crisis
     except Exception as e:
         logger.error(f"[Crisis] Error: {e}")
         return False
 
 
+# --- Combined Classification (emotion + crisis in one call) ---
+class TurnClassification(NamedTuple):
+    emotion: str
+    crisis: bool
+    confidence: Optional[float] = None
+
+
+CLASSIFICATION_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "emotion": {"type": "STRING"},
+        "crisis": {"type": "BOOLEAN"},
+        "confidence": {"type": "NUMBER"},
+    },
+    "required": ["emotion", "crisis", "confidence"],
+}
+
+_CRISIS_TRUE = {"true", "yes", "1", "نعم"}
+_CRISIS_FALSE = {"false", "no", "0", "لا"}
+
+
+def classification_prompt(history: List[Tuple[str, str]], transcript: str) -> str:
+    history_txt = history_text(history, "classify")
+    return (
+        f"هذه محادثة بين مستخدم عماني ومعالج افتراضي باللهجة العمانية:\n"
+        f"{history_txt}\n"
+        f"رسالة المستخدم الأخيرة:\n{transcript.strip()}\n"
+        f"أجب بكائن JSON فقط بالمفاتيح التالية:\n"
+        f'"emotion": العاطفة الأساسية لهذه الرسالة بكلمة واحدة (مثال: قلق، حزن، تفاؤل، توتر...)،\n'
+        f'"crisis": true إذا كانت هناك أي علامات على أزمة نفسية خطيرة (انتحار، إيذاء الذات، انهيار، خطر على الحياة) وإلا false،\n'
+        f'"confidence": رقم بين 0 و 1 يعبر عن ثقتك في التصنيف.'
+    )
+
+
+def parse_classification(raw: str) -> Optional[TurnClassification]:
+    """
+    Tolerant parser for the combined classifier output (code fences, surrounding text,
+    string booleans). Returns None when the crisis flag cannot be read reliably.
+    """
+    if not raw:
+        return None
+    match = re.search(r"\{.*\}", raw, re.DOTALL)
+    if not match:
+        return None
+    try:
+        data = json.loads(match.group(0))
+    except ValueError:
+        return None
+    if not isinstance(data, dict):
+        return None
+
+    crisis = data.get("crisis")
+    if isinstance(crisis, str):
+        flag = crisis.strip().strip("()").lower()
+        if flag in _CRISIS_TRUE:
+            crisis = True
+        elif flag in _CRISIS_FALSE:
+            crisis = False
+    if not isinstance(crisis, bool):
+        return None
+
+    emotion = str(data.get("emotion") or "").strip()
+    emotion = emotion.split()[0] if emotion else "محايد"
+
+    try:
+        confidence = min(max(float(data.get("confidence")), 0.0), 1.0)
+    except (TypeError, ValueError):
+        confidence = None
+    return TurnClassification(emotion, crisis, confidence)
+
+
+async def classify_turn(transcript: str, history: List[Tuple[str, str]] = []) -> TurnClassification:
+    """
+    Emotion + crisis for one turn. In 'combined' mode a single JSON-constrained call is made,
+    unless EMOTION_BACKEND serves the emotion locally (then only the crisis call is left); if
+    its output cannot be parsed (or in 'split' mode) the two dedicated calls run concurrently.
+    """
+    emotion_call = analyze_emotion
+    if settings.CLASSIFIER_MODE == "combined":
+        local = _local_emotion_label(transcript)
+        if local is not None:
+            return TurnClassification(local, await is_crisis(transcript, history=history))
+        emotion_call = _llm_emotion  # the local model has had its say
+        key = classification_cache.key("classification", transcript, history)
+        cached = classification_cache.get(key)
+        if cached is not ClassificationCache.MISS:
+            return cached
+        prompt = classification_prompt(history, transcript)
+        try:
+            raw = await call_gemini_api(
+                prompt, max_tokens=48, temperature=0, response_schema=CLASSIFICATION_SCHEMA
+            )
+            result = parse_classification(raw)
+            if result is not None:
+                logger.info(f"[Classify] emotion={result.emotion} crisis={result.crisis} confidence={result.confidence}")
+                classification_cache.put(key, result)
+                return result
+            logger.warning(f"[Classify] Unparseable output, falling back to split calls: {raw!r}")
+        except Exception as e:
+            logger.error(f"[Classify] Error: {e}; falling back to split calls")
+
+    emotion, crisis = await asyncio.gather(
+        emotion_call(transcript, history),
+        is_crisis(transcript, history=history)
+    )
+    return TurnClassification(emotion, crisis)
+
+
 # --- Response Generation ---
 def system_prompt(history: List[Tuple[str, str]], user_insights: str = "") -> str:
-    history_txt = "\n".join([f"مستخدم: {h[0]}\nمعالج: {h[1]}" for h in history])
+    history_txt = history_text(history, "generate")
     insights_txt = f"\nملاحظات عن المستخدم:\n{user_insights}\n" if user_insights else ""
     return (
         "أنت معالج افتراضي عماني تستمع للمستخدم وتستخدم أساليب علمية "
@@ -85,7 +315,7 @@ def system_prompt(history: List[Tuple[str, str]], user_insights: str = "") -> st
 
 
 def evaluator_prompt(user_message: str, generated_response: str, history: List[Tuple[str, str]] = []) -> str:
-    history_txt = "\n".join([f"مستخدم: {h[0]}\nمعالج: {h[1]}" for h in history])
+    history_txt = history_text(history, "evaluate")
     return (
         f"راجع الرد التالي من معالج افتراضي عماني:\n"
         f"{history_txt}\n"
@@ -95,57 +325,149 @@ def evaluator_prompt(user_message: str, generated_response: str, history: List[T
     )
 
 
-def generate_response(
+def response_prompt(
         transcript: str,
         emotion: str,
         history: List[Tuple[str, str]] = [],
-        user_insights: str = "",
-        lang_hint: str = "Omani Arabic",
-        code_switching: bool = True
+        user_insights: str = ""
 ) -> str:
-    user_message = transcript.strip()
-    prompt = (
+    return (
         f"{system_prompt(history, user_insights)}\n"
-        f"سؤال المستخدم: {user_message}\n"
+        f"سؤال المستخدم: {transcript.strip()}\n"
         f"العاطفة المتوقعة: {emotion}\n"
         f"جواب المعالج:"
     )
+
+
+async def generate_response(
+        transcript: str,
+        emotion: str,
+        history: List[Tuple[str, str]] = [],
+        user_insights: str = "",
+        lang_hint: str = "Omani Arabic",
+        code_switching: bool = True
+) -> str:
+    user_message = transcript.strip()
+    prompt = response_prompt(transcript, emotion, history, user_insights)
     try:
-        raw_response = call_gemini_api(prompt, max_tokens=128, temperature=0.45)
+        with span("generate"):
+            raw_response = await call_gemini_api(prompt, max_tokens=128, temperature=0.45)
         if not raw_response:
             logger.warning("[Response] Empty LLM response; returning default")
-            return "أشكرك على تواصلك. أنصحك بمراجعة مختص إذا كنت تمر بأزمة."
-        eval_prompt = evaluator_prompt(user_message, raw_response, history)
-        final_response = call_gemini_api(eval_prompt, max_tokens=128, temperature=0.25)
-        return final_response.strip() if final_response else raw_response.strip()
+            return FALLBACK_REPLY
+        return await refine_response(user_message, raw_response, history)
     except Exception as e:
         logger.error(f"[Response] Error: {e}")
-        return "عذراً، حصل خلل فني. حاول مرة ثانية أو تواصل مع مختص."
+        return ERROR_REPLY
+
+
+async def refine_response(user_message: str, draft: str, history: List[Tuple[str, str]] = []) -> str:
+    """
+    Evaluator pass over a draft reply, governed by settings.REFINE_POLICY.
+    Every decision is recorded in refinement_stats.
+    """
+    policy = settings.REFINE_POLICY
+    if policy == "never":
+        refinement_stats.record("skipped", "policy_never")
+        return draft.strip()
+    if policy == "heuristic":
+        needed, reason = needs_refinement(draft)
+        if not needed:
+            refinement_stats.record("skipped", reason)
+            return draft.strip()
+    else:
+        reason = f"policy_{policy}"
+
+    eval_prompt = evaluator_prompt(user_message, draft, history)
+    start = time.perf_counter()
+    try:
+        with span("evaluate"):
+            if policy == "deadline":
+                final_response = await asyncio.wait_for(
+                    call_gemini_api(eval_prompt, max_tokens=128, temperature=0.25), settings.REFINE_DEADLINE_S
+                )
+            else:
+                final_response = await call_gemini_api(eval_prompt, max_tokens=128, temperature=0.25)
+    except asyncio.TimeoutError:
+        refinement_stats.record("deadline_expired", reason, time.perf_counter() - start)
+        return draft.strip()
+    elapsed = time.perf_counter() - start
+    if not final_response:
+        refinement_stats.record("failed", reason, elapsed)
+        return draft.strip()
+    refinement_stats.record("refined", reason, elapsed, changed=final_response.strip() != draft.strip())
+    return final_response.strip()
+
+
+async def stream_response(
+        transcript: str,
+        emotion: str,
+        history: List[Tuple[str, str]] = [],
+        user_insights: str = ""
+) -> AsyncIterator[str]:
+    """
+    Streaming variant of generate_response: yields the draft as Gemini produces it.
+    The evaluator rewrite needs the complete draft, so it is skipped on this path.
+    """
+    prompt = response_prompt(transcript, emotion, history, user_insights)
+    produced = False
+    try:
+        async for delta in get_llm_client().stream(prompt, max_tokens=128, temperature=0.45):
+            produced = True
+            yield delta
+        if not produced:
+            logger.warning("[Response] Empty LLM stream; returning default")
+            yield FALLBACK_REPLY
+    except Exception as e:
+        logger.error(f"[Response] Stream error: {e}")
+        if not produced:
+            yield ERROR_REPLY
 
 
 # --- Gemini API Utility ---
-def call_gemini_api(
+async def call_gemini_api(
         prompt: str,
         max_tokens: int = 128,
         temperature: float = 0.4,
-        model: str = "gemini-2.0-flash"
+        model: str = DEFAULT_MODEL,
+        response_schema: Optional[dict] = None
 ) -> str:
     """
     Handles communication with Gemini API and error logging.
+    Uses the shared pooled client so concurrent turns never block the event loop.
+    Short classification calls are hedged when GEMINI_HEDGE_AFTER_S is set.
     """
-    try:
-        endpoint = f"https://generativelanguage.googleapis.com/v1beta/models/{model}:generateContent?key={settings.GEMINI_API_KEY}"
-        import requests
-        headers = {"Content-Type": "application/json"}
-        payload = {
-            "contents": [{"parts": [{"text": prompt}]}],
-            "generationConfig": {"temperature": temperature, "maxOutputTokens": max_tokens}
-        }
-        resp = requests.post(endpoint, headers=headers, json=payload, timeout=60)
-        if not resp.ok:
-            logger.error(f"[Gemini API] {resp.status_code}: {resp.text}")
-            return ""
-        return resp.json()["candidates"][0]["content"]["parts"][0]["text"].strip()
-    except Exception as e:
-        logger.error(f"[Gemini API] Request failed: {e}")
-        return ""
+    # Labelled by the pipeline stage that made the call (emotion, crisis, reply, ...)
+    stage = current_stage.get()
+    hedge_after_s = settings.GEMINI_HEDGE_AFTER_S if stage in settings.GEMINI_HEDGE_STAGES else 0
+    start = time.perf_counter()
+    text = await get_llm_client().generate(
+        prompt, max_tokens=max_tokens, temperature=temperature, model=model, response_schema=response_schema,
+        hedge_after_s=hedge_after_s
+    )
+    if settings.METRICS_ENABLED:
+        llm_seconds.observe(stage, time.perf_counter() - start)
+        if not text:
+            llm_errors.inc(stage)
+    return text
+
+
+# --- Sync Wrappers (tests & scripts only; never call from the event loop) ---
+def call_gemini_api_sync(*args, **kwargs) -> str:
+    return run_sync(call_gemini_api(*args, **kwargs))
+
+
+def analyze_emotion_sync(*args, **kwargs) -> str:
+    return run_sync(analyze_emotion(*args, **kwargs))
+
+
+def is_crisis_sync(*args, **kwargs) -> bool:
+    return run_sync(is_crisis(*args, **kwargs))
+
+
+def generate_response_sync(*args, **kwargs) -> str:
+    return run_sync(generate_response(*args, **kwargs))
+
+
+def classify_turn_sync(*args, **kwargs) -> TurnClassification:
+    return run_sync(classify_turn(*args, **kwargs))
@@ -0,0 +1,191 @@
+# backend/tts_cache.py
+
+import os
+import wave
+import shutil
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional
+
+from backend.config import get_settings
+from backend.speech_utils import synthesize_pcm, _save_wave, TTS_MODEL, TTS_VOICE
+
+settings = get_settings()
+logger = logging.getLogger("tts_cache")
+logger.setLevel(logging.INFO)
+
+AUDIO_FORMAT = "wav-pcm16-mono-24k"  # what _save_wave writes; part of the cache key
+CACHE_DIR = os.path.join(settings.DATA_DIR, "tts_cache")
+
+
+def cache_key(text: str, voice: str = TTS_VOICE, model: str = TTS_MODEL, audio_format: str = AUDIO_FORMAT) -> str:
+    material = "\0".join((model, voice, audio_format, text.strip()))
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+class TTSCache:
+    """
+    Content-addressed on-disk cache of synthesized replies.
+
+    Entries live at <root>/<key[:2]>/<key>.wav. Recency is tracked in memory (and in file
+    mtimes, so order survives restarts); when the total size exceeds `max_bytes` the least
+    recently used unpinned entries are deleted. Prewarmed fixed replies are pinned.
+    """
+
+    def __init__(self, root: str = CACHE_DIR, max_bytes: int = 0):
+        self.root = root
+        self.max_bytes = max_bytes or settings.TTS_CACHE_MAX_MB * 1024 * 1024
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._index: "OrderedDict[str, int]" = OrderedDict()  # key -> size, oldest first
+        self._pinned = set()
+        self._total = 0
+        os.makedirs(self.root, exist_ok=True)
+        self._load_index()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, key[:2], f"{key}.wav")
+
+    def _load_index(self) -> None:
+        entries = []
+        for shard in os.scandir(self.root):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                if entry.name.endswith(".wav"):
+                    st = entry.stat()
+                    entries.append((st.st_mtime, entry.name[:-4], st.st_size))
+        for _, key, size in sorted(entries):
+            self._index[key] = size
+            self._total += size
+        logger.info(f"[TTSCache] Loaded {len(self._index)} entries ({self._total / 1e6:.1f} MB)")
+
+    # --- Lookup ---
+    def lookup(self, text: str, voice: str = TTS_VOICE) -> Optional[str]:
+        """Path of the cached WAV for `text`, or None. Counts a hit or a miss."""
+        key = cache_key(text, voice)
+        path = self._path(key)
+        with self._lock:
+            if key in self._index and os.path.isfile(path):
+                self._index.move_to_end(key)
+                self.hits += 1
+            else:
+                self._drop(key)
+                self.misses += 1
+                return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return path
+
+    def store(self, text: str, pcm: bytes, voice: str = TTS_VOICE, pin: bool = False) -> str:
+        key = cache_key(text, voice)
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        _save_wave(pcm, tmp)
+        os.replace(tmp, path)  # atomic: readers never see a partial file
+        size = os.path.getsize(path)
+        with self._lock:
+            self._total += size - self._index.pop(key, 0)
+            self._index[key] = size
+            if pin:
+                self._pinned.add(key)
+            self._evict()
+        return path
+
+    def _drop(self, key: str) -> None:
+        size = self._index.pop(key, None)
+        if size is not None:
+            self._total -= size
+
+    def _evict(self) -> None:
+        for key in list(self._index):
+            if self._total <= self.max_bytes:
+                break
+            if key in self._pinned:
+                continue
+            self._drop(key)
+            self.evictions += 1
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+
+    # --- Synthesis through the cache ---
+    def get_or_synthesize(self, text: str, voice: str = TTS_VOICE) -> str:
+        """Path to a WAV of `text` (cached, or synthesized and cached). '' on TTS failure."""
+        path = self.lookup(text, voice)
+        if path:
+            return path
+        pcm = synthesize_pcm(text, voice)
+        if not pcm:
+            return ""
+        return self.store(text, pcm, voice)
+
+    def get_or_synthesize_pcm(self, text: str, voice: str = TTS_VOICE) -> bytes:
+        """Raw PCM of `text` for streaming; b'' on TTS failure."""
+        path = self.lookup(text, voice)
+        if path:
+            try:
+                with wave.open(path, "rb") as wf:
+                    return wf.readframes(wf.getnframes())
+            except (OSError, wave.Error) as e:
+                logger.warning(f"[TTSCache] Unreadable entry {path}: {e}")
+        pcm = synthesize_pcm(text, voice)
+        if pcm:
+            self.store(text, pcm, voice)
+        return pcm
+
+    def prewarm(self, texts: Iterable[str], voice: str = TTS_VOICE) -> None:
+        """Synthesize and pin fixed replies so they are always served from disk."""
+        for text in texts:
+            key = cache_key(text, voice)
+            if os.path.isfile(self._path(key)):
+                with self._lock:
+                    self._pinned.add(key)
+                continue
+            pcm = synthesize_pcm(text, voice)
+            if pcm:
+                self.store(text, pcm, voice, pin=True)
+                logger.info(f"[TTSCache] Prewarmed: {text[:30]}...")
+            else:
+                logger.warning(f"[TTSCache] Prewarm failed: {text[:30]}...")
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "entries": len(self._index),
+                "bytes": self._total,
+            }
+
+
+def materialize(cached_path: str, dest_path: str) -> None:
+    """Place a cached WAV at `dest_path` (hard link when possible, else copy)."""
+    if os.path.exists(dest_path):
+        os.remove(dest_path)
+    try:
+        os.link(cached_path, dest_path)
+    except OSError:
+        shutil.copyfile(cached_path, dest_path)
+
+
+_cache: Optional[TTSCache] = None
+
+
+def get_tts_cache() -> TTSCache:
+    """Process-wide TTS cache."""
+    global _cache
+    if _cache is None:
+        _cache = TTSCache()
+    return _cache
@@ -0,0 +1,268 @@
+# backend/uploads.py
+
+import asyncio
+import logging
+import threading
+from collections import Counter, deque
+from typing import Deque, Dict, List, Optional, Tuple
+
+from fastapi import HTTPException, UploadFile
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from backend.config import get_settings
+
+settings = get_settings()
+logger = logging.getLogger("uploads")
+logger.setLevel(logging.INFO)
+
+CHUNK_SIZE = 64 * 1024
+# Room for the multipart boundaries, part headers and the session_id field around the audio
+MULTIPART_OVERHEAD = 64 * 1024
+
+upload_stats: Counter = Counter()
+
+
+def max_upload_bytes() -> int:
+    return settings.MAX_AUDIO_MB * 1024 * 1024
+
+
+def _too_large() -> HTTPException:
+    return HTTPException(status_code=413, detail=f"Audio file too large (max {settings.MAX_AUDIO_MB}MB)")
+
+
+def looks_like_wav(head: bytes) -> bool:
+    """RIFF container with a WAVE form type (the first 12 bytes of any WAV file)."""
+    return len(head) >= 12 and head[:4] == b"RIFF" and head[8:12] == b"WAVE"
+
+
+# --- Buffer pool ---
+class UploadBufferPool:
+    """
+    Fixed set of reusable upload buffers, allocated lazily up to `count`. Uploads hold one
+    buffer while they are read and preprocessed, so upload memory never exceeds
+    count * size however many requests arrive at once; extra uploads wait for a buffer.
+    Buffers may be released from worker threads.
+    """
+
+    def __init__(self, count: int, size: int):
+        self.count = count
+        self.size = size
+        self._lock = threading.Lock()
+        self._free: List[bytearray] = []
+        self._allocated = 0
+        self._in_use = 0
+        self._waiters: Deque[Tuple[asyncio.AbstractEventLoop, asyncio.Future]] = deque()
+        # --- metrics ---
+        self.acquired = 0
+        self.waited = 0
+        self.timeouts = 0
+        self.peak_in_use = 0
+
+    async def acquire(self, timeout: float) -> bytearray:
+        """A free buffer; raises asyncio.TimeoutError if none frees up within `timeout`."""
+        with self._lock:
+            buf = self._take()
+            if buf is None:
+                loop = asyncio.get_running_loop()
+                waiter = loop.create_future()
+                self._waiters.append((loop, waiter))
+                self.waited += 1
+        if buf is not None:
+            return buf
+        try:
+            return await asyncio.wait_for(waiter, timeout)
+        except asyncio.TimeoutError:
+            with self._lock:
+                self.timeouts += 1
+            raise
+
+    def _take(self) -> Optional[bytearray]:
+        if self._free:
+            buf = self._free.pop()
+        elif self._allocated < self.count:
+            buf = bytearray(self.size)
+            self._allocated += 1
+        else:
+            return None
+        self._in_use += 1
+        self.acquired += 1
+        self.peak_in_use = max(self.peak_in_use, self._in_use)
+        return buf
+
+    def release(self, buf: bytearray) -> None:
+        with self._lock:
+            while self._waiters:
+                loop, waiter = self._waiters.popleft()
+                if waiter.done():
+                    continue
+                try:
+                    loop.call_soon_threadsafe(self._hand_over, waiter, buf)
+                    return
+                except RuntimeError:
+                    continue  # the waiter's loop is closed
+            self._in_use -= 1
+            self._free.append(buf)
+
+    def _hand_over(self, waiter: asyncio.Future, buf: bytearray) -> None:
+        # Runs on the waiter's loop; the buffer counts as in use while in transit
+        if waiter.done():  # timed out or cancelled meanwhile: pass it on
+            self.release(buf)
+            return
+        with self._lock:
+            self.acquired += 1
+        waiter.set_result(buf)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "buffers": self.count,
+                "buffer_bytes": self.size,
+                "allocated": self._allocated,
+                "in_use": self._in_use,
+                "peak_in_use": self.peak_in_use,
+                "acquired": self.acquired,
+                "waited": self.waited,
+                "wait_timeouts": self.timeouts,
+                "waiting": sum(not w.done() for _, w in self._waiters),
+            }
+
+
+class PooledUpload:
+    """
+    An upload held in a pooled buffer. The request holds one reference; each worker stage
+    that reads the buffer takes its own (retain/release), so the buffer goes back to the
+    pool only after the last reader is done, even if the request was cancelled meanwhile.
+    """
+
+    def __init__(self, pool: UploadBufferPool, buf: bytearray, size: int):
+        self._pool = pool
+        self._buf = buf
+        self.size = size
+        self._refs = 1
+        self._lock = threading.Lock()
+
+    @property
+    def view(self) -> memoryview:
+        return memoryview(self._buf)[:self.size]
+
+    def retain(self) -> bool:
+        """Take a reference; False if the buffer was already returned to the pool."""
+        with self._lock:
+            if self._refs == 0:
+                return False
+            self._refs += 1
+            return True
+
+    def release(self) -> None:
+        with self._lock:
+            if self._refs == 0:
+                return
+            self._refs -= 1
+            if self._refs:
+                return
+        self._pool.release(self._buf)
+
+
+async def read_wav_upload(audio: UploadFile, pool: UploadBufferPool, digest=None) -> PooledUpload:
+    """
+    Copy an uploaded WAV into a pooled buffer chunk by chunk. The RIFF/WAVE header is
+    checked on the first chunk (415) and the size limit as the data arrives (413), so
+    bad uploads are rejected without being read in full. `digest` (a hashlib object), if
+    given, is fed the same chunks.
+    """
+    try:
+        buf = await pool.acquire(settings.UPLOAD_WAIT_S)
+    except asyncio.TimeoutError:
+        upload_stats["rejected_busy"] += 1
+        logger.warning("[Uploads] No free upload buffer after %.1fs", settings.UPLOAD_WAIT_S)
+        raise HTTPException(status_code=503, detail="Server busy, please retry", headers={"Retry-After": "1"})
+
+    size = 0
+    try:
+        while True:
+            chunk = await audio.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            if size == 0 and not looks_like_wav(chunk):
+                upload_stats["rejected_format"] += 1
+                logger.warning("[Uploads] Not a WAV upload (content_type=%s)", audio.content_type)
+                raise HTTPException(status_code=415, detail="Unsupported audio format")
+            if size + len(chunk) > pool.size:
+                upload_stats["rejected_size"] += 1
+                logger.warning("[Uploads] Audio larger than %d MB rejected", settings.MAX_AUDIO_MB)
+                raise _too_large()
+            buf[size:size + len(chunk)] = chunk
+            size += len(chunk)
+            if digest is not None:
+                digest.update(chunk)
+        if size == 0:
+            upload_stats["rejected_format"] += 1
+            raise HTTPException(status_code=415, detail="Unsupported audio format")
+    except BaseException:
+        pool.release(buf)
+        raise
+    upload_stats["accepted"] += 1
+    upload_stats["accepted_bytes"] += size
+    return PooledUpload(pool, buf, size)
+
+
+# --- Request body limit ---
+class BodyLimitMiddleware:
+    """
+    Rejects oversized upload requests before the multipart parser buffers them: at once
+    when Content-Length is too large, otherwise as soon as the streamed body passes
+    `max_bytes`.
+    """
+
+    def __init__(self, app: ASGIApp, max_bytes: int, paths: Tuple[str, ...]):
+        self.app = app
+        self.max_bytes = max_bytes
+        self.paths = paths
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["path"] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+
+        for name, value in scope.get("headers", ()):
+            if name == b"content-length" and value.isdigit() and int(value) > self.max_bytes:
+                upload_stats["rejected_size"] += 1
+                await _send_413(send)
+                return
+
+        received = 0
+
+        async def limited_receive() -> Message:
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    upload_stats["rejected_size"] += 1
+                    # Raised inside body parsing, so FastAPI turns it into the 413 response
+                    raise _too_large()
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+
+async def _send_413(send: Send) -> None:
+    body = ('{"detail":"Audio file too large (max %dMB)"}' % settings.MAX_AUDIO_MB).encode()
+    await send({
+        "type": "http.response.start",
+        "status": 413,
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode()),
+                    (b"connection", b"close")],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+_pool: Optional[UploadBufferPool] = None
+
+
+def get_upload_pool() -> UploadBufferPool:
+    """Process-wide upload buffer pool."""
+    global _pool
+    if _pool is None:
+        _pool = UploadBufferPool(settings.UPLOAD_BUFFERS, max_upload_bytes())
+    return _pool
@@ -0,0 +1,169 @@
+# backend/worker.py
+"""
+Background job worker: runs queued jobs (currently insight evolution) outside the API process,
+so batch LLM work never competes with /chat/ for the API's event loop and threads.
+
+    python -m backend.worker [--workers N] [--once]
+
+Any number of worker processes may run against the same database. SIGINT/SIGTERM stop
+claiming new jobs and let running ones finish (an interrupted job is retried once its lease expires).
+"""
+import os
+import sys
+import time
+import signal
+import socket
+import asyncio
+import logging
+import argparse
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from backend.config import get_settings
+from backend.job_queue import Job, JobQueue, get_job_queue
+from backend.llm_client import close_llm_client
+from backend.evolution_core import EVOLVE_JOB, run_evolution_job
+
+settings = get_settings()
+logger = logging.getLogger("worker")
+logger.setLevel(logging.INFO)
+
+Handler = Callable[[dict], Awaitable[None]]
+
+HANDLERS: Dict[str, Handler] = {
+    EVOLVE_JOB: run_evolution_job,
+}
+
+
+class WorkerPool:
+    """
+    `concurrency` loops that each claim a job, run its handler under JOB_TIMEOUT_S while
+    heartbeating the lease, and record the outcome (done / retry with backoff / dead).
+    """
+
+    def __init__(
+            self,
+            queue: Optional[JobQueue] = None,
+            handlers: Optional[Dict[str, Handler]] = None,
+            concurrency: int = 0,
+            poll_interval_s: float = 0,
+            timeout_s: float = 0,
+    ):
+        self.queue = queue or get_job_queue()
+        self.handlers = handlers or HANDLERS
+        self.concurrency = concurrency or settings.JOB_WORKERS
+        self.poll_interval_s = poll_interval_s or settings.JOB_POLL_INTERVAL_S
+        self.timeout_s = timeout_s or settings.JOB_TIMEOUT_S
+        self.name = f"{socket.gethostname()}:{os.getpid()}"
+        self._stopping: Optional[asyncio.Event] = None
+        self._tasks: List[asyncio.Task] = []
+        # --- metrics ---
+        self.completed = 0
+        self.failed = 0
+        self.run_total_s = 0.0
+
+    async def start(self) -> None:
+        self._stopping = asyncio.Event()
+        self._tasks = [
+            asyncio.create_task(self._loop(f"{self.name}/{i}"), name=f"job-worker-{i}")
+            for i in range(self.concurrency)
+        ]
+        logger.info(f"[Worker] {self.name} started {self.concurrency} workers for {sorted(self.handlers)}")
+
+    async def stop(self) -> None:
+        """Stop claiming and wait for running jobs to finish."""
+        if self._stopping is None:
+            return
+        self._stopping.set()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        logger.info(f"[Worker] {self.name} stopped: {self.stats()}")
+
+    async def run_until_idle(self) -> int:
+        """Run jobs that are ready now, one at a time, until none are left. Returns jobs run."""
+        ran = 0
+        while await self._run_next(f"{self.name}/once"):
+            ran += 1
+        return ran
+
+    async def _loop(self, worker_id: str) -> None:
+        while not self._stopping.is_set():
+            try:
+                if await self._run_next(worker_id):
+                    continue
+            except Exception as e:  # database trouble: back off and keep the worker alive
+                logger.error(f"[Worker] {worker_id} claim failed: {e}")
+            try:
+                await asyncio.wait_for(self._stopping.wait(), self.poll_interval_s)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _run_next(self, worker_id: str) -> bool:
+        job = await asyncio.to_thread(self.queue.claim, worker_id, self.handlers.keys())
+        if job is None:
+            return False
+        start = time.perf_counter()
+        heartbeat = asyncio.create_task(self._heartbeat(job, worker_id))
+        try:
+            await asyncio.wait_for(self.handlers[job.kind](job.payload), self.timeout_s)
+        except Exception as e:
+            error = "timed out" if isinstance(e, asyncio.TimeoutError) else f"{type(e).__name__}: {e}"
+            self.failed += 1
+            await asyncio.to_thread(self.queue.fail, job, worker_id, error)
+        else:
+            self.completed += 1
+            await asyncio.to_thread(self.queue.complete, job, worker_id)
+            logger.info(f"[Worker] Job {job.job_id} ({job.kind}) done in "
+                        f"{time.perf_counter() - start:.2f}s (attempt {job.attempts})")
+        finally:
+            heartbeat.cancel()
+            self.run_total_s += time.perf_counter() - start
+        return True
+
+    async def _heartbeat(self, job: Job, worker_id: str) -> None:
+        while True:
+            await asyncio.sleep(self.queue.lease_s / 3)
+            if not await asyncio.to_thread(self.queue.heartbeat, job, worker_id):
+                logger.warning(f"[Worker] Lost the lease on job {job.job_id}")
+                return
+
+    def stats(self) -> Dict[str, float]:
+        runs = self.completed + self.failed
+        return {
+            "workers": self.concurrency,
+            "completed": self.completed,
+            "failed": self.failed,
+            "run_avg_s": self.run_total_s / runs if runs else 0.0,
+        }
+
+
+async def _main(workers: int, once: bool) -> None:
+    pool = WorkerPool(concurrency=workers)
+    purged = await asyncio.to_thread(pool.queue.purge_done, settings.JOB_RETAIN_DONE_S)
+    if purged:
+        logger.info(f"[Worker] Purged {purged} finished jobs")
+    try:
+        if once:
+            logger.info(f"[Worker] Ran {await pool.run_until_idle()} jobs")
+            return
+        await pool.start()
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, stop.set)
+        await stop.wait()
+        await pool.stop()
+    finally:
+        logger.info(f"[Worker] Queue: {await asyncio.to_thread(pool.queue.stats)}")
+        await close_llm_client()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=settings.JOB_WORKERS, help="concurrent jobs")
+    parser.add_argument("--once", action="store_true", help="run the jobs that are ready, then exit")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, stream=sys.stderr)
+    asyncio.run(_main(args.workers, args.once))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+# benchmarks/bench_crisis_lexicon.py
+"""
+Micro-benchmark for the crisis lexicon pre-screen.
+
+Times CrisisLexicon.match (normalization + Aho-Corasick pass) on synthetic transcripts
+of increasing length, against a naive per-phrase substring scan, with the shipped phrase
+list and with a 20x larger one: the automaton's cost depends on transcript length only,
+the scan's grows with the number of phrases. Also reports compile time and automaton size.
+
+    python -m benchmarks.bench_crisis_lexicon --iterations 20000
+"""
+import os
+import sys
+import time
+import random
+import logging
+import argparse
+import statistics
+
+os.environ.setdefault("GEMINI_API_KEY", "benchmark")
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from backend.arabic import normalize
+from backend.crisis_lexicon import CrisisLexicon, CRISIS_PHRASES
+
+WORDS = (
+    "والله", "أحس", "بضيق", "وتعب", "من", "الشغل", "وايد", "اليوم", "ما", "أدري", "شو", "أسوي",
+    "أهلي", "ما", "يفهموني", "الحمدلله", "بس", "الدنيا", "صعبة", "شوي", "ومتوتر", "من", "الامتحان",
+)
+
+
+def transcript(words: int, crisis: bool) -> str:
+    text = [random.choice(WORDS) for _ in range(words)]
+    if crisis:
+        text.insert(random.randrange(len(text) + 1), random.choice(CRISIS_PHRASES[:30]))
+    return " ".join(text)
+
+
+def time_us(fn, texts) -> list:
+    samples = []
+    for text in texts:
+        t0 = time.perf_counter()
+        fn(text)
+        samples.append((time.perf_counter() - t0) * 1e6)
+    return sorted(samples)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=20_000)
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)  # every crisis transcript logs a match
+    random.seed(0)
+
+    # Synthetic growth of the lexicon: each phrase with 19 made-up suffix words
+    large = tuple(CRISIS_PHRASES) + tuple(f"{p} زز{i}" for p in CRISIS_PHRASES for i in range(19))
+    for phrases in (CRISIS_PHRASES, large):
+        t0 = time.perf_counter()
+        lexicon = CrisisLexicon(phrases)
+        print(f"Compiled {len(lexicon.phrases)} phrases into {lexicon._automaton.states} states "
+              f"in {(time.perf_counter() - t0) * 1000:.1f} ms")
+        normalized = [normalize(p) for p in phrases]
+
+        def naive(text):
+            norm = normalize(text)
+            return next((p for p in normalized if p in norm), None)
+
+        for words in (10, 40, 150):
+            texts = [transcript(words, crisis=i % 10 == 0) for i in range(args.iterations)]
+            for label, fn in (("aho-corasick", lexicon.match), ("substring scan", naive)):
+                samples = time_us(fn, texts)
+                p99 = samples[int(len(samples) * 0.99) - 1]
+                print(f"  {words:>3} words  {label:<15} "
+                      f"median {statistics.median(samples):7.1f} us   p99 {p99:7.1f} us")
+
+
+if __name__ == "__main__":
+    main()
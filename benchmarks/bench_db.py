@@ -0,0 +1,126 @@
+# benchmarks/bench_db.py
+"""
+Micro-benchmark for the SQLite storage layer.
+
+Builds a database with the original (v1, unindexed) schema, times the history and
+export queries against it with a fresh connection per call (the old db.py behaviour),
+then applies the storage migrations to a copy and times the same queries through the
+pooled connection.
+
+    python -m benchmarks.bench_db --rows 1000000 --sessions 20000
+"""
+import os
+import sys
+import time
+import shutil
+import random
+import sqlite3
+import argparse
+import tempfile
+import statistics
+from datetime import datetime, timedelta
+
+os.environ.setdefault("GEMINI_API_KEY", "benchmark")
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from backend.storage import MIGRATIONS, get_connection, migrate
+
+HISTORY_SQL = """
+    SELECT transcript, bot_response FROM sessions
+    WHERE session_id = ? ORDER BY timestamp ASC LIMIT 50
+"""
+RECENT_SQL = """
+    SELECT transcript, bot_response FROM (
+        SELECT transcript, bot_response, timestamp FROM sessions
+        WHERE session_id = ? ORDER BY timestamp DESC LIMIT 50
+    ) ORDER BY timestamp ASC
+"""
+EXPORT_SQL = "SELECT * FROM sessions WHERE session_id = ? ORDER BY timestamp ASC"
+INSERT_SQL = """
+    INSERT INTO sessions (
+        session_id, timestamp, transcript, emotion,
+        bot_response, crisis_flag, audio_path, bot_audio_path
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+
+def build_legacy_db(path: str, rows: int, sessions: int) -> None:
+    conn = sqlite3.connect(path)
+    cur = conn.cursor()
+    MIGRATIONS[0][2](cur)  # v1 schema only
+    conn.execute("PRAGMA user_version=1")
+    start = datetime(2025, 1, 1)
+    batch = []
+    for i in range(rows):
+        sid = f"session-{random.randrange(sessions):06d}"
+        ts = (start + timedelta(seconds=i)).isoformat()
+        batch.append((sid, ts, "أحس بضيق وتعب من الشغل", "قلق", "خذ نفس عميق، أنا معك", 0, "u.wav", "b.wav"))
+        if len(batch) == 50_000:
+            cur.executemany(INSERT_SQL, batch)
+            batch.clear()
+    if batch:
+        cur.executemany(INSERT_SQL, batch)
+    conn.commit()
+    conn.close()
+
+
+def time_queries(run, session_ids, label: str) -> None:
+    samples = []
+    for sid in session_ids:
+        t0 = time.perf_counter()
+        run(sid)
+        samples.append((time.perf_counter() - t0) * 1000)
+    samples.sort()
+    p95 = samples[int(len(samples) * 0.95) - 1]
+    print(f"  {label:<28} median {statistics.median(samples):8.3f} ms   p95 {p95:8.3f} ms")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--sessions", type=int, default=20_000)
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench_db_")
+    legacy_path = os.path.join(workdir, "legacy.db")
+    migrated_path = os.path.join(workdir, "migrated.db")
+    try:
+        t0 = time.perf_counter()
+        build_legacy_db(legacy_path, args.rows, args.sessions)
+        print(f"Built {args.rows:,} rows / {args.sessions:,} sessions in {time.perf_counter() - t0:.1f}s")
+        session_ids = [f"session-{random.randrange(args.sessions):06d}" for _ in range(args.queries)]
+
+        def legacy(sql):
+            def run(sid):
+                with sqlite3.connect(legacy_path) as conn:
+                    conn.execute(sql, (sid,)).fetchall()
+            return run
+
+        print("v1 schema, connection per call:")
+        time_queries(legacy(HISTORY_SQL), session_ids, "get_history")
+        time_queries(legacy(RECENT_SQL), session_ids, "get_recent_history")
+        time_queries(legacy(EXPORT_SQL), session_ids, "export_session")
+
+        shutil.copyfile(legacy_path, migrated_path)
+        t0 = time.perf_counter()
+        version = migrate(migrated_path)
+        print(f"Migrated to v{version} in {time.perf_counter() - t0:.1f}s")
+
+        def pooled(sql):
+            def run(sid):
+                conn = get_connection(migrated_path)
+                with conn:
+                    conn.execute(sql, (sid,)).fetchall()
+            return run
+
+        print(f"v{version} schema, pooled WAL connection:")
+        time_queries(pooled(HISTORY_SQL), session_ids, "get_history")
+        time_queries(pooled(RECENT_SQL), session_ids, "get_recent_history")
+        time_queries(pooled(EXPORT_SQL), session_ids, "export_session")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+# benchmarks/eval_emotion.py
+"""
+Offline evaluation of the local emotion model against the labels the LLM gave historical turns.
+
+Turns are split into folds by session (a session is never in both train and test), the
+model is trained on the other folds, and each test turn is compared with its logged label.
+Reports overall agreement, coverage/agreement of the tiered mode at each confidence
+threshold, and per-call prediction latency.
+
+    python -m benchmarks.eval_emotion --folds 5 --thresholds 0.6 0.8 0.9 0.95
+"""
+import os
+import sys
+import time
+import zlib
+import argparse
+import statistics
+from collections import Counter
+
+os.environ.setdefault("GEMINI_API_KEY", "benchmark")
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from backend.emotion_model import EmotionModel, canonical_label, labelled_turns
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", default="", help="sessions database (default: DATA_DIR/session_logs.db)")
+    parser.add_argument("--folds", type=int, default=5)
+    parser.add_argument("--min-label-count", type=int, default=3)
+    parser.add_argument("--thresholds", type=float, nargs="+", default=[0.6, 0.8, 0.9, 0.95])
+    args = parser.parse_args()
+
+    turns = labelled_turns(args.db)
+    sessions = {sid for sid, _, _ in turns}
+    folds = max(2, min(args.folds, len(sessions)))
+    if len(sessions) < 2:
+        sys.exit(f"Need turns from at least 2 sessions, found {len(sessions)}")
+    print(f"{len(turns):,} labelled turns, {len(sessions):,} sessions, {folds} folds")
+    print(f"Label distribution: {Counter(canonical_label(l) for _, _, l in turns).most_common(10)}")
+
+    fold_of = lambda sid: zlib.crc32(sid.encode()) % folds
+    predictions = []  # (predicted, confidence, expected)
+    latencies_us = []
+    for k in range(folds):
+        train = [(text, label) for sid, text, label in turns if fold_of(sid) != k]
+        test = [(text, label) for sid, text, label in turns if fold_of(sid) == k]
+        if not test:
+            continue
+        try:
+            model = EmotionModel.fit(train, args.min_label_count)
+        except ValueError:
+            print(f"  fold {k}: not enough labelled training data, skipped")
+            continue
+        for text, label in test:
+            t0 = time.perf_counter()
+            predicted, confidence = model.predict(text)
+            latencies_us.append((time.perf_counter() - t0) * 1e6)
+            predictions.append((canonical_label(predicted), confidence, canonical_label(label)))
+
+    if not predictions:
+        sys.exit("No fold could be evaluated")
+    agree = sum(p == e for p, _, e in predictions)
+    print(f"\nAgreement with LLM labels (all turns): {agree / len(predictions):.1%} of {len(predictions):,}")
+    print(f"{'threshold':>10} {'served locally':>16} {'agreement there':>16} {'LLM calls saved':>16}")
+    for threshold in sorted(args.thresholds):
+        served = [(p, e) for p, c, e in predictions if c >= threshold]
+        rate = sum(p == e for p, e in served) / len(served) if served else 0.0
+        print(f"{threshold:>10.2f} {len(served) / len(predictions):>16.1%} {rate:>16.1%} {len(served):>16,}")
+
+    latencies_us.sort()
+    p95 = latencies_us[max(int(len(latencies_us) * 0.95) - 1, 0)]
+    print(f"\nPrediction latency: median {statistics.median(latencies_us):.1f} us, p95 {p95:.1f} us")
+
+
+if __name__ == "__main__":
+    main()
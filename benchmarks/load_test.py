@@ -0,0 +1,279 @@
+# benchmarks/load_test.py
+"""
+End-to-end load test of the API against the mock Gemini server (no API quota spent).
+
+Starts benchmarks.mock_gemini and the API (uvicorn, fresh DATA_DIR) as subprocesses, then
+runs N concurrent simulated users. Each user opens a session, sends `--turns` voice turns
+to /chat/ using the WAVs in data/user_inputs, fetches each reply from /audio/…, and ends
+the session. Reports throughput, end-to-end percentiles per endpoint, per-stage
+percentiles (from the Server-Timing header), errors and the API's peak RSS.
+
+    python -m benchmarks.load_test --users 20 --turns 5 --save-baseline benchmarks/baseline.json
+    python -m benchmarks.load_test --users 20 --turns 5 --baseline benchmarks/baseline.json
+
+With --baseline the run fails (exit 1) when throughput drops or a p95 grows by more than
+--tolerance. Mock latency/error options are passed through (see benchmarks.mock_gemini).
+"""
+import os
+import sys
+import json
+import glob
+import time
+import socket
+import uuid
+import random
+import asyncio
+import argparse
+import tempfile
+import subprocess
+from collections import defaultdict
+from typing import Dict, List
+
+import httpx
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+PERCENTILES = (50, 95, 99)
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def percentile(samples: List[float], p: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+
+def summarize(samples: List[float]) -> Dict[str, float]:
+    return {"count": len(samples), **{f"p{p}_ms": percentile(samples, p) * 1000 for p in PERCENTILES}}
+
+
+def rss_mb(pid: int) -> float:
+    """Resident memory of `pid` and its children (uvicorn workers), from /proc. 0 where unavailable."""
+    total_kb = 0
+    pids = [pid]
+    try:
+        for stat_path in glob.glob("/proc/[0-9]*/stat"):
+            with open(stat_path) as f:
+                fields = f.read().rsplit(")", 1)[-1].split()
+            if int(fields[1]) == pid:  # ppid
+                pids.append(int(stat_path.split("/")[2]))
+        for p in pids:
+            with open(f"/proc/{p}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        total_kb += int(line.split()[1])
+    except (OSError, ValueError, IndexError):
+        pass
+    return total_kb / 1024
+
+
+def parse_server_timing(header: str) -> Dict[str, float]:
+    """{stage: seconds} from 'stt;dur=812.3, emotion;dur=402.1, ...'."""
+    stages = {}
+    for part in filter(None, (p.strip() for p in header.split(","))):
+        name, _, params = part.partition(";")
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "dur":
+                stages[name] = float(value) / 1000
+    return stages
+
+
+class Recorder:
+    def __init__(self):
+        self.latency: Dict[str, List[float]] = defaultdict(list)
+        self.stages: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+        self.statuses: Dict[str, int] = defaultdict(int)
+
+    async def request(self, client: httpx.AsyncClient, endpoint: str, method: str, url: str, **kwargs):
+        start = time.perf_counter()
+        try:
+            resp = await client.request(method, url, **kwargs)
+        except httpx.HTTPError as e:
+            self.errors[endpoint] += 1
+            self.statuses[f"{endpoint} {type(e).__name__}"] += 1
+            return None
+        self.latency[endpoint].append(time.perf_counter() - start)
+        self.statuses[f"{endpoint} {resp.status_code}"] += 1
+        if resp.status_code >= 400:
+            self.errors[endpoint] += 1
+        if endpoint == "chat" and "server-timing" in resp.headers:
+            for stage, seconds in parse_server_timing(resp.headers["server-timing"]).items():
+                self.stages[stage].append(seconds)
+        return resp
+
+
+async def simulate_user(client: httpx.AsyncClient, recorder: Recorder, clips: List[bytes], turns: int, think_s: float):
+    resp = await recorder.request(client, "start_session", "POST", "/start_session/")
+    if resp is None or resp.status_code != 201:
+        return
+    session_id = resp.json()["session_id"]
+    for _ in range(turns):
+        resp = await recorder.request(
+            client, "chat", "POST", "/chat/",
+            data={"session_id": session_id}, files={"audio": ("turn.wav", random.choice(clips), "audio/wav")},
+            # Each turn is new: a repeated clip must run the pipeline, not be replayed as a duplicate
+            headers={"Idempotency-Key": uuid.uuid4().hex}
+        )
+        if resp is not None and resp.status_code == 200:
+            # bot_audio_url points at the frontend proxy; the API serves the same path without /api
+            audio_path = "/audio/" + resp.json()["bot_audio_url"].split("/audio/", 1)[1]
+            await recorder.request(client, "audio", "GET", audio_path)
+        if think_s:
+            await asyncio.sleep(random.uniform(0, 2 * think_s))
+    await recorder.request(client, "end_session", "POST", "/end_session/", data={"session_id": session_id})
+
+
+async def run_load(base_url: str, api_pid: int, clips: List[bytes], users: int, turns: int, think_s: float) -> dict:
+    recorder = Recorder()
+    peak_rss = rss_mb(api_pid)
+    limits = httpx.Limits(max_connections=users, max_keepalive_connections=users)
+    async with httpx.AsyncClient(base_url=base_url, timeout=120, limits=limits) as client:
+        start = time.perf_counter()
+        load = asyncio.gather(*(simulate_user(client, recorder, clips, turns, think_s) for _ in range(users)))
+        while not load.done():
+            await asyncio.wait([load], timeout=0.5)
+            peak_rss = max(peak_rss, rss_mb(api_pid))
+        await load
+        elapsed = time.perf_counter() - start
+    completed = sum(len(v) for v in recorder.latency.values())
+    return {
+        "users": users,
+        "turns_per_user": turns,
+        "elapsed_s": elapsed,
+        "requests_per_s": completed / elapsed,
+        "chat_turns_per_s": len(recorder.latency["chat"]) / elapsed,
+        "errors": dict(recorder.errors),
+        "statuses": dict(recorder.statuses),
+        "endpoints": {name: summarize(samples) for name, samples in sorted(recorder.latency.items())},
+        "stages": {name: summarize(samples) for name, samples in sorted(recorder.stages.items())},
+        "peak_rss_mb": peak_rss,
+    }
+
+
+def compare(result: dict, baseline: dict, tolerance: float) -> List[str]:
+    """Regressions of `result` against `baseline`: lower throughput or higher p95, beyond `tolerance`."""
+    regressions = []
+    if result["requests_per_s"] < baseline["requests_per_s"] * (1 - tolerance):
+        regressions.append(f"throughput {result['requests_per_s']:.2f} req/s < baseline {baseline['requests_per_s']:.2f}")
+    for group in ("endpoints", "stages"):
+        for name, stats in result[group].items():
+            base = baseline.get(group, {}).get(name)
+            # Sub-millisecond stages are noise; only flag growth that is also at least 5 ms
+            if base and stats["p95_ms"] > base["p95_ms"] * (1 + tolerance) and stats["p95_ms"] - base["p95_ms"] > 5:
+                regressions.append(f"{group[:-1]} '{name}' p95 {stats['p95_ms']:.1f} ms > baseline {base['p95_ms']:.1f} ms")
+    base_rss = baseline.get("peak_rss_mb") or 0
+    if base_rss and result["peak_rss_mb"] > base_rss * (1 + tolerance):
+        regressions.append(f"peak RSS {result['peak_rss_mb']:.0f} MB > baseline {base_rss:.0f} MB")
+    return regressions
+
+
+def print_report(result: dict) -> None:
+    print(f"\n{result['users']} users x {result['turns_per_user']} turns in {result['elapsed_s']:.1f}s: "
+          f"{result['requests_per_s']:.2f} req/s, {result['chat_turns_per_s']:.2f} chat turns/s, "
+          f"peak RSS {result['peak_rss_mb']:.0f} MB")
+    for group in ("endpoints", "stages"):
+        print(f"\n{group:<16}{'count':>7}" + "".join(f"{f'p{p} ms':>10}" for p in PERCENTILES))
+        for name, stats in result[group].items():
+            print(f"  {name:<14}{stats['count']:>7}" + "".join(f"{stats[f'p{p}_ms']:>10.1f}" for p in PERCENTILES))
+    if result["errors"]:
+        print(f"\nerrors: {result['errors']}  statuses: {result['statuses']}")
+
+
+def wait_ready(url: str, proc: subprocess.Popen, timeout: float = 60) -> None:
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"{proc.args} exited with {proc.returncode}")
+        try:
+            if httpx.get(url, timeout=1).status_code < 500:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"{url} not ready after {timeout}s")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=10, help="concurrent simulated users")
+    parser.add_argument("--turns", type=int, default=3, help="voice turns per user session")
+    parser.add_argument("--think", type=float, default=0.0, help="mean pause between a user's turns (s)")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn worker processes for the API")
+    parser.add_argument("--audio-dir", default=os.path.join(ROOT, "data", "user_inputs"))
+    parser.add_argument("--latency", action="append", metavar="KIND=MEDIAN[:SIGMA]", help="mock latency (repeatable)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="mock failure rate")
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE", help="extra API settings")
+    parser.add_argument("--baseline", help="compare against this saved result; exit 1 on regression")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="allowed relative regression")
+    parser.add_argument("--save-baseline", help="write this run's result here")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    random.seed(args.seed)
+
+    clips = [open(path, "rb").read() for path in sorted(glob.glob(os.path.join(args.audio_dir, "*.wav")))]
+    if not clips:
+        sys.exit(f"No WAV files in {args.audio_dir}")
+
+    mock_port, api_port = free_port(), free_port()
+    mock_cmd = [sys.executable, "-m", "benchmarks.mock_gemini", "--port", str(mock_port), "--seed", str(args.seed),
+                "--error-rate", str(args.error_rate)]
+    for value in args.latency or ():
+        mock_cmd += ["--latency", value]
+    data_dir = tempfile.mkdtemp(prefix="loadtest-")
+    env = {
+        **os.environ,
+        "GEMINI_API_KEY": os.environ.get("GEMINI_API_KEY", "loadtest"),
+        "GEMINI_BASE_URL": f"http://127.0.0.1:{mock_port}",
+        "DATA_DIR": data_dir,
+        **dict(value.split("=", 1) for value in args.env),
+    }
+    api_cmd = [sys.executable, "-m", "uvicorn", "backend.main:app", "--port", str(api_port),
+               "--workers", str(args.workers), "--log-level", "warning"]
+
+    # Server logs go to a file so the report stays readable
+    log_path = os.path.join(data_dir, "servers.log")
+    log = open(log_path, "w")
+    procs = []
+    try:
+        procs.append(subprocess.Popen(mock_cmd, cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT))
+        wait_ready(f"http://127.0.0.1:{mock_port}/calls", procs[0])
+        procs.append(subprocess.Popen(api_cmd, cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT))
+        wait_ready(f"http://127.0.0.1:{api_port}/stats/", procs[1])
+        print(f"API on :{api_port} (DATA_DIR={data_dir}, logs in {log_path}), mock Gemini on :{mock_port}; "
+              f"{len(clips)} clips, {args.users} users x {args.turns} turns")
+        result = asyncio.run(run_load(
+            f"http://127.0.0.1:{api_port}", procs[1].pid, clips, args.users, args.turns, args.think
+        ))
+        result["mock_calls"] = httpx.get(f"http://127.0.0.1:{mock_port}/calls").json()
+    finally:
+        for proc in reversed(procs):
+            proc.terminate()
+            try:
+                proc.wait(timeout=15)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+        log.close()
+
+    print_report(result)
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump(result, f, indent=2, ensure_ascii=False)
+        print(f"\nSaved baseline to {args.save_baseline}")
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(result, json.load(f), args.tolerance)
+        if regressions:
+            print("\nREGRESSIONS:\n  " + "\n  ".join(regressions))
+            sys.exit(1)
+        print(f"\nNo regressions against {args.baseline} (tolerance {args.tolerance:.0%})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,205 @@
+# benchmarks/mock_gemini.py
+"""
+Local stand-in for the Gemini REST endpoints the backend uses, so load tests spend no quota:
+
+    POST /v1beta/models/{model}:generateContent        STT (audio part), TTS (AUDIO modality),
+                                                       classification (JSON schema) and text replies
+    POST /v1beta/models/{model}:streamGenerateContent  SSE reply stream
+    POST /upload/v1beta/files (+ resumable upload URL) files.upload for large clips
+
+Each call sleeps for a latency drawn from a per-kind log-normal distribution and fails with
+`--error-status` at `--error-rate`. Point the backend at it with GEMINI_BASE_URL.
+
+    python -m benchmarks.mock_gemini --port 8090 --latency llm=0.4:0.5 --latency tts=0.8:0.3 --error-rate 0.01
+"""
+import json
+import math
+import uuid
+import base64
+import random
+import asyncio
+import argparse
+from typing import Dict, Tuple
+
+import numpy as np
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+
+# kind -> (median seconds, sigma of the underlying normal)
+DEFAULT_LATENCY: Dict[str, Tuple[float, float]] = {
+    "stt": (0.8, 0.4),
+    "tts": (0.9, 0.4),
+    "llm": (0.35, 0.5),
+    "stream": (0.05, 0.5),   # per streamed chunk
+    "upload": (0.2, 0.3),
+}
+TTS_RATE = 24000
+TRANSCRIPTS = (
+    "والله أحس بضيق من الشغل هالأيام",
+    "ما أقدر أنام زين وأفكر وايد",
+    "الحمدلله اليوم أحسن شوي من أمس",
+    "أهلي ما يفهموني وأحس إني بروحي",
+    "متوتر من الامتحانات وما أدري شو أسوي",
+)
+REPLY = "أفهم شعورك، وهذا شي طبيعي. خذ نفس عميق، وخبرني أكثر عن اللي مضايقك. أنا هني أسمعك."
+
+
+class MockConfig:
+    def __init__(self, latency: Dict[str, Tuple[float, float]], error_rate: float, error_status: int, seed: int):
+        self.latency = {**DEFAULT_LATENCY, **latency}
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.random = random.Random(seed)
+        self.calls: Dict[str, int] = {}
+
+    async def delay(self, kind: str) -> None:
+        median, sigma = self.latency[kind]
+        await asyncio.sleep(self.random.lognormvariate(math.log(max(median, 1e-6)), sigma) if median > 0 else 0)
+
+    def failed(self, kind: str):
+        self.calls[kind] = self.calls.get(kind, 0) + 1
+        if self.random.random() < self.error_rate:
+            return JSONResponse(
+                {"error": {"code": self.error_status, "message": "mock failure", "status": "UNAVAILABLE"}},
+                status_code=self.error_status,
+            )
+        return None
+
+
+def _text_response(text: str) -> dict:
+    return {"candidates": [{"content": {"role": "model", "parts": [{"text": text}]}, "finishReason": "STOP"}]}
+
+
+def _audio_response(text: str) -> dict:
+    # ~70 ms of audio per character: a quiet tone, so payload sizes match real replies
+    samples = int(TTS_RATE * min(0.07 * len(text), 20.0))
+    pcm = (np.sin(np.arange(samples) * (2 * np.pi * 220 / TTS_RATE)) * 3000).astype("<i2").tobytes()
+    part = {"inlineData": {"mimeType": f"audio/L16;codec=pcm;rate={TTS_RATE}", "data": base64.b64encode(pcm).decode()}}
+    return {"candidates": [{"content": {"role": "model", "parts": [part]}, "finishReason": "STOP"}]}
+
+
+def _prompt_text(body: dict) -> str:
+    return " ".join(
+        part.get("text", "") for content in body.get("contents", []) for part in content.get("parts", [])
+    )
+
+
+def _has_media(body: dict) -> bool:
+    return any(
+        "inlineData" in part or "fileData" in part or "inline_data" in part or "file_data" in part
+        for content in body.get("contents", []) for part in content.get("parts", [])
+    )
+
+
+def _reply_text(body: dict, prompt: str) -> str:
+    """Plausible answer to one of the backend's text prompts (recognized by their question)."""
+    if body.get("generationConfig", {}).get("responseSchema"):
+        return json.dumps({"emotion": "قلق", "crisis": False, "confidence": 0.9}, ensure_ascii=False)
+    if "هل هناك أي علامات على وجود أزمة" in prompt:
+        return "لا"
+    if "ما هي العاطفة الأساسية" in prompt:
+        return "قلق"
+    if "ملف تعريف المستخدم" in prompt:
+        return "- يعاني من ضغط العمل\n- يفضل الردود القصيرة"
+    return REPLY
+
+
+def create_app(config: MockConfig) -> FastAPI:
+    app = FastAPI(title="Mock Gemini")
+    uploads: Dict[str, bytearray] = {}
+
+    @app.post("/v1beta/models/{model_action}")
+    async def generate(model_action: str, request: Request):
+        body = await request.json()
+        prompt = _prompt_text(body)
+        modalities = body.get("generationConfig", {}).get("responseModalities") or []
+        if model_action.endswith(":streamGenerateContent"):
+            kind = "stream"
+        elif "AUDIO" in modalities:
+            kind = "tts"
+        elif _has_media(body):
+            kind = "stt"
+        else:
+            kind = "llm"
+        error = config.failed(kind)
+        if kind == "stream":
+            await config.delay("llm")  # time to first token
+            if error:
+                return error
+            return StreamingResponse(_sse(config), media_type="text/event-stream")
+        await config.delay(kind)
+        if error:
+            return error
+        if kind == "tts":
+            return _audio_response(prompt)
+        if kind == "stt":
+            return _text_response(config.random.choice(TRANSCRIPTS))
+        return _text_response(_reply_text(body, prompt))
+
+    @app.post("/upload/v1beta/files")
+    async def create_upload(request: Request):
+        upload_id = uuid.uuid4().hex
+        uploads[upload_id] = bytearray()
+        url = f"{request.base_url}upload/v1beta/files/{upload_id}"
+        return Response("{}", media_type="application/json", headers={"x-goog-upload-url": url})
+
+    @app.post("/upload/v1beta/files/{upload_id}")
+    async def upload_chunk(upload_id: str, request: Request):
+        data = uploads.setdefault(upload_id, bytearray())
+        data.extend(await request.body())
+        if "finalize" not in request.headers.get("x-goog-upload-command", ""):
+            return Response("{}", media_type="application/json", headers={"x-goog-upload-status": "active"})
+        await config.delay("upload")
+        error = config.failed("upload")
+        if error:
+            return error
+        size = len(uploads.pop(upload_id))
+        file = {
+            "name": f"files/{upload_id}", "uri": f"{request.base_url}v1beta/files/{upload_id}",
+            "mimeType": "audio/wav", "sizeBytes": str(size), "state": "ACTIVE",
+        }
+        return JSONResponse({"file": file}, headers={"x-goog-upload-status": "final"})
+
+    @app.get("/calls")
+    def calls():
+        return config.calls
+
+    return app
+
+
+async def _sse(config: MockConfig):
+    words = REPLY.split(" ")
+    for i in range(0, len(words), 3):
+        chunk = " ".join(words[i:i + 3]) + (" " if i + 3 < len(words) else "")
+        yield f"data: {json.dumps(_text_response(chunk), ensure_ascii=False)}\r\n\r\n"
+        await config.delay("stream")
+
+
+def parse_latency(values) -> Dict[str, Tuple[float, float]]:
+    latency = {}
+    for value in values or ():
+        kind, _, spec = value.partition("=")
+        median, _, sigma = spec.partition(":")
+        if kind not in DEFAULT_LATENCY:
+            raise argparse.ArgumentTypeError(f"unknown latency kind '{kind}' (one of {', '.join(DEFAULT_LATENCY)})")
+        latency[kind] = (float(median), float(sigma or DEFAULT_LATENCY[kind][1]))
+    return latency
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--latency", action="append", metavar="KIND=MEDIAN[:SIGMA]",
+                        help=f"log-normal latency per call kind ({', '.join(DEFAULT_LATENCY)}); repeatable")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of calls that fail")
+    parser.add_argument("--error-status", type=int, default=503)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    config = MockConfig(parse_latency(args.latency), args.error_rate, args.error_status, args.seed)
+    uvicorn.run(create_app(config), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
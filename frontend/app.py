@@ -1,19 +1,30 @@
 import streamlit as st
 import requests
 import io
-import tempfile
+import base64
+import hashlib
 
 # --- Configuration ---
 API_BASE = "http://localhost:8000"  # Adjust for your deployment
 
 st.set_page_config(page_title="🇴🇲 المُعالج الصوتي العُماني", layout="centered")
+
+
+@st.cache_resource
+def get_http() -> requests.Session:
+    """One keep-alive connection pool to the API, shared across Streamlit reruns."""
+    return requests.Session()
+
+
+http = get_http()
+
 st.title("🇴🇲 المُعالج الصوتي العُماني")
 st.markdown("**تحدث صوتيًا، استمع للإجابة، بدون تحميل ملفات**\n---")
 
 # --- Session Management ---
 if "session_id" not in st.session_state or "consent_text" not in st.session_state:
     try:
-        resp = requests.post(f"{API_BASE}/start_session/")
+        resp = http.post(f"{API_BASE}/start_session/")
         resp.raise_for_status()
         data = resp.json()
         st.session_state["session_id"] = data["session_id"]
@@ -48,30 +59,32 @@ if send_btn:
         feedback_box.error("يرجى تسجيل صوتك أولًا.")
     else:
         try:
-            files = {'audio': ('voice.wav', io.BytesIO(audio_file.getbuffer()), 'audio/wav')}
-            data = {'session_id': session_id}
+            audio_bytes = bytes(audio_file.getbuffer())
+            files = {'audio': ('voice.wav', io.BytesIO(audio_bytes), 'audio/wav')}
+            # Reply audio comes back inline, so no second request for bot_audio_url
+            data = {'session_id': session_id, 'inline_audio': 'true'}
+            # A recording sent twice (double click, rerun) is processed once; the API replays the reply
+            headers = {'Idempotency-Key': hashlib.sha256(audio_bytes).hexdigest()}
             with st.spinner("يتم المعالجة ..."):
-                resp = requests.post(f"{API_BASE}/chat/", files=files, data=data, timeout=90)
+                resp = http.post(f"{API_BASE}/chat/", files=files, data=data, headers=headers, timeout=90)
                 resp.raise_for_status()
                 result = resp.json()
-                audio_url = result["bot_audio_url"]
-                # Download and verify bot audio
-                audio_resp = requests.get(audio_url)
-                audio_resp.raise_for_status()
-                # Debug info
-                st.write(f"Audio URL: {audio_url}")
-                st.write(f"Response status: {audio_resp.status_code}, length: {len(audio_resp.content)} bytes")
-
-                if audio_resp.status_code == 200 and len(audio_resp.content) > 100:
-                    # (Optional) Save for debugging—remove in production
-                    with tempfile.NamedTemporaryFile(delete=False, suffix=".wav") as temp_audio:
-                        temp_audio.write(audio_resp.content)
-                        temp_audio_path = temp_audio.name
+                if result.get("bot_audio"):
+                    reply_audio = base64.b64decode(result["bot_audio"])
+                    reply_format = result.get("bot_audio_mime", "audio/wav")
+                else:
+                    # Older API without inline audio
+                    audio_resp = http.get(result["bot_audio_url"], timeout=30)
+                    audio_resp.raise_for_status()
+                    reply_audio = audio_resp.content
+                    reply_format = audio_resp.headers.get("content-type", "audio/wav")
+
+                if len(reply_audio) > 100:
                     st.info("تم إرسال الصوت بنجاح. استمع للرد.")
-                    audio_out_box.audio(audio_resp.content, format="audio/wav")
+                    audio_out_box.audio(reply_audio, format=reply_format)
                 else:
                     feedback_box.error("لم يتم استلام صوت صحيح من الخادم.")
-                    st.error(f"حجم الملف المستلم: {len(audio_resp.content)} بايت")
+                    st.error(f"حجم الملف المستلم: {len(reply_audio)} بايت")
         except Exception as e:
             feedback_box.error("حدث خطأ أثناء المعالجة. الرجاء المحاولة مرة أخرى.")
             st.error(str(e))
@@ -0,0 +1,65 @@
+# tests/test_admission.py
+import sys
+import os
+import asyncio
+
+import pytest
+
+os.environ["GEMINI_API_KEY"] = "dummy_key"
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from fastapi import HTTPException
+
+from backend import metrics
+from backend.admission import AdmissionController
+
+
+def test_one_turn_per_session_and_bounded_queue():
+    async def run():
+        admission = AdmissionController(max_turns=1, queue_max=1, queue_timeout_s=5, rate=0)
+        first = await admission.enter("a")
+
+        with pytest.raises(HTTPException) as busy:
+            await admission.enter("a")
+        assert busy.value.status_code == 429
+
+        queued = asyncio.create_task(admission.enter("b"))
+        await asyncio.sleep(0.01)
+        assert not queued.done()
+        with pytest.raises(HTTPException) as full:
+            await admission.enter("c")
+        assert full.value.status_code == 503 and "Retry-After" in full.value.headers
+
+        first.release()
+        first.release()  # idempotent
+        second = await asyncio.wait_for(queued, 1)
+        assert admission.stats()["active"] == 1
+        second.release()
+        return admission.stats()
+
+    waits_before = metrics.admission_seconds.summary().get("admitted", {}).get("count", 0)
+    stats = asyncio.run(run())
+    assert stats["active"] == 0 and stats["admitted"] == 2 and stats["queued"] == 1
+    assert stats["rejected_session_busy"] == 1 and stats["rejected_queue_full"] == 1
+    assert metrics.admission_seconds.summary()["admitted"]["count"] == waits_before + 2
+
+
+def test_queue_timeout_and_rate_limit():
+    async def run():
+        admission = AdmissionController(max_turns=1, queue_max=4, queue_timeout_s=0.05, rate=0)
+        held = await admission.enter("a")
+        with pytest.raises(HTTPException) as timed_out:
+            await admission.enter("b")
+        assert timed_out.value.status_code == 503
+        held.release()
+        # The timed-out waiter left no trace: the next turn is admitted at once
+        (await asyncio.wait_for(admission.enter("b"), 0.01)).release()
+
+        limited = AdmissionController(max_turns=8, queue_max=4, queue_timeout_s=0.05, rate=1, burst=1)
+        (await limited.enter("a")).release()
+        with pytest.raises(HTTPException) as too_fast:
+            await limited.enter("b")
+        assert too_fast.value.status_code == 429 and int(too_fast.value.headers["Retry-After"]) >= 1
+
+    asyncio.run(run())
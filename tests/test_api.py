@@ -0,0 +1,344 @@
+# tests/test_api.py
+import sys
+import os
+import io
+import time
+import uuid
+import wave
+import base64
+import asyncio
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+os.environ["GEMINI_API_KEY"] = "dummy_key"
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from fastapi.testclient import TestClient
+
+from backend import audio_store, main, tts_cache, uploads
+from backend.admission import AdmissionController
+from backend.audio_store import AudioStore, HotAudioCache, audio_etag
+from backend.idempotency import TurnCoalescer
+from backend.main import app
+from backend.therapy_core import CRISIS_REPLY, FIXED_REPLIES
+from backend.tts_cache import TTSCache
+from backend.uploads import UploadBufferPool, get_upload_pool
+
+SESSION = "7f90e346-20c6-43d5-b71b-57aaf3c1bf6f"
+
+
+def _wav(seconds: float = 0.5, rate: int = 24000, tone: float = 0.0) -> bytes:
+    t = np.arange(int(rate * seconds)) / rate
+    pcm = (tone * np.sin(2 * np.pi * 220 * t) * 32767).astype("<i2").tobytes()
+    buf = io.BytesIO()
+    with wave.open(buf, "wb") as wf:
+        wf.setnchannels(1)
+        wf.setsampwidth(2)
+        wf.setframerate(rate)
+        wf.writeframes(pcm)
+    return buf.getvalue()
+
+
+VOICE = _wav(1.0, 16000, tone=0.3)
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    monkeypatch.setattr(audio_store, "_store", AudioStore(root=str(tmp_path), codec="wav"))
+    monkeypatch.setattr(audio_store, "_hot", HotAudioCache(max_bytes=1 << 20))
+    return audio_store._store
+
+
+@asynccontextmanager
+async def _no_lifespan(app):
+    yield
+
+
+@pytest.fixture
+def client(store, monkeypatch):
+    # No lifespan: no migrations, TTS prewarm or job workers against the real data directory.
+    # Entered all the same, so every request runs on one event loop, as under uvicorn.
+    monkeypatch.setattr(app.router, "lifespan_context", _no_lifespan)
+    with TestClient(app) as client:
+        yield client
+
+
+class _Writer:
+    def __init__(self):
+        self.turns = []
+
+    async def log(self, *turn):
+        self.turns.append(turn)
+
+
+class _History:
+    def get(self, session_id):
+        return []
+
+    def record_turn(self, session_id, transcript, bot_response):
+        pass
+
+
+@pytest.fixture
+def turn(tmp_path, monkeypatch, store):
+    """/chat/ with Gemini, the DB and the TTS cache replaced; `calls` counts the model stages run."""
+    reply = tmp_path / "reply.wav"
+    reply.write_bytes(_wav(tone=0.1))
+    fake = SimpleNamespace(
+        calls=Counter(), transcript="ضايق شوي اليوم", tts_texts=[], reply_wav=reply.read_bytes(), writer=_Writer(),
+        admission=AdmissionController(max_turns=8, queue_max=8, queue_timeout_s=5, rate=0),
+        coalescer=TurnCoalescer(ttl_s=60, max_bytes=1 << 20),
+    )
+
+    def transcribe(audio_bytes):
+        fake.calls["stt"] += 1
+        return fake.transcript
+
+    async def emotion(transcript, history):
+        fake.calls["emotion"] += 1
+        return "حزن"
+
+    async def crisis(transcript, history):
+        fake.calls["crisis"] += 1
+        return False
+
+    async def generate(transcript, emotion, **kwargs):
+        fake.calls["reply"] += 1
+        return "أنا هنا معك"
+
+    def synthesize(text):
+        fake.tts_texts.append(text)
+        return str(reply)
+
+    monkeypatch.setattr(main, "transcribe_audio_bytes", transcribe)
+    monkeypatch.setattr(main, "analyze_emotion", emotion)
+    monkeypatch.setattr(main, "is_crisis", crisis)
+    monkeypatch.setattr(main, "generate_response", generate)
+    monkeypatch.setattr(main, "get_user_insights", lambda user_id: "")
+    monkeypatch.setattr(main, "get_history_store", lambda: _History())
+    monkeypatch.setattr(main, "get_tts_cache", lambda: SimpleNamespace(get_or_synthesize=synthesize))
+    monkeypatch.setattr(main, "get_conversation_writer", lambda: fake.writer)
+    monkeypatch.setattr(main, "get_admission", lambda: fake.admission)
+    monkeypatch.setattr(main, "get_turn_coalescer", lambda: fake.coalescer)
+    monkeypatch.setattr(main.settings, "CLASSIFIER_MODE", "split")
+    return fake
+
+
+def _post_turn(client, audio: bytes = VOICE, session_id: str = SESSION, headers=None, **form):
+    return client.post(
+        "/chat/", data={"session_id": session_id, **form}, files={"audio": ("voice.wav", audio, "audio/wav")},
+        headers=headers or {},
+    )
+
+
+def test_inline_audio_returns_the_reply_in_the_response(client, turn):
+    inline = _post_turn(client, inline_audio="true")
+    assert inline.status_code == 200
+    body = inline.json()
+    assert base64.b64decode(body["bot_audio"]) == turn.reply_wav and body["bot_audio_mime"] == "audio/wav"
+    # Nobody will GET it: no hot-cache entry is made
+    assert audio_store.get_hot_audio_cache().stats()["entries"] == 0
+
+    default = _post_turn(client, _wav(1.0, 16000, tone=0.25))
+    assert default.status_code == 200
+    assert set(default.json()) == {"transcript", "emotion", "crisis_flag", "bot_audio_url"}
+    assert audio_store.get_hot_audio_cache().stats()["entries"] == 1
+    assert len(turn.writer.turns) == 2
+    assert all(os.path.isfile(user_path) and os.path.isfile(bot_path) for *_, user_path, bot_path in turn.writer.turns)
+
+
+def test_reply_audio_etag_is_the_same_from_memory_and_disk(client, store):
+    name = f"{SESSION}_20250101_000000_reply"
+    url = f"/audio/{SESSION}/20250101_000000/"
+    wav = _wav()
+    audio_store.get_hot_audio_cache().put(name, wav)
+    store.write("bot_outputs", name, wav)
+
+    hot = client.get(url)
+    assert hot.status_code == 200 and hot.content == wav
+    assert hot.headers["etag"] == audio_etag(name) and hot.headers["accept-ranges"] == "bytes"
+    assert client.get(url, headers={"If-None-Match": hot.headers["etag"]}).status_code == 304
+
+    partial = client.get(url, headers={"Range": "bytes=0-9"})
+    assert partial.status_code == 206 and partial.content == wav[:10]
+    assert partial.headers["content-range"] == f"bytes 0-9/{len(wav)}"
+    assert client.get(url, headers={"Range": f"bytes={len(wav)}-"}).status_code == 416
+
+    # Evicted from memory: revalidation still matches, so nothing is downloaded again
+    audio_store._hot = HotAudioCache(max_bytes=1 << 20)  # restored by the fixture's monkeypatch
+    disk = client.get(url)
+    assert disk.status_code == 200 and disk.content == wav and disk.headers["etag"] == hot.headers["etag"]
+    assert client.get(url, headers={"If-None-Match": hot.headers["etag"]}).status_code == 304
+    partial = client.get(url, headers={"Range": "bytes=-10"})
+    assert partial.status_code == 206 and partial.content == wav[-10:]
+
+
+def test_unknown_or_unsafe_audio_is_not_found(client):
+    assert client.get(f"/audio/{SESSION}/20250101_000001/").status_code == 404
+    assert client.get("/audio/..%2F..%2Fetc/passwd/").status_code == 404
+
+
+def test_lexicon_hit_answers_with_the_prewarmed_crisis_reply(client, turn, tmp_path, monkeypatch):
+    synthesized = []
+
+    def synthesize_pcm(text, voice):
+        synthesized.append(text)
+        return bytes(4800)
+
+    monkeypatch.setattr(tts_cache, "synthesize_pcm", synthesize_pcm)
+    cache = TTSCache(root=str(tmp_path / "tts"))
+    cache.prewarm(FIXED_REPLIES)
+    monkeypatch.setattr(main, "get_tts_cache", lambda: cache)
+    turn.transcript = "والله تعبت وأفكر أنتحر"
+
+    response = _post_turn(client)
+    assert response.status_code == 200 and response.json()["crisis_flag"] is True
+    assert turn.writer.turns[0][3] == CRISIS_REPLY
+    # No classification or reply calls, and the reply audio came from the prewarmed entry
+    assert turn.calls == {"stt": 1}
+    assert len(synthesized) == len(FIXED_REPLIES) and cache.stats()["hits"] == 1
+    stages = {entry.split(";")[0].strip() for entry in response.headers["server-timing"].split(",")}
+    assert "transcript" in stages and "reply" not in stages and "generate" not in stages
+
+
+def _metric(text: str, sample: str) -> float:
+    for line in text.splitlines():
+        if line.startswith(sample + " "):
+            return float(line.rsplit(" ", 1)[1])
+    return 0.0
+
+
+def test_turn_stages_reach_server_timing_and_metrics(client, turn):
+    stages = ("read_upload", "preprocess", "transcript", "emotion", "crisis", "reply", "tts", "store_reply", "log")
+    before = client.get("/metrics").text
+
+    response = _post_turn(client)
+    assert response.status_code == 200
+    timings = [entry.strip().split(";") for entry in response.headers["server-timing"].split(",")]
+    assert set(stages) <= {name for name, _ in timings}
+    assert timings[-1][0] == "total" and all(dur.startswith("dur=") for _, dur in timings)
+
+    scraped = client.get("/metrics")
+    assert scraped.status_code == 200 and scraped.headers["content-type"].startswith("text/plain")
+    assert "# TYPE omani_stage_duration_seconds histogram" in scraped.text
+    for stage in stages:
+        sample = f'omani_stage_duration_seconds_count{{stage="{stage}"}}'
+        assert _metric(scraped.text, sample) == _metric(before, sample) + 1
+    sample = 'omani_http_request_duration_seconds_count{route="/chat/"}'
+    assert _metric(scraped.text, sample) == _metric(before, sample) + 1
+
+
+def _stall_stt(monkeypatch, turn):
+    """Turns block in STT, holding their admission slot, until `proceed` is set."""
+    entered, proceed = threading.Event(), threading.Event()
+
+    def transcribe(audio_bytes):
+        entered.set()
+        proceed.wait(5)
+        return turn.transcript
+
+    monkeypatch.setattr(main, "transcribe_audio_bytes", transcribe)
+    return entered, proceed
+
+
+def test_busy_session_and_full_queue_are_refused_with_retry_after(client, turn, monkeypatch):
+    turn.admission = AdmissionController(max_turns=1, queue_max=1, queue_timeout_s=5, rate=0)
+    entered, proceed = _stall_stt(monkeypatch, turn)
+    held, queued_session = str(uuid.uuid4()), str(uuid.uuid4())
+    with ThreadPoolExecutor(2) as pool:
+        first = pool.submit(_post_turn, client, VOICE, held)
+        assert entered.wait(5)
+        busy = _post_turn(client, _wav(1.0, 16000, tone=0.2), held)
+        assert busy.status_code == 429 and busy.headers["retry-after"] == "1"
+
+        queued = pool.submit(_post_turn, client, VOICE, queued_session)
+        deadline = time.monotonic() + 5
+        while turn.admission.stats()["waiting"] < 1 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        full = _post_turn(client, VOICE, str(uuid.uuid4()))
+        assert full.status_code == 503 and full.headers["retry-after"] == "5"
+
+        proceed.set()
+        assert first.result().status_code == 200 and queued.result().status_code == 200
+    assert turn.admission.stats()["rejected_session_busy"] == 1
+    assert turn.admission.stats()["rejected_queue_full"] == 1
+
+
+def test_rate_limited_and_timed_out_turns_are_refused_with_retry_after(client, turn, monkeypatch):
+    turn.admission = AdmissionController(max_turns=8, queue_max=8, queue_timeout_s=0.05, rate=0.5, burst=1)
+    assert _post_turn(client, VOICE, str(uuid.uuid4())).status_code == 200
+    limited = _post_turn(client, VOICE, str(uuid.uuid4()))
+    assert limited.status_code == 429 and limited.headers["retry-after"] == "2"
+
+    turn.admission = AdmissionController(max_turns=1, queue_max=8, queue_timeout_s=0.05, rate=0)
+    entered, proceed = _stall_stt(monkeypatch, turn)
+    with ThreadPoolExecutor(1) as pool:
+        first = pool.submit(_post_turn, client, VOICE, str(uuid.uuid4()))
+        assert entered.wait(5)
+        timed_out = _post_turn(client, VOICE, str(uuid.uuid4()))
+        assert timed_out.status_code == 503 and timed_out.headers["retry-after"] == "1"
+        proceed.set()
+        assert first.result().status_code == 200
+    assert turn.admission.stats()["rejected_queue_timeout"] == 1
+
+
+def test_resent_turn_is_replayed_and_logged_once(client, turn):
+    first = _post_turn(client)
+    again = _post_turn(client)
+    assert first.status_code == again.status_code == 200 and again.json() == first.json()
+    assert "idempotent-replayed" not in first.headers and again.headers["idempotent-replayed"] == "true"
+
+    keyed = _post_turn(client, headers={"Idempotency-Key": "turn-2"})
+    rerecorded = _post_turn(client, _wav(1.0, 16000, tone=0.2), headers={"Idempotency-Key": "turn-2"})
+    assert "idempotent-replayed" not in keyed.headers and rerecorded.headers["idempotent-replayed"] == "true"
+    assert turn.calls["stt"] == 2 and len(turn.writer.turns) == 2
+    assert get_upload_pool().stats()["in_use"] == 0
+
+
+def test_keyed_duplicate_of_a_running_turn_shares_its_result(client, turn, monkeypatch):
+    entered, proceed = _stall_stt(monkeypatch, turn)
+    key = {"Idempotency-Key": "turn-1"}
+    with ThreadPoolExecutor(2) as pool:
+        first = pool.submit(_post_turn, client, headers=key)
+        assert entered.wait(5)
+        duplicate = pool.submit(_post_turn, client, headers=key)
+        deadline = time.monotonic() + 5
+        while turn.coalescer.stats().get("joined", 0) < 1 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        # Without the header the turn is only known by its audio, read after admission: the session is busy
+        unkeyed = _post_turn(client)
+        assert unkeyed.status_code == 429 and unkeyed.headers["retry-after"] == "1"
+        proceed.set()
+        first, duplicate = first.result(), duplicate.result()
+    assert first.status_code == duplicate.status_code == 200 and duplicate.json() == first.json()
+    assert "idempotent-replayed" not in first.headers and duplicate.headers["idempotent-replayed"] == "true"
+    assert turn.coalescer.stats()["computed"] == 1 and len(turn.writer.turns) == 1
+    assert get_upload_pool().stats()["in_use"] == 0
+
+
+def test_replays_and_refusals_need_no_upload_buffer(client, turn, monkeypatch):
+    assert _post_turn(client, headers={"Idempotency-Key": "turn-1"}).status_code == 200
+    # Every buffer taken: whatever still answers never waited for one
+    pool = UploadBufferPool(count=1, size=get_upload_pool().size)
+    asyncio.run(pool.acquire(0))
+    monkeypatch.setattr(main, "get_upload_pool", lambda: pool)
+    monkeypatch.setattr(uploads.settings, "UPLOAD_WAIT_S", 5.0)
+
+    started = time.monotonic()
+    replayed = _post_turn(client, headers={"Idempotency-Key": "turn-1"})
+    assert replayed.status_code == 200 and replayed.headers["idempotent-replayed"] == "true"
+
+    entered, proceed = _stall_stt(monkeypatch, turn)
+    held = asyncio.run(turn.admission.enter(SESSION))  # a turn of this session is in progress
+    busy = _post_turn(client, _wav(1.0, 16000, tone=0.2))
+    assert busy.status_code == 429 and busy.headers["retry-after"] == "1"
+    held.release()
+    assert time.monotonic() - started < 1
+    assert pool.stats()["waited"] == 0 and not entered.is_set()
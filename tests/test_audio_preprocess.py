@@ -0,0 +1,60 @@
+# tests/test_audio_preprocess.py
+import sys
+import os
+import io
+import wave
+
+import numpy as np
+
+os.environ["GEMINI_API_KEY"] = "dummy_key"
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from backend.speech_utils import preprocess_wav, STT_SAMPLE_RATE
+
+
+def _wav(signal: np.ndarray, rate: int, channels: int) -> bytes:
+    pcm = (np.repeat(signal[:, None], channels, axis=1) * 32767).astype("<i2").tobytes()
+    buf = io.BytesIO()
+    with wave.open(buf, "wb") as wf:
+        wf.setnchannels(channels)
+        wf.setsampwidth(2)
+        wf.setframerate(rate)
+        wf.writeframes(pcm)
+    return buf.getvalue()
+
+
+def _clip(rate: int, lead_s: float, speech_s: float, tail_s: float) -> np.ndarray:
+    rng = np.random.default_rng(0)
+    t = np.arange(int(rate * speech_s)) / rate
+    speech = 0.3 * np.sin(2 * np.pi * 220 * t) * (1 + 0.5 * np.sin(2 * np.pi * 3 * t))
+    noise = lambda s: 0.001 * rng.standard_normal(int(rate * s))
+    return np.concatenate([noise(lead_s), speech, noise(tail_s)]).astype(np.float32)
+
+
+def test_downmix_resample_and_trim():
+    original = _wav(_clip(48000, lead_s=2.0, speech_s=1.5, tail_s=2.0), rate=48000, channels=2)
+    result = preprocess_wav(original)
+
+    assert result.has_speech
+    assert abs(result.original_duration_s - 5.5) < 0.01
+    assert 1.5 <= result.duration_s <= 2.0  # speech plus padding
+    with wave.open(io.BytesIO(result.wav), "rb") as wf:
+        assert wf.getnchannels() == 1
+        assert wf.getframerate() == STT_SAMPLE_RATE
+    assert result.bytes_saved > 0.9 * len(original)
+
+
+def test_silent_clip_is_rejected():
+    rng = np.random.default_rng(1)
+    silent = (0.0005 * rng.standard_normal(44100 * 3)).astype(np.float32)
+    result = preprocess_wav(_wav(silent, rate=44100, channels=1))
+    assert not result.has_speech
+    assert result.duration_s == 0
+
+
+def test_clips_with_little_or_no_silence_are_kept():
+    for lead_s, tail_s in ((0.0, 0.0), (0.1, 0.1)):
+        result = preprocess_wav(_wav(_clip(16000, lead_s, 3.0, tail_s), rate=16000, channels=1))
+        assert result.has_speech
+        assert result.duration_s >= 2.9
@@ -0,0 +1,106 @@
+# tests/test_audio_store.py
+import sys
+import os
+import io
+import wave
+
+import pytest
+
+os.environ["GEMINI_API_KEY"] = "dummy_key"
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from backend.audio_store import AudioStore, HotAudioCache, audio_etag, parse_range, is_safe_name, soundfile
+
+
+def _wav(seconds: float = 0.5, rate: int = 24000) -> bytes:
+    buf = io.BytesIO()
+    with wave.open(buf, "wb") as wf:
+        wf.setnchannels(1)
+        wf.setsampwidth(2)
+        wf.setframerate(rate)
+        wf.writeframes(bytes(int(rate * seconds) * 2))
+    return buf.getvalue()
+
+
+def test_sharded_paths_and_legacy_lookup(tmp_path):
+    store = AudioStore(root=str(tmp_path), codec="wav")
+    path = store.path_for("bot_outputs", "abc_20250101_000000_reply")
+    rel = os.path.relpath(path, tmp_path).split(os.sep)
+    assert rel[0] == "bot_outputs" and len(rel[1]) == 2 and len(rel[2]) == 2
+
+    assert store.write("bot_outputs", "abc_20250101_000000_reply", _wav()) == path
+    assert store.locate("bot_outputs", "abc_20250101_000000_reply") == path
+
+    legacy = tmp_path / "bot_outputs" / "old_20240101_000000_reply.wav"
+    legacy.write_bytes(_wav())
+    assert store.locate("bot_outputs", "old_20240101_000000_reply") == str(legacy)
+    assert store.locate("bot_outputs", "missing") is None
+
+
+def test_migrate_legacy_moves_flat_files(tmp_path):
+    flat = tmp_path / "user_inputs"
+    flat.mkdir()
+    for i in range(3):
+        (flat / f"s_{i}.wav").write_bytes(_wav())
+    store = AudioStore(root=str(tmp_path), codec="wav")
+
+    moved = store.migrate_legacy("user_inputs")
+    assert len(moved) == 3
+    assert not any(name.endswith(".wav") for name in os.listdir(flat))
+    assert all(os.path.isfile(new) and store.locate("user_inputs", os.path.basename(new)[:-4]) == new
+               for _, new in moved)
+
+
+@pytest.mark.skipif(soundfile is None, reason="soundfile not installed")
+def test_flac_archive_is_encoded(tmp_path):
+    store = AudioStore(root=str(tmp_path), codec="flac")
+    wav = _wav(2.0)
+    path = store.write("user_inputs", "s_1", memoryview(wav))
+
+    assert path == store.path_for("user_inputs", "s_1") and store.locate("user_inputs", "s_1") == path
+    data, rate = soundfile.read(path, dtype="int16")
+    assert rate == 24000 and len(data) == 48000
+    assert os.path.getsize(path) < len(wav)
+
+
+@pytest.mark.skipif(soundfile is None, reason="soundfile not installed")
+def test_write_returns_the_path_of_the_codec_actually_used(tmp_path, monkeypatch):
+    store = AudioStore(root=str(tmp_path), codec="opus")
+    assert store.write("user_inputs", "s_opus", _wav(rate=24000)).endswith(".ogg")
+    # Opus can't take 44.1 kHz: stored as FLAC, and the returned path says so
+    path = store.write("user_inputs", "s_44k", _wav(rate=44100))
+    assert path.endswith(".flac") and os.path.isfile(path)
+
+    def broken(wav, codec):
+        raise RuntimeError("encoder crashed")
+
+    monkeypatch.setattr("backend.audio_store.encode_wav", broken)
+    path = store.write("user_inputs", "s_raw", _wav())
+    assert path.endswith(".wav") and os.path.isfile(path)
+    assert store.stats()["encode_failed"] == 1
+
+
+def test_hot_cache_evicts_by_bytes():
+    cache = HotAudioCache(max_bytes=100)
+    cache.put("a", b"x" * 60)
+    cache.put("b", b"y" * 60)
+    assert cache.get("a") is None
+    data, etag = cache.get("b")
+    assert data == b"y" * 60 and etag == audio_etag("b")
+
+
+def test_parse_range():
+    assert parse_range(None, 100) is None
+    assert parse_range("bytes=0-9", 100) == (0, 9)
+    assert parse_range("bytes=90-", 100) == (90, 99)
+    assert parse_range("bytes=-10", 100) == (90, 99)
+    assert parse_range("bytes=50-500", 100) == (50, 99)
+    assert parse_range("bytes=0-1,5-6", 100) is None
+    with pytest.raises(ValueError):
+        parse_range("bytes=100-", 100)
+
+
+def test_unsafe_names_refused():
+    assert is_safe_name("7f90e346-20c6-43d5-b71b-57aaf3c1bf6f_20250628_195726_reply")
+    assert not is_safe_name("../../etc/passwd")
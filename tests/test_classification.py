@@ -0,0 +1,63 @@
+# tests/test_classification.py
+import sys
+import os
+from unittest.mock import patch
+
+import pytest
+from pydantic import ValidationError
+
+os.environ["GEMINI_API_KEY"] = "dummy_key"
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from backend.config import Settings
+from backend.therapy_core import parse_classification, classify_turn_sync, settings
+
+
+def test_parse_plain_json():
+    result = parse_classification('{"emotion": "قلق", "crisis": false, "confidence": 0.82}')
+    assert result.emotion == "قلق"
+    assert result.crisis is False
+    assert result.confidence == 0.82
+
+
+def test_parse_fenced_and_string_flag():
+    raw = '```json\n{"emotion": "حزن شديد", "crisis": "نعم", "confidence": "1.4"}\n```'
+    result = parse_classification(raw)
+    assert result.emotion == "حزن"
+    assert result.crisis is True
+    assert result.confidence == 1.0
+
+
+def test_parse_rejects_missing_crisis():
+    assert parse_classification('{"emotion": "قلق"}') is None
+    assert parse_classification("قلق") is None
+    assert parse_classification("") is None
+
+
+def test_combined_mode_falls_back_to_split_calls():
+    replies = {
+        "json": "not json at all",
+        "emotion": "توتر",
+        "crisis": "لا",
+    }
+
+    async def fake_llm(prompt, max_tokens=128, temperature=0.4, model=None, response_schema=None):
+        if response_schema is not None:
+            return replies["json"]
+        return replies["emotion"] if "العاطفة الأساسية" in prompt else replies["crisis"]
+
+    with patch.object(settings, "CLASSIFIER_MODE", "combined"), \
+            patch("backend.therapy_core.call_gemini_api", side_effect=fake_llm) as mock_llm:
+        result = classify_turn_sync("مديري يضغط علي", [])
+
+    assert result.emotion == "توتر"
+    assert result.crisis is False
+    assert result.confidence is None
+    assert mock_llm.call_count == 3
+
+
+def test_unknown_classifier_mode_fails_at_startup():
+    assert Settings(CLASSIFIER_MODE="combined").CLASSIFIER_MODE == "combined"
+    with pytest.raises(ValidationError):
+        Settings(CLASSIFIER_MODE="combind")
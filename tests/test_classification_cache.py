@@ -0,0 +1,67 @@
+# tests/test_classification_cache.py
+import sys
+import os
+import time
+import asyncio
+
+os.environ["GEMINI_API_KEY"] = "dummy_key"
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import backend.therapy_core as therapy_core
+from backend.therapy_core import ClassificationCache
+
+
+def _fake_llm(calls, answers):
+    async def fake(prompt, **kwargs):
+        calls.append(prompt)
+        return answers.pop(0) if answers else "لا"
+    return fake
+
+
+def test_memoizes_on_normalized_transcript_and_history(monkeypatch):
+    calls = []
+    monkeypatch.setattr(therapy_core, "classification_cache", ClassificationCache(max_entries=10, ttl_s=60))
+    monkeypatch.setattr(therapy_core, "call_gemini_api", _fake_llm(calls, ["امتنان", "قلق"]))
+
+    first = asyncio.run(therapy_core.analyze_emotion("الحمدلله"))
+    again = asyncio.run(therapy_core.analyze_emotion("  الحَمدُلله "))
+    with_history = asyncio.run(therapy_core.analyze_emotion("الحمدلله", [("تعبان", "سلامتك")]))
+
+    assert first == again == "امتنان"
+    assert with_history == "قلق"
+    assert len(calls) == 2  # the new history window is a different prompt
+    assert therapy_core.classification_cache.stats()["emotion_hit_rate"] == 1 / 3
+
+
+def test_crisis_can_opt_out(monkeypatch):
+    calls = []
+    monkeypatch.setattr(therapy_core, "classification_cache", ClassificationCache(max_entries=10, ttl_s=60))
+    monkeypatch.setattr(therapy_core.settings, "CLASSIFY_CACHE_STAGES", ["emotion"])
+    monkeypatch.setattr(therapy_core, "call_gemini_api", _fake_llm(calls, ["لا", "لا"]))
+
+    asyncio.run(therapy_core.is_crisis("ما أدري"))
+    asyncio.run(therapy_core.is_crisis("ما أدري"))
+
+    assert len(calls) == 2
+    assert therapy_core.classification_cache.stats()["crisis_bypass"] == 2
+    assert not ClassificationCache.enabled("classification")
+
+
+def test_failures_are_not_cached(monkeypatch):
+    calls = []
+    monkeypatch.setattr(therapy_core, "classification_cache", ClassificationCache(max_entries=10, ttl_s=60))
+    monkeypatch.setattr(therapy_core, "call_gemini_api", _fake_llm(calls, ["", "حزن"]))
+
+    assert asyncio.run(therapy_core.analyze_emotion("شكراً")) == "محايد"
+    assert asyncio.run(therapy_core.analyze_emotion("شكراً")) == "حزن"
+    assert len(calls) == 2
+
+
+def test_entries_expire():
+    cache = ClassificationCache(max_entries=10, ttl_s=0.01)
+    key = cache.key("emotion", "شكراً", [])
+    cache.put(key, "امتنان")
+    assert cache.get(key) == "امتنان"
+    time.sleep(0.02)
+    assert cache.get(key) is ClassificationCache.MISS
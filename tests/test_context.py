@@ -0,0 +1,59 @@
+# tests/test_context.py
+import sys
+import os
+from unittest.mock import patch
+
+os.environ["GEMINI_API_KEY"] = "dummy_key"
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from backend.context import ContextBuilder, history_text, settings
+from backend.therapy_core import emotion_prompt, system_prompt
+
+
+def _turns(n):
+    return [(f"رسالة المستخدم رقم {i} " * 3, f"رد المعالج رقم {i} " * 3) for i in range(n)]
+
+
+def test_plain_list_renders_verbatim():
+    history = [("مرحبا", "أهلاً")]
+    assert history_text(history, "classify") == "مستخدم: مرحبا\nمعالج: أهلاً"
+
+
+def test_stage_budgets_keep_most_recent_turns():
+    builder = ContextBuilder()
+    with patch.object(settings, "CONTEXT_TOKENS_CLASSIFY", 60), \
+            patch.object(settings, "CONTEXT_TOKENS_GENERATE", 1000):
+        context = builder.build("s1", _turns(10))
+        classify = history_text(context, "classify")
+        generate = history_text(context, "generate")
+
+    assert "رقم 9" in classify and "رقم 0" not in classify
+    assert "رقم 0" in generate and "رقم 9" in generate
+    assert len(classify) < len(generate)
+    # prompts accept the context wherever they accepted the history list
+    assert classify in emotion_prompt(context, "كيف حالك")
+    assert generate in system_prompt(context)
+
+
+def test_turns_are_rendered_once_per_session():
+    builder = ContextBuilder()
+    with patch("backend.context.render_turn", side_effect=lambda t: f"{t[0]}|{t[1]}") as render:
+        builder.build("s1", _turns(3))
+        builder.build("s1", _turns(4))
+    assert render.call_count == 4
+
+
+def test_summary_replaces_overflowing_turns():
+    builder = ContextBuilder()
+    builder.build("s1", _turns(2))
+    builder._sessions["s1"].summary = "المستخدم قلق من العمل"
+    with patch.object(settings, "CONTEXT_TOKENS_GENERATE", 80), \
+            patch.object(settings, "CONTEXT_TOKENS_CLASSIFY", 50):
+        context = builder.build("s1", _turns(6))
+        window = history_text(context, "generate")
+        classify = history_text(context, "classify")
+    assert window.startswith("ملخص ما سبق: المستخدم قلق من العمل")
+    assert "رقم 5" in window and "رقم 0" not in window
+    # The summary ends where the generate window starts: a smaller window leaves it out
+    assert "ملخص" not in classify and "رقم 5" in classify
@@ -0,0 +1,60 @@
+# tests/test_crisis_lexicon.py
+import sys
+import os
+
+import pytest
+
+os.environ["GEMINI_API_KEY"] = "dummy_key"
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from backend.crisis_lexicon import AhoCorasick, CrisisLexicon
+
+# Regression set: every phrase here must keep matching as the lexicon evolves
+MUST_MATCH = [
+    "والله تعبت وأفكر أنتحر",
+    "أفكّر في الانتحار كل يوم",
+    "ما أبا أعيش خلاص",
+    "مابا أعيش بعد اللي صار",
+    "أبغى أموت وأرتاح",
+    "ودّي أموت",
+    "أتمنى الموت كل ليلة",
+    "الموت أرحم من هالحياة",
+    "بقتل نفسي إذا ما تغير شي",
+    "أحس إني بأذي نفسي",
+    "أمس جرحت نفسي بالموس",
+    "فكرت أقطع عروقي",
+    "وانتحرت صديقتي وأنا ودي أسوي نفس الشي",  # clitic و + suffix
+    "أبـــغى أمـــوت",  # tatweel
+    "I just want to die honestly",
+    "thinking about suicide",
+    "لا، أبا أموت",  # "no" as an answer, not a negated verb
+    "لا. ودي أموت والله",
+]
+
+MUST_NOT_MATCH = [
+    "أحس بضيق وتعب من الشغل",
+    "ميت من الضحك على السالفة",
+    "الحمدلله الأمور طيبة",
+    "ما أبا أموت، أبا أتحسن",  # denial
+    "أخاف من الموت وأفكر فيه وايد",
+    "قريت خبر عن عملية انتحارية",  # 'انتحارية' is a word on its own, not a disclosure
+    "I am not suicidal, just tired",
+    "",
+]
+
+
+@pytest.mark.parametrize("text", MUST_MATCH)
+def test_crisis_phrases_match(text):
+    assert CrisisLexicon().match(text) is not None
+
+
+@pytest.mark.parametrize("text", MUST_NOT_MATCH)
+def test_benign_text_does_not_match(text):
+    assert CrisisLexicon().match(text) is None
+
+
+def test_aho_corasick_finds_overlapping_patterns():
+    automaton = AhoCorasick([("he", "he"), ("she", "she"), ("his", "his"), ("hers", "hers")])
+    found = {(end, value) for end, value in automaton.find_all("ushers")}
+    assert found == {(3, "she"), (3, "he"), (5, "hers")}
@@ -0,0 +1,91 @@
+# tests/test_emotion_model.py
+import sys
+import os
+import asyncio
+
+import pytest
+from pydantic import ValidationError
+
+os.environ["GEMINI_API_KEY"] = "dummy_key"
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import backend.therapy_core as therapy_core
+from backend.config import Settings
+from backend.emotion_model import EmotionModel, canonical_label
+from backend.arabic import normalize
+
+EXAMPLES = [
+    ("أحس بقلق وايد من الامتحان", "قلق"),
+    ("خايف وقلقان من بكرة", "القلق"),
+    ("قلبي يدق وخايف من المقابلة", "قلق"),
+    ("حزين وايد على فراق أمي", "حزن"),
+    ("أبكي كل ليلة وحزين", "حزن."),
+    ("فقدت صديقي وأحس بحزن", "الحزن"),
+    ("الحمدلله اليوم مستانس ومتفائل", "تفاؤل"),
+    ("الأمور بتتحسن إن شاء الله", "تفاؤل"),
+    ("متفائل بالشغل الجديد", "تفاؤل"),
+]
+
+
+def test_normalize_folds_spelling_variants():
+    assert normalize("إنْ شاءَ اللّٰه") == normalize("ان شاء الله")
+    assert normalize("مـــدرسة!") == "مدرسه"
+
+
+def test_canonical_label():
+    assert canonical_label("القلق") == canonical_label("قلق.") == "قلق"
+
+
+def test_predicts_and_round_trips(tmp_path):
+    model = EmotionModel.fit(EXAMPLES, min_label_count=2)
+    label, confidence = model.predict("خايف وقلقان من الامتحان")
+    assert label == "قلق" and confidence > 0.5
+    assert model.predict("xyz qqq")[1] == 0.0
+
+    path = str(tmp_path / "model.json")
+    model.save(path)
+    again = EmotionModel.load(path)
+    assert again.predict("أبكي وحزين") == model.predict("أبكي وحزين")
+
+
+def test_tiered_mode_escalates_low_confidence(monkeypatch):
+    calls = []
+
+    async def fake_llm(prompt, **kwargs):
+        calls.append(prompt)
+        return "توتر"
+
+    monkeypatch.setattr(therapy_core, "call_gemini_api", fake_llm)
+    monkeypatch.setattr(therapy_core.settings, "EMOTION_BACKEND", "tiered")
+    monkeypatch.setattr(therapy_core.settings, "EMOTION_LOCAL_MIN_CONFIDENCE", 0.6)
+    predictions = {"confident": ("حزن", 0.95), "unsure": ("حزن", 0.3)}
+    monkeypatch.setattr(therapy_core, "local_emotion", lambda text: predictions[text])
+
+    assert asyncio.run(therapy_core.analyze_emotion("confident")) == "حزن"
+    assert not calls
+    assert asyncio.run(therapy_core.analyze_emotion("unsure")) == "توتر"
+    assert len(calls) == 1
+
+
+def test_combined_mode_takes_the_emotion_from_the_local_model(monkeypatch):
+    calls = []
+
+    async def fake_llm(prompt, response_schema=None, **kwargs):
+        calls.append("json" if response_schema is not None else "crisis")
+        return "لا"
+
+    monkeypatch.setattr(therapy_core, "call_gemini_api", fake_llm)
+    monkeypatch.setattr(therapy_core.settings, "CLASSIFIER_MODE", "combined")
+    monkeypatch.setattr(therapy_core.settings, "EMOTION_BACKEND", "local")
+    monkeypatch.setattr(therapy_core, "local_emotion", lambda text: ("حزن", 0.4))
+
+    result = asyncio.run(therapy_core.classify_turn("فقدت صديقي وأحس بحزن اليوم", []))
+    assert (result.emotion, result.crisis) == ("حزن", False)
+    # No combined JSON call: only the crisis question went to the model
+    assert calls == ["crisis"]
+
+
+def test_unknown_emotion_backend_fails_at_startup():
+    with pytest.raises(ValidationError):
+        Settings(EMOTION_BACKEND="locla")
@@ -2,17 +2,33 @@
 import sys
 import os
 import time
+import uuid
+import asyncio
 from unittest.mock import patch
 
+import pytest
+
 # Set dummy API key before imports to satisfy Pydantic
 os.environ["GEMINI_API_KEY"] = "dummy_key"
 
 # Add project root to path
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 
+from backend import storage
 from backend.db import init_db, init_insights_db, log_conversation, get_user_insights
-from backend.evolution_core import analyze_session_for_insights
+from backend.db import get_insights_state, save_user_insights
+import backend.evolution_core as evolution_core
+from backend.evolution_core import analyze_session_for_insights_sync, evolve_user
 from backend.therapy_core import system_prompt
+from backend.job_queue import JobQueue
+from backend.worker import WorkerPool
+
+
+@pytest.fixture(autouse=True)
+def scratch_db(tmp_path, monkeypatch):
+    # Sessions, insights and watermarks go to a scratch database, not data/session_logs.db
+    monkeypatch.setattr(storage, "DB_PATH", str(tmp_path / "session_logs.db"))
+
 
 def test_evolution_flow():
     print("--- Starting Evolution Test ---")
@@ -36,7 +52,7 @@ def test_evolution_flow():
         mock_llm.return_value = "- User is anxious about work.\n- Responds well to calm reassurance."
         
         try:
-            analyze_session_for_insights(session_id, user_id)
+            analyze_session_for_insights_sync(session_id, user_id)
         except Exception as e:
             print(f"Analysis failed: {e}")
         
@@ -55,5 +71,73 @@ def test_evolution_flow():
     else:
         print("FAILURE: Insights NOT injected into prompt.")
 
+
+# --- Incremental evolution ---
+def _fake_llm(prompts, on_call=None):
+    async def fake(prompt, **kwargs):
+        prompts.append(prompt)
+        if on_call:
+            on_call(len(prompts))
+        return f"- insight {len(prompts)}"
+    return fake
+
+
+def test_only_new_turns_are_sent():
+    user_id, session_id = f"user-{uuid.uuid4()}", f"session-{uuid.uuid4()}"
+    log_conversation(session_id, "أول رسالة", "قلق", "رد", 0, "u.wav", "b.wav")
+    log_conversation(session_id, "ثاني رسالة", "قلق", "رد", 0, "u.wav", "b.wav")
+    prompts = []
+    with patch("backend.evolution_core.call_gemini_api", _fake_llm(prompts)):
+        assert asyncio.run(evolve_user(user_id, [session_id])) == 2
+        log_conversation(session_id, "ثالث رسالة", "حزن", "رد", 0, "u.wav", "b.wav")
+        assert asyncio.run(evolve_user(user_id, [session_id])) == 1
+        assert asyncio.run(evolve_user(user_id, [session_id])) == 0
+
+    assert len(prompts) == 2
+    assert "أول رسالة" in prompts[0] and "ثاني رسالة" in prompts[0]
+    assert "ثالث رسالة" in prompts[1] and "أول رسالة" not in prompts[1]
+    assert "- insight 1" in prompts[1]  # previous insights carried forward
+    assert get_insights_state(user_id) == ("- insight 2", 2)
+
+
+def test_concurrent_update_is_not_overwritten():
+    user_id, session_id = f"user-{uuid.uuid4()}", f"session-{uuid.uuid4()}"
+    log_conversation(session_id, "رسالة", "قلق", "رد", 0, "u.wav", "b.wav")
+
+    def concurrent_writer(call):
+        if call == 1:
+            save_user_insights(user_id, "- written elsewhere")
+
+    prompts = []
+    with patch("backend.evolution_core.call_gemini_api", _fake_llm(prompts, concurrent_writer)):
+        asyncio.run(evolve_user(user_id, [session_id]))
+
+    assert len(prompts) == 2
+    assert "- written elsewhere" in prompts[1]
+    assert get_insights_state(user_id) == ("- insight 2", 2)
+
+
+def test_session_ends_are_coalesced_into_one_job(monkeypatch, tmp_path):
+    user_id = f"user-{uuid.uuid4()}"
+    sessions = [f"session-{uuid.uuid4()}" for _ in range(3)]
+    for i, session_id in enumerate(sessions):
+        log_conversation(session_id, f"رسالة {i}", "قلق", "رد", 0, "u.wav", "b.wav")
+
+    monkeypatch.setattr(evolution_core.settings, "EVOLUTION_DEBOUNCE_S", 0.0)
+    jobs_db = str(tmp_path / "jobs.db")
+    storage.migrate(jobs_db)
+    queue = JobQueue(path=jobs_db)
+    job_ids = {evolution_core.enqueue_evolution(session_id, user_id, queue) for session_id in sessions}
+    assert len(job_ids) == 1
+
+    prompts = []
+    with patch("backend.evolution_core.call_gemini_api", _fake_llm(prompts)):
+        asyncio.run(WorkerPool(queue=queue, concurrency=1).run_until_idle())
+
+    assert len(prompts) == 1
+    assert all(f"رسالة {i}" in prompts[0] for i in range(3))
+    assert get_insights_state(user_id) == ("- insight 1", 1)
+
+
 if __name__ == "__main__":
     test_evolution_flow()
@@ -0,0 +1,84 @@
+# tests/test_idempotency.py
+import sys
+import os
+import time
+import asyncio
+
+os.environ["GEMINI_API_KEY"] = "dummy_key"
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from fastapi import HTTPException
+
+from backend.idempotency import TurnCoalescer, new_audio_digest, turn_key
+
+
+def test_duplicates_join_the_running_turn_then_replay():
+    runs = []
+
+    async def turn():
+        runs.append(1)
+        await asyncio.sleep(0.02)
+        return {"reply": len(runs)}
+
+    async def run():
+        coalescer = TurnCoalescer(ttl_s=60, max_bytes=1 << 20)
+        first, second = await asyncio.gather(coalescer.run("s:a", turn), coalescer.run("s:a", turn))
+        third = await coalescer.run("s:a", turn)
+        other = await coalescer.run("s:b", turn)
+        return first, second, third, other, coalescer.stats()
+
+    first, second, third, other, stats = asyncio.run(run())
+    assert first == ({"reply": 1}, "computed")
+    assert second == ({"reply": 1}, "joined")
+    assert third == ({"reply": 1}, "replayed")
+    assert other == ({"reply": 2}, "computed")
+    assert len(runs) == 2
+    assert stats["joined"] == 1 and stats["replayed"] == 1 and stats["stored"] == 2 and stats["running"] == 0
+
+
+def test_failures_are_shared_but_not_stored_and_results_expire():
+    outcomes = [HTTPException(status_code=500, detail="Transcription failed"), "ok", "again"]
+
+    async def turn():
+        await asyncio.sleep(0.01)
+        outcome = outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    async def run():
+        coalescer = TurnCoalescer(ttl_s=0.05, max_bytes=1 << 20)
+        failed = await asyncio.gather(coalescer.run("k", turn), coalescer.run("k", turn), return_exceptions=True)
+        assert all(isinstance(e, HTTPException) for e in failed)
+        assert await coalescer.run("k", turn) == ("ok", "computed")
+        time.sleep(0.06)
+        assert await coalescer.run("k", turn) == ("again", "computed")
+
+    asyncio.run(run())
+    assert outcomes == []
+
+
+def test_turn_key_from_header_or_audio_digest():
+    digest = new_audio_digest()
+    digest.update(b"RIFF....WAVE" * 10000)
+    audio = digest.hexdigest()
+    derived = turn_key("s1", None, audio)
+    assert derived == turn_key("s1", None, audio)
+    assert derived != turn_key("s2", None, audio)
+    assert derived != turn_key("s1", None, audio, "inline")
+    assert turn_key("s1", "abc") != turn_key("s2", "abc")
+    assert turn_key("s1", "abc", audio) == turn_key("s1", "abc")  # the header wins
+
+
+def test_attach_finds_only_existing_turns():
+    async def turn():
+        return "reply"
+
+    async def run():
+        coalescer = TurnCoalescer(ttl_s=60, max_bytes=1 << 20)
+        assert await coalescer.attach("k") is None
+        await coalescer.run("k", turn)
+        return await coalescer.attach("k")
+
+    assert asyncio.run(run()) == ("reply", "replayed")
@@ -0,0 +1,94 @@
+# tests/test_job_queue.py
+import sys
+import os
+import time
+import asyncio
+
+os.environ["GEMINI_API_KEY"] = "dummy_key"
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from backend import storage
+from backend.job_queue import JobQueue
+from backend.worker import WorkerPool
+
+
+def _queue(tmp_path, **kwargs):
+    options = dict(lease_s=60, max_attempts=3, backoff_base_s=0.01, backoff_max_s=0.02)
+    options.update(kwargs)
+    return JobQueue(path=str(tmp_path / "jobs.db"), **options)
+
+
+def test_duplicates_coalesce_and_wait_for_their_delay(tmp_path):
+    queue = _queue(tmp_path)
+    first = queue.enqueue("evolve_user", {"user_id": "u", "session_ids": ["a"]}, dedupe_key="u", delay_s=0.05)
+    second = queue.enqueue("evolve_user", {"user_id": "u", "session_ids": ["b", "a"]}, dedupe_key="u", delay_s=0.05)
+    assert first == second
+    assert queue.claim("w1") is None  # still debouncing
+
+    time.sleep(0.06)
+    job = queue.claim("w1")
+    assert job.payload == {"user_id": "u", "session_ids": ["a", "b"]}
+    assert job.attempts == 1
+    # A trigger arriving while the job runs gets a job of its own
+    assert queue.enqueue("evolve_user", {"user_id": "u", "session_ids": ["c"]}, dedupe_key="u") != first
+
+
+def test_failures_back_off_then_dead_letter(tmp_path):
+    queue = _queue(tmp_path)
+    queue.enqueue("evolve_user", {"user_id": "u"})
+    for attempt in range(1, 4):
+        job = None
+        deadline = time.time() + 1
+        while job is None and time.time() < deadline:
+            job = queue.claim("w1")
+        assert job.attempts == attempt
+        assert queue.fail(job, "w1", "boom") == ("dead" if attempt == 3 else "queued")
+
+    assert queue.claim("w1") is None
+    stats = queue.stats()
+    assert stats["dead"] == 1 and stats["queued"] == 0
+    assert queue.retry_dead() == 1
+    assert queue.claim("w1").attempts == 1
+
+
+def test_expired_lease_is_reclaimed_and_fenced(tmp_path):
+    queue = _queue(tmp_path, lease_s=0.01)
+    queue.enqueue("evolve_user", {"user_id": "u"})
+    stale = queue.claim("w1")
+    time.sleep(0.02)
+    fresh = queue.claim("w2")
+    assert fresh.job_id == stale.job_id and fresh.attempts == 2
+    assert not queue.complete(stale, "w1")  # w1 lost the lease
+    assert queue.complete(fresh, "w2")
+    assert queue.stats()["done"] == 1
+
+
+def test_worker_pool_retries_until_done(tmp_path):
+    queue = _queue(tmp_path)
+    calls = []
+
+    async def flaky(payload):
+        calls.append(payload)
+        if len(calls) == 1:
+            raise RuntimeError("transient")
+
+    async def run():
+        pool = WorkerPool(queue=queue, handlers={"flaky": flaky}, concurrency=2, poll_interval_s=0.01)
+        await pool.start()
+        queue.enqueue("flaky", {"n": 1})
+        deadline = time.time() + 2
+        while queue.stats()["done"] < 1 and time.time() < deadline:
+            await asyncio.sleep(0.01)
+        await pool.stop()
+        return pool
+
+    pool = asyncio.run(run())
+    assert len(calls) == 2
+    assert pool.stats()["failed"] == 1 and pool.stats()["completed"] == 1
+    assert queue.stats()["done"] == 1
+
+
+def test_default_path_follows_the_current_db_path(tmp_path, monkeypatch):
+    monkeypatch.setattr(storage, "DB_PATH", str(tmp_path / "moved.db"))
+    assert JobQueue().path == str(tmp_path / "moved.db")
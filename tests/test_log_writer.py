@@ -0,0 +1,86 @@
+# tests/test_log_writer.py
+import sys
+import os
+import time
+import asyncio
+from unittest.mock import patch
+
+os.environ["GEMINI_API_KEY"] = "dummy_key"
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from backend.log_writer import ConversationWriter
+
+
+def _turn(i):
+    return (f"session-{i % 3}", f"رسالة {i}", "قلق", "رد", 0, "u.wav", "b.wav")
+
+
+def test_turns_are_batched_and_drained_on_stop():
+    batches = []
+
+    async def run():
+        writer = ConversationWriter(max_queue=100, batch_size=10, flush_interval_s=0.05)
+        await writer.start()
+        for i in range(25):
+            await writer.log(*_turn(i))
+        await writer.stop()
+        return writer
+
+    with patch("backend.log_writer.log_conversation_batch", side_effect=lambda rows: batches.append(list(rows))):
+        writer = asyncio.run(run())
+
+    assert sum(len(b) for b in batches) == 25
+    assert max(len(b) for b in batches) <= 10
+    assert [row[2] for b in batches for row in b] == [f"رسالة {i}" for i in range(25)]
+    assert writer.stats()["written"] == 25
+    assert writer.stats()["queue_depth"] == 0
+    assert writer.pending_turns("session-0") == (writer.write_version, [])
+
+
+def test_full_queue_applies_backpressure():
+    def slow_write(rows):
+        time.sleep(0.05)
+
+    async def run():
+        writer = ConversationWriter(max_queue=2, batch_size=1, flush_interval_s=0.01)
+        await writer.start()
+        for i in range(6):
+            await writer.log(*_turn(i))
+        await writer.stop()
+        return writer
+
+    with patch("backend.log_writer.log_conversation_batch", side_effect=slow_write):
+        writer = asyncio.run(run())
+
+    assert writer.stats()["written"] == 6
+    assert writer.stats()["enqueue_wait_max_s"] > 0.02
+
+
+def test_flush_waits_only_for_turns_queued_before_it():
+    async def run():
+        writer = ConversationWriter(max_queue=100, batch_size=2, flush_interval_s=0.01)
+        await writer.start()
+        for i in range(4):
+            await writer.log(*_turn(i))
+        stop = asyncio.Event()
+
+        async def keep_logging():
+            i = 4
+            while not stop.is_set():
+                await writer.log(*_turn(i))
+                i += 1
+                await asyncio.sleep(0.001)
+
+        producer = asyncio.create_task(keep_logging())
+        await asyncio.wait_for(writer.flush(), 1)
+        written_at_flush = writer.stats()["written"]
+        stop.set()
+        await producer
+        await writer.stop()
+        return written_at_flush
+
+    with patch("backend.log_writer.log_conversation_batch", side_effect=lambda rows: time.sleep(0.005)):
+        written_at_flush = asyncio.run(run())
+
+    assert written_at_flush >= 4
@@ -0,0 +1,73 @@
+# tests/test_metrics.py
+import sys
+import os
+import asyncio
+
+import pytest
+
+os.environ["GEMINI_API_KEY"] = "dummy_key"
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from backend import metrics
+from backend.metrics import Histogram, ServerTimingMiddleware, Trace, current_trace, span
+from backend.pipeline import StageScheduler
+
+
+def test_histogram_renders_cumulative_buckets_and_estimates_quantiles():
+    hist = Histogram("test_seconds", "Test.", "stage", buckets=(0.1, 1.0))
+    for seconds in (0.05, 0.05, 0.5, 5.0):
+        hist.observe("stt", seconds)
+    lines = hist.render()
+    assert 'omani_test_seconds_bucket{stage="stt",le="0.1"} 2' in lines
+    assert 'omani_test_seconds_bucket{stage="stt",le="1.0"} 3' in lines
+    assert 'omani_test_seconds_bucket{stage="stt",le="+Inf"} 4' in lines
+    assert 'omani_test_seconds_count{stage="stt"} 4' in lines
+    assert hist.quantile("stt", 0.5) == pytest.approx(0.1)
+    assert 0.1 < hist.quantile("stt", 0.75) <= 1.0
+
+
+def test_scheduler_stages_are_traced_and_errors_counted():
+    async def boom():
+        raise RuntimeError("stage failed")
+
+    async def run():
+        trace = Trace()
+        current_trace.set(trace)
+        async with StageScheduler("test") as stages:
+            stages.add("fetch", lambda: 1)
+            stages.add("double", lambda fetch: fetch * 2, after=("fetch",))
+            assert await stages.result("double") == 2
+            stages.add("metrics_test_boom", boom)
+            with pytest.raises(RuntimeError):
+                await stages.result("metrics_test_boom")
+        return trace
+
+    trace = asyncio.run(run())
+    assert [name for name, _ in trace.spans] == ["fetch", "double", "metrics_test_boom"]
+    assert metrics.stage_errors.values()["metrics_test_boom"] == 1
+
+
+def test_server_timing_header_lists_request_spans():
+    async def endpoint(scope, receive, send):
+        with span("step"):
+            await asyncio.sleep(0.01)
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"ok"})
+
+    sent = []
+
+    async def send(message):
+        sent.append(message)
+
+    async def receive():
+        return {"type": "http.request", "body": b""}
+
+    app = ServerTimingMiddleware(endpoint)
+    asyncio.run(app({"type": "http", "path": "/work", "headers": []}, receive, send))
+
+    header = dict(sent[0]["headers"])[b"server-timing"].decode()
+    names = [part.split(";")[0] for part in header.split(", ")]
+    assert names == ["step", "total"]
+    assert float(header.split("step;dur=")[1].split(",")[0]) >= 10
+    assert metrics.request_seconds.summary()["unmatched"]["count"] >= 1
@@ -0,0 +1,62 @@
+# tests/test_pipeline.py
+import sys
+import os
+import time
+import asyncio
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from backend.pipeline import StageScheduler
+
+
+def test_independent_stages_run_concurrently():
+    async def slow(value, delay=0.2):
+        await asyncio.sleep(delay)
+        return value
+
+    async def combine(a, b):
+        return a + b
+
+    async def run():
+        async with StageScheduler() as stages:
+            stages.add("a", slow, value=1)
+            stages.add("b", slow, value=2)
+            stages.add("total", combine, after=("a", "b"))
+            return await stages.result("total")
+
+    start = time.perf_counter()
+    assert asyncio.run(run()) == 3
+    assert time.perf_counter() - start < 0.35
+
+
+def test_blocking_stage_runs_in_thread():
+    def blocking(x):
+        time.sleep(0.05)
+        return x * 2
+
+    async def run():
+        async with StageScheduler() as stages:
+            return await stages.add("double", blocking, x=21)
+
+    assert asyncio.run(run()) == 42
+
+
+def test_speculative_stage_is_cancelled():
+    finished = []
+
+    async def speculative():
+        await asyncio.sleep(1)
+        finished.append(True)
+        return "reply"
+
+    async def run():
+        async with StageScheduler() as stages:
+            task = stages.add("reply", speculative)
+            await asyncio.sleep(0.01)
+            stages.cancel("reply")
+            await asyncio.sleep(0)
+            return task
+
+    task = asyncio.run(run())
+    assert task.cancelled()
+    assert not finished
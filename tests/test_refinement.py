@@ -0,0 +1,53 @@
+# tests/test_refinement.py
+import sys
+import os
+import asyncio
+from unittest.mock import patch
+
+import pytest
+from pydantic import ValidationError
+
+os.environ["GEMINI_API_KEY"] = "dummy_key"
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from backend.config import Settings
+from backend.refinement import needs_refinement
+from backend.therapy_core import refine_response, settings
+from backend.llm_client import run_sync
+
+
+def test_heuristic_skips_short_dialect_draft():
+    assert needs_refinement("ما عليه، الحين خذ نفس عميق وقول لي ايش اللي مضايقك.") == (False, "dialect_ok")
+
+
+def test_heuristic_flags_msa_english_and_long_drafts():
+    assert needs_refinement("سوف تشعر بتحسن إذا مارست التأمل يومياً.")[1] == "msa"
+    assert needs_refinement("Take a deep breath and relax, okay? زين")[1] == "script"
+    assert needs_refinement("زين " * 100)[1] == "long"
+    assert needs_refinement("أفهم شعورك تماماً.")[1] == "no_dialect"
+
+
+def test_deadline_policy_returns_draft_when_evaluator_is_slow():
+    async def slow_llm(*args, **kwargs):
+        await asyncio.sleep(1)
+        return "نسخة محسنة"
+
+    with patch.object(settings, "REFINE_POLICY", "deadline"), \
+            patch.object(settings, "REFINE_DEADLINE_S", 0.05), \
+            patch("backend.therapy_core.call_gemini_api", side_effect=slow_llm):
+        assert run_sync(refine_response("سؤال", " مسودة الرد ")) == "مسودة الرد"
+
+
+def test_heuristic_policy_avoids_evaluator_call():
+    with patch.object(settings, "REFINE_POLICY", "heuristic"), \
+            patch("backend.therapy_core.call_gemini_api") as llm:
+        draft = "زين إنك تكلمت، خلنا نشوف ايش نقدر نسوي الحين."
+        assert run_sync(refine_response("سؤال", draft)) == draft
+    llm.assert_not_called()
+
+
+def test_unknown_refine_policy_fails_at_startup():
+    assert Settings(REFINE_POLICY="heuristic").REFINE_POLICY == "heuristic"
+    with pytest.raises(ValidationError):
+        Settings(REFINE_POLICY="heuristc")
@@ -0,0 +1,164 @@
+# tests/test_resilience.py
+import sys
+import os
+import time
+import asyncio
+import threading
+
+import pytest
+
+os.environ["GEMINI_API_KEY"] = "dummy_key"
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from backend import resilience
+from backend.resilience import (
+    CircuitBreaker, CircuitOpenError, DeadlineExceeded, UpstreamError, bind_deadline, call_async, call_sync,
+    deadline_after
+)
+
+
+@pytest.fixture(autouse=True)
+def fast_policy(monkeypatch):
+    monkeypatch.setattr(resilience.settings, "GEMINI_RETRY_ATTEMPTS", 3)
+    monkeypatch.setattr(resilience.settings, "GEMINI_BACKOFF_BASE_S", 0.001)
+    monkeypatch.setattr(resilience.settings, "GEMINI_BACKOFF_MAX_S", 0.001)
+    monkeypatch.setattr(resilience, "_breakers", {})
+
+
+def test_retries_only_retryable_errors():
+    calls = []
+
+    def flaky(timeout_s):
+        calls.append(timeout_s)
+        if len(calls) < 3:
+            raise UpstreamError(503, "unavailable")
+        return "ok"
+
+    assert call_sync("flaky-model", flaky, "test") == "ok"
+    assert len(calls) == 3
+
+    def bad_request(timeout_s):
+        calls.append(timeout_s)
+        raise UpstreamError(400, "invalid argument")
+
+    calls.clear()
+    with pytest.raises(UpstreamError):
+        call_sync("flaky-model", bad_request, "test")
+    assert len(calls) == 1
+
+
+def test_circuit_opens_fails_fast_and_recovers(monkeypatch):
+    monkeypatch.setattr(resilience.settings, "GEMINI_RETRY_ATTEMPTS", 1)
+    breaker = resilience._breakers["down-model"] = CircuitBreaker("down-model", failures=2, reset_s=0.05)
+    calls = []
+
+    def down(timeout_s):
+        calls.append(timeout_s)
+        raise UpstreamError(503, "unavailable")
+
+    for _ in range(2):
+        with pytest.raises(UpstreamError):
+            call_sync("down-model", down, "test")
+    assert breaker.state == "open"
+    with pytest.raises(CircuitOpenError):
+        call_sync("down-model", down, "test")
+    assert len(calls) == 2
+
+    time.sleep(0.06)
+    assert call_sync("down-model", lambda timeout_s: "back", "test") == "back"
+    assert breaker.state == "closed"
+
+
+def test_deadline_caps_attempts_and_stops_retries(monkeypatch):
+    monkeypatch.setattr(resilience.settings, "GEMINI_BACKOFF_BASE_S", 1.0)
+    monkeypatch.setattr(resilience.settings, "GEMINI_BACKOFF_MAX_S", 1.0)
+    monkeypatch.setattr(resilience.random, "uniform", lambda low, high: high)
+    calls = []
+
+    async def slow(timeout_s):
+        calls.append(timeout_s)
+        await asyncio.sleep(1)
+
+    async def run():
+        with bind_deadline(deadline_after(0.05)):
+            start = time.perf_counter()
+            with pytest.raises(asyncio.TimeoutError):
+                await call_async("slow-model", slow, "test")
+            assert time.perf_counter() - start < 0.5
+            await asyncio.sleep(0.05)
+            with pytest.raises(DeadlineExceeded):
+                await call_async("slow-model", slow, "test")
+
+    asyncio.run(run())
+    # One attempt, cut to the budget: the 1 s backoff would have overrun it
+    assert len(calls) == 1 and calls[0] <= 0.05
+
+
+def test_hedged_call_takes_the_first_answer():
+    started = []
+
+    async def sometimes_slow(timeout_s):
+        started.append(timeout_s)
+        await asyncio.sleep(1 if len(started) == 1 else 0.01)
+        return f"copy {len(started)}"
+
+    async def run():
+        start = time.perf_counter()
+        result = await call_async("hedge-model", sometimes_slow, "test", hedge_after_s=0.02)
+        return result, time.perf_counter() - start
+
+    result, elapsed = asyncio.run(run())
+    assert result == "copy 2"
+    assert len(started) == 2 and elapsed < 0.5
+
+
+def test_call_slots_cap_concurrency_per_model(monkeypatch):
+    monkeypatch.setattr(resilience, "_slots", {"busy-model": resilience.CallSlots("busy-model", 1)})
+    running = []
+    peak = []
+
+    async def call(timeout_s):
+        running.append(1)
+        peak.append(len(running))
+        await asyncio.sleep(0.02)
+        running.pop()
+        return "ok"
+
+    async def run():
+        results = await asyncio.gather(*(call_async("busy-model", call, "test") for _ in range(3)))
+        assert results == ["ok"] * 3 and max(peak) == 1
+        holder = asyncio.create_task(call_async("busy-model", call, "test"))
+        await asyncio.sleep(0)
+        with bind_deadline(deadline_after(0.01)), pytest.raises(resilience.UpstreamBusy):
+            await call_async("busy-model", call, "test")
+        assert await holder == "ok"
+
+    asyncio.run(run())
+    assert resilience._slots["busy-model"].stats()["in_use"] == 0
+
+
+def test_blocking_calls_wait_for_slots_on_the_sdk_pool(monkeypatch):
+    slots = resilience.CallSlots("busy-model", 1)
+    monkeypatch.setattr(resilience, "_slots", {"busy-model": slots})
+    threads = []
+
+    def call(timeout_s):
+        threads.append(threading.current_thread().name)
+        return "ok"
+
+    async def run():
+        await slots.acquire(1)  # every blocking call below has to wait for this slot
+        with bind_deadline(deadline_after(5)):
+            waiting = [asyncio.create_task(resilience.run_blocking(call_sync, "busy-model", call, "test"))
+                       for _ in range(40)]
+            await asyncio.sleep(0.05)
+            assert slots.stats()["waiting"] == 40
+            # More waiters than the default pool has threads, yet to_thread work still runs
+            assert await asyncio.wait_for(asyncio.to_thread(lambda: "db"), 1) == "db"
+        slots.release()
+        return await asyncio.gather(*waiting)
+
+    assert asyncio.run(run()) == ["ok"] * 40
+    assert all(name.startswith("gemini-sdk") for name in threads)
+    assert slots.stats()["in_use"] == 0
@@ -0,0 +1,78 @@
+# tests/test_session_cache.py
+import sys
+import os
+import time
+import sqlite3
+import asyncio
+from unittest.mock import patch
+
+os.environ["GEMINI_API_KEY"] = "dummy_key"
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from backend.log_writer import ConversationWriter
+from backend.session_cache import SessionHistoryStore
+
+
+def test_miss_loads_once_then_serves_from_memory():
+    store = SessionHistoryStore(max_turns=3, ttl_s=60, max_bytes=1 << 20)
+    rows = [("مرحبا", "أهلاً"), ("أحس بضيق", "أنا هنا معك")]
+    with patch("backend.session_cache.get_recent_history", return_value=rows) as db_read:
+        assert store.get("s1") == rows
+        store.record_turn("s1", "شكراً", "العفو")
+        store.record_turn("s1", "مع السلامة", "في أمان الله")
+        history = store.get("s1")
+    assert db_read.call_count == 1
+    assert history == [("أحس بضيق", "أنا هنا معك"), ("شكراً", "العفو"), ("مع السلامة", "في أمان الله")]
+    assert store.stats()["hits"] == 1
+
+
+def test_record_turn_ignores_uncached_sessions():
+    store = SessionHistoryStore(max_turns=3, ttl_s=60, max_bytes=1 << 20)
+    store.record_turn("s2", "مرحبا", "أهلاً")
+    assert store.stats()["sessions"] == 0
+
+
+def test_idle_sessions_expire():
+    store = SessionHistoryStore(max_turns=3, ttl_s=0.05, max_bytes=1 << 20)
+    with patch("backend.session_cache.get_recent_history", return_value=[]) as db_read:
+        store.get("s3")
+        time.sleep(0.1)
+        store.get("s3")
+    assert db_read.call_count == 2
+
+
+def test_failed_load_is_not_cached():
+    store = SessionHistoryStore(max_turns=3, ttl_s=60, max_bytes=1 << 20)
+    with patch("backend.session_cache.get_recent_history", side_effect=sqlite3.OperationalError("database is locked")):
+        assert store.get("s4") == []
+    assert store.stats()["sessions"] == 0 and store.stats()["load_errors"] == 1
+    with patch("backend.session_cache.get_recent_history", return_value=[("مرحبا", "أهلاً")]):
+        assert store.get("s4") == [("مرحبا", "أهلاً")]
+
+
+def test_memory_budget_evicts_least_recent_session():
+    store = SessionHistoryStore(max_turns=10, ttl_s=60, max_bytes=100)
+    with patch("backend.session_cache.get_recent_history", side_effect=lambda sid, limit: [("x" * 60, "y")]):
+        store.get("old")
+        store.get("new")
+    assert store.stats()["sessions"] == 1
+    assert store.stats()["bytes"] <= 100
+
+
+def test_reload_includes_turns_still_queued_in_the_writer():
+    store = SessionHistoryStore(max_turns=3, ttl_s=60, max_bytes=1 << 20)
+    written = [("مرحبا", "أهلاً"), ("أحس بضيق", "أنا هنا معك")]
+
+    async def run():
+        writer = ConversationWriter(max_queue=10, batch_size=10, flush_interval_s=60)
+        await writer.start()
+        await writer.log("s5", "ما نمت", "قلق", "خذ نفس عميق", 0, "u.wav", "b.wav")
+        with patch("backend.session_cache.get_conversation_writer", return_value=writer), \
+                patch("backend.session_cache.get_recent_history", return_value=written):
+            history = await asyncio.to_thread(store.get, "s5")
+        writer._task.cancel()
+        return history
+
+    history = asyncio.run(run())
+    assert history == written + [("ما نمت", "خذ نفس عميق")]
@@ -0,0 +1,39 @@
+# tests/test_storage.py
+import sys
+import os
+import sqlite3
+
+os.environ["GEMINI_API_KEY"] = "dummy_key"
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from backend.storage import MIGRATIONS, get_connection, migrate, schema_version
+
+
+def test_migrates_legacy_database_in_place(tmp_path):
+    path = str(tmp_path / "legacy.db")
+    conn = sqlite3.connect(path)
+    MIGRATIONS[0][2](conn.cursor())  # original schema, no user_version set
+    conn.execute(
+        "INSERT INTO sessions VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+        ("s1", "2025-06-28T19:57:53", "مرحبا", "محايد", "أهلاً", 0, "u.wav", "b.wav")
+    )
+    conn.commit()
+    conn.close()
+
+    assert migrate(path) == len(MIGRATIONS)
+    assert migrate(path) == len(MIGRATIONS)  # idempotent
+
+    conn = get_connection(path)
+    assert schema_version(conn) == len(MIGRATIONS)
+    assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    assert conn.execute("SELECT turn_id, session_id, transcript FROM sessions").fetchall() == [(1, "s1", "مرحبا")]
+    plan = conn.execute(
+        "EXPLAIN QUERY PLAN SELECT * FROM sessions WHERE session_id = ? ORDER BY timestamp", ("s1",)
+    ).fetchall()
+    assert "idx_sessions_session_ts" in plan[0][-1]
+
+
+def test_connection_is_reused_per_thread(tmp_path):
+    path = str(tmp_path / "fresh.db")
+    assert get_connection(path) is get_connection(path)
@@ -0,0 +1,37 @@
+# tests/test_streaming.py
+import sys
+import os
+import time
+import asyncio
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from backend.streaming import SentenceChunker, ReplyStreamer, text_stream
+
+
+def test_chunker_splits_on_arabic_boundaries():
+    chunker = SentenceChunker(min_chars=5)
+    out = []
+    for delta in ["كيف حالك ", "اليوم؟ أنا", " هنا معك. ", "خذ نفساً عميقاً"]:
+        out.extend(chunker.feed(delta))
+    assert out == ["كيف حالك اليوم؟", "أنا هنا معك."]
+    assert chunker.flush() == "خذ نفساً عميقاً"
+    assert chunker.flush() is None
+
+
+def test_chunker_merges_short_fragments():
+    chunker = SentenceChunker(min_chars=12)
+    assert chunker.feed("نعم. أفهم شعورك تماماً. ") == ["نعم. أفهم شعورك تماماً."]
+
+
+def test_streamer_keeps_order_with_uneven_tts_latency():
+    def synthesize(sentence):
+        # Earlier sentences are slower, so completion order differs from reply order
+        time.sleep(0.1 if sentence.startswith("أولاً") else 0.01)
+        return sentence.encode("utf-8")
+
+    async def run():
+        streamer = ReplyStreamer(text_stream("أولاً خذ نفساً عميقاً. ", "ثانياً تكلم مع شخص تثق فيه."), synthesize)
+        return [sentence async for sentence, _ in streamer]
+
+    assert asyncio.run(run()) == ["أولاً خذ نفساً عميقاً.", "ثانياً تكلم مع شخص تثق فيه."]
@@ -0,0 +1,59 @@
+# tests/test_stt.py
+import sys
+import os
+from types import SimpleNamespace
+from unittest.mock import MagicMock
+
+import pytest
+
+os.environ["GEMINI_API_KEY"] = "dummy_key"
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from backend import speech_utils
+from backend.resilience import UpstreamError
+from backend.speech_utils import transcribe_audio_bytes
+
+AUDIO = b"RIFF....WAVEfmt " + bytes(4000)
+
+
+@pytest.fixture
+def client(monkeypatch):
+    fake = MagicMock()
+    fake.models.generate_content.return_value = SimpleNamespace(text="  شحالك اليوم  ")
+    monkeypatch.setattr(speech_utils, "client", fake)
+    monkeypatch.setattr(speech_utils.settings, "GEMINI_BACKOFF_BASE_S", 0.001)
+    monkeypatch.setattr(speech_utils.settings, "GEMINI_BACKOFF_MAX_S", 0.001)
+    return fake
+
+
+def test_small_clips_are_sent_inline(client):
+    assert transcribe_audio_bytes(AUDIO) == "شحالك اليوم"
+
+    client.files.upload.assert_not_called()
+    contents = client.models.generate_content.call_args.kwargs["contents"]
+    assert contents[1].inline_data.data == AUDIO
+    assert contents[1].inline_data.mime_type == "audio/wav"
+
+
+def test_large_clips_fall_back_to_a_temp_file_upload(client, monkeypatch):
+    monkeypatch.setattr(speech_utils.settings, "STT_INLINE_MAX_MB", 1000 / (1024 * 1024))
+    uploaded = []
+
+    def upload(file, config):
+        with open(file, "rb") as f:
+            uploaded.append((file, f.read()))
+        return "uploaded-file"
+
+    client.files.upload.side_effect = upload
+    assert transcribe_audio_bytes(AUDIO) == "شحالك اليوم"
+
+    assert [data for _, data in uploaded] == [AUDIO]
+    assert not os.path.exists(uploaded[0][0])  # temp file removed afterwards
+    assert client.models.generate_content.call_args.kwargs["contents"][1] == "uploaded-file"
+
+
+def test_failed_transcription_returns_empty_text(client):
+    client.models.generate_content.side_effect = UpstreamError(400, "invalid audio")
+    assert transcribe_audio_bytes(AUDIO) == ""
+    assert client.models.generate_content.call_count == 1
@@ -0,0 +1,43 @@
+# tests/test_tts_cache.py
+import sys
+import os
+from unittest.mock import patch
+
+os.environ["GEMINI_API_KEY"] = "dummy_key"
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from backend.tts_cache import TTSCache, materialize
+
+
+def test_miss_then_hit_without_resynthesis(tmp_path):
+    cache = TTSCache(root=str(tmp_path / "cache"), max_bytes=10 * 1024 * 1024)
+    with patch("backend.tts_cache.synthesize_pcm", return_value=b"\x01\x00" * 100) as tts:
+        first = cache.get_or_synthesize("أشكرك على تواصلك")
+        second = cache.get_or_synthesize("أشكرك على تواصلك")
+    assert first == second
+    assert tts.call_count == 1
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+    dest = tmp_path / "reply.wav"
+    materialize(first, str(dest))
+    assert dest.read_bytes() == open(first, "rb").read()
+
+
+def test_lru_eviction_spares_pinned_entries(tmp_path):
+    entry = b"\x01\x00" * 1000  # ~2 KB per WAV
+    cache = TTSCache(root=str(tmp_path / "cache"), max_bytes=5000)
+    cache.store("ثابت", entry, pin=True)
+    cache.store("أ", entry)
+    cache.store("ب", entry)
+    assert cache.lookup("ثابت") is not None
+    assert cache.lookup("أ") is None  # oldest unpinned entry was evicted
+    assert cache.lookup("ب") is not None
+    assert cache.stats()["evictions"] == 1
+
+
+def test_index_survives_restart(tmp_path):
+    root = str(tmp_path / "cache")
+    TTSCache(root=root, max_bytes=1 << 20).store("مرحبا", b"\x00\x00" * 10)
+    assert TTSCache(root=root, max_bytes=1 << 20).lookup("مرحبا") is not None
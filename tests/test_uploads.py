@@ -0,0 +1,117 @@
+# tests/test_uploads.py
+import sys
+import os
+import io
+import hashlib
+import asyncio
+
+import pytest
+from fastapi import HTTPException, UploadFile
+
+os.environ["GEMINI_API_KEY"] = "dummy_key"
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from backend.uploads import UploadBufferPool, PooledUpload, read_wav_upload, looks_like_wav
+
+WAV_HEAD = b"RIFF\x24\x00\x00\x00WAVEfmt "
+
+
+class _CountingFile(io.BytesIO):
+    def __init__(self, data: bytes):
+        super().__init__(data)
+        self.bytes_read = 0
+
+    def read(self, size=-1):
+        chunk = super().read(size)
+        self.bytes_read += len(chunk)
+        return chunk
+
+
+def _upload(data: bytes):
+    f = _CountingFile(data)
+    return UploadFile(file=f, filename="a.wav"), f
+
+
+def test_wav_upload_lands_in_pooled_buffer():
+    async def run():
+        pool = UploadBufferPool(count=1, size=1024 * 1024)
+        data = WAV_HEAD + bytes(200_000)
+        digest = hashlib.blake2b(digest_size=16)
+        upload = await read_wav_upload(_upload(data)[0], pool, digest)
+        assert upload.view == data
+        # Hashed in the same pass as the copy
+        assert digest.hexdigest() == hashlib.blake2b(data, digest_size=16).hexdigest()
+        return pool, upload
+
+    pool, upload = asyncio.run(run())
+    assert pool.stats()["in_use"] == 1
+    upload.release()
+    assert pool.stats()["in_use"] == 0
+
+
+def test_non_wav_rejected_after_first_chunk():
+    async def run():
+        pool = UploadBufferPool(count=1, size=1024 * 1024)
+        upload, f = _upload(b"ID3\x03" + bytes(500_000))
+        with pytest.raises(HTTPException) as exc:
+            await read_wav_upload(upload, pool)
+        return pool, f, exc.value
+
+    pool, f, exc = asyncio.run(run())
+    assert exc.status_code == 415
+    assert f.bytes_read == 64 * 1024
+    assert pool.stats()["in_use"] == 0
+
+
+def test_oversized_upload_aborts_at_limit():
+    async def run():
+        pool = UploadBufferPool(count=1, size=256 * 1024)
+        upload, f = _upload(WAV_HEAD + bytes(10 * 1024 * 1024))
+        with pytest.raises(HTTPException) as exc:
+            await read_wav_upload(upload, pool)
+        return pool, f, exc.value
+
+    pool, f, exc = asyncio.run(run())
+    assert exc.status_code == 413
+    assert f.bytes_read <= 256 * 1024 + 64 * 1024
+    assert pool.stats()["in_use"] == 0
+
+
+def test_pool_is_bounded_and_reuses_buffers():
+    async def run():
+        pool = UploadBufferPool(count=2, size=16)
+        a = await pool.acquire(1)
+        b = await pool.acquire(1)
+        with pytest.raises(asyncio.TimeoutError):
+            await pool.acquire(0.05)
+        waiter = asyncio.create_task(pool.acquire(1))
+        await asyncio.sleep(0)
+        # Released from a worker thread, handed to the waiting request
+        await asyncio.to_thread(pool.release, a)
+        assert await waiter is a
+        return pool, b
+
+    pool, b = asyncio.run(run())
+    stats = pool.stats()
+    assert stats["allocated"] == 2
+    assert stats["wait_timeouts"] == 1
+    assert stats["peak_in_use"] == 2
+
+
+def test_buffer_returns_after_last_reader():
+    pool = UploadBufferPool(count=1, size=16)
+    buf = asyncio.run(pool.acquire(1))
+    upload = PooledUpload(pool, buf, 4)
+    assert upload.retain()
+    upload.release()  # request done, a stage still reading
+    assert pool.stats()["in_use"] == 1
+    upload.release()
+    assert pool.stats()["in_use"] == 0
+    assert not upload.retain()
+
+
+def test_looks_like_wav():
+    assert looks_like_wav(WAV_HEAD)
+    assert not looks_like_wav(b"RIFF\x00\x00\x00\x00AVI LIST")
+    assert not looks_like_wav(b"RIFF")